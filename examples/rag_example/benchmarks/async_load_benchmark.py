@@ -0,0 +1,121 @@
+import argparse
+import asyncio
+import importlib.util
+import os
+import pathlib
+import shutil
+import statistics
+import sys
+import time
+import types
+
+import yaml
+
+from ingest_benchmark import make_workspace, serve, synthetic_page
+
+project_dir = pathlib.Path(__file__).resolve().parent.parent
+src_path = project_dir / "src"
+sys.path.insert(0, str(src_path))  # Ahead of the standard library, which also has a "chunk" module
+
+class Context:
+    """Stand-in for the Motia handler context: a silent logger and a no-op emit."""
+
+    logger = types.SimpleNamespace(info=lambda *args: None, error=lambda *args: None)
+
+    async def emit(self, event):
+        pass
+
+def load_step(name: str):
+    spec = importlib.util.spec_from_file_location(name.replace(".", "_"), project_dir / "steps" / f"{name}.py")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+async def blocking_handler(req, ctx):
+    """The previous Rag API handler: rag_reponse runs on the event loop."""
+    from rag import rag_reponse
+
+    result = rag_reponse(req.body.query)
+    await ctx.emit({'type': 'rag.completed', 'data': {'message': 'rag response provided'}})
+    return {'status': 200, 'body': {'answer': result}}
+
+async def load(handler, concurrency: int, round_id: int):
+    """
+    Sends concurrency requests at once on one event loop and returns each
+    request's latency, from the moment they all arrived to its response.
+    """
+    async def request(i):
+        req = types.SimpleNamespace(body=types.SimpleNamespace(query=f"token{i} section {round_id} {i}"))
+        await handler(req, Context())
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    return await asyncio.gather(*(request(i) for i in range(concurrency)))
+
+def report(label: str, samples) -> None:
+    samples = sorted(samples)
+    p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+    print(f"{label:>10} p50 {statistics.median(samples) * 1000:>8.1f} ms  p99 {p99 * 1000:>8.1f} ms  "
+          f"max {samples[-1] * 1000:>8.1f} ms")
+
+def run(concurrency_levels, rounds: int) -> None:
+    """
+    Runs rounds of concurrent /api/rag requests against the previous handler,
+    which calls rag_reponse on the event loop, and against the current one,
+    which awaits it in the worker pool, and prints the latency percentiles.
+    Every query is distinct, so the query cache never hits.
+    """
+    from rag import startup_event
+
+    startup_event()
+    handlers = {"blocking": blocking_handler, "async": load_step("rag_api.step").handler}
+    round_id = 0
+    with open(os.devnull, "w") as devnull:
+        for concurrency in concurrency_levels:
+            print(f"{concurrency} concurrent requests")
+            for label, handler in handlers.items():
+                samples = []
+                stdout, sys.stdout = sys.stdout, devnull
+                try:
+                    for _ in range(rounds):
+                        round_id += 1
+                        samples.extend(asyncio.run(load(handler, concurrency, round_id)))
+                finally:
+                    sys.stdout = stdout
+                report(label, samples)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Latency of concurrent RAG requests with blocking and async handlers.")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--first-token-latency", type=float, default=0.1, help="Simulated LLM seconds before the first word")
+    parser.add_argument("--token-latency", type=float, default=0.002, help="Simulated LLM seconds between words")
+    parser.add_argument("--paragraphs", type=int, default=200, help="Paragraphs in the indexed synthetic page")
+    args = parser.parse_args()
+
+    page = synthetic_page(args.paragraphs)
+    server = serve(page)
+    url = f"http://127.0.0.1:{server.server_address[1]}/page.html"
+    workspace = make_workspace()
+    config_path = workspace / "rag_config.yml"
+    config = yaml.safe_load(config_path.read_text())
+    config.update({
+        "llm_backend": "fake",
+        "fake_llm_first_token_latency": args.first_token_latency,
+        "fake_llm_token_latency": args.token_latency,
+    })
+    config_path.write_text(yaml.safe_dump(config))
+    try:
+        os.chdir(workspace)  # The src modules and steps resolve rag_config.yml, src/ and temp/ from the working directory
+        from pipeline import ingest_url
+
+        with open(os.devnull, "w") as devnull:
+            stdout, sys.stdout = sys.stdout, devnull
+            try:
+                ingest_url(url)
+            finally:
+                sys.stdout = stdout
+        run(args.concurrency, args.rounds)
+    finally:
+        server.shutdown()
+        shutil.rmtree(workspace, ignore_errors=True)
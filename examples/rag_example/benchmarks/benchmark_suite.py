@@ -0,0 +1,263 @@
+import argparse
+import json
+import os
+import pathlib
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import time
+
+import numpy as np
+import yaml
+
+from ingest_benchmark import make_workspace, serve, synthetic_page
+
+project_dir = pathlib.Path(__file__).resolve().parent.parent
+src_path = project_dir / "src"
+sys.path.insert(0, str(src_path))  # Ahead of the standard library, which also has a "chunk" module
+
+RESULTS_VERSION = 1
+# Metrics whose value should go up; every other metric (seconds, ms, MB) should go down.
+HIGHER_IS_BETTER = ("_per_s",)
+# Changes smaller than these are timer noise, whatever their ratio (tiny stages jitter by 20% easily).
+NOISE_FLOOR = {"seconds": 0.05, "_ms": 1.0}
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process so far, in MB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2 ** 20 if sys.platform == "darwin" else peak / 2 ** 10  # bytes on macOS, KB on Linux
+
+def percentiles(samples) -> dict:
+    samples = np.array(samples) * 1000
+    return {f"p{p}_ms": float(np.percentile(samples, p)) for p in (50, 95, 99)}
+
+class Corpus:
+    """
+    Deterministic synthetic corpus: documents of Zipf-distributed words, so
+    the BM25 postings and the chunk lengths look like a real wiki. The same
+    seed and sizes always give the same text, vectors and queries.
+    """
+
+    def __init__(self, chunks: int, doc_chunks: int, chunk_size: int, overlap: int, vocabulary: int = 50000,
+                 seed: int = 0):
+        self.documents = -(-chunks // doc_chunks)
+        self.doc_chunks = doc_chunks
+        self.total_chunks = chunks
+        self.step = chunk_size - overlap
+        self.overlap = overlap
+        self.seed = seed
+        self.vocabulary = np.array([f"term{i}" for i in range(vocabulary)])
+        weights = 1 / np.arange(1, vocabulary + 1)
+        self.weights = weights / weights.sum()
+
+    def words(self, rng, n: int) -> np.ndarray:
+        return self.vocabulary[rng.choice(len(self.vocabulary), n, p=self.weights)]
+
+    def document(self, doc_id: int) -> str:
+        """Returns the text of a document, sized to give doc_chunks word chunks."""
+        chunks = min(self.doc_chunks, self.total_chunks - doc_id * self.doc_chunks)
+        rng = np.random.default_rng([self.seed, doc_id])
+        words = self.words(rng, chunks * self.step + self.overlap)
+        paragraphs = [" ".join(words[i: i + 120]) for i in range(0, len(words), 120)]
+        return "\n\n".join(paragraphs)
+
+    def queries(self, n: int):
+        rng = np.random.default_rng([self.seed, self.documents])  # Past the last document seed
+        return [" ".join(self.words(rng, 4)) + f" q{i}" for i in range(n)]  # Distinct, so the query cache never hits
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+def run(args, workspace: pathlib.Path) -> dict:
+    """Runs every stage on the synthetic corpus in the workspace and returns the results."""
+    from chunk import chunk_size, chunk_overlap, chunk_with_metadata
+    from chunk_store import write_chunk_store
+    from documents import chunk_id, save_manifest
+    from embed import embed_chunks
+    from bm25 import BM25Index
+    from index import build_index, index_document
+    from index_manager import get_index_manager
+    from parse import fetch_confluence_page
+    from rag import embed_text, lookup_chunk_matrix, rag_reponse, retrieve
+    import faiss
+
+    stages = {}
+    faiss_dir = workspace / "temp" / "faiss_files"
+    documents_dir = workspace / "temp" / "chunks" / "documents"
+
+    # Parse: fetch and extract a local page
+    page = synthetic_page(args.page_paragraphs)
+    server = serve(page)
+    try:
+        url = f"http://127.0.0.1:{server.server_address[1]}/page.html"
+        samples = [timed(fetch_confluence_page, url)[1] for _ in range(args.repeat)]
+    finally:
+        server.shutdown()
+    stages["parse"] = {"seconds": float(np.median(samples)), "mb_per_s": len(page) / 2 ** 20 / float(np.median(samples)),
+                       "peak_rss_mb": peak_rss_mb()}
+
+    # Chunk and embed every document, as the ingestion does
+    corpus = Corpus(args.chunks, args.doc_chunks, chunk_size, chunk_overlap, seed=args.seed)
+    texts, metadata, vectors = [], [], []
+    chunk_seconds = embed_seconds = 0.0
+    for doc_id in range(corpus.documents):
+        text = corpus.document(doc_id)
+        chunks, seconds = timed(chunk_with_metadata, text, f"https://wiki.example/doc{doc_id}")
+        chunk_seconds += seconds
+        chunk_texts = [chunk.text for chunk in chunks]
+        embeddings, seconds = timed(embed_chunks, chunk_texts)
+        embed_seconds += seconds
+        texts.append(chunk_texts)
+        metadata.append([chunk.metadata() for chunk in chunks])
+        vectors.append(embeddings)
+    n = sum(len(doc) for doc in texts)
+    stages["chunk"] = {"seconds": chunk_seconds, "chunks_per_s": n / chunk_seconds, "peak_rss_mb": peak_rss_mb()}
+    stages["embed"] = {"seconds": embed_seconds, "chunks_per_s": n / embed_seconds, "peak_rss_mb": peak_rss_mb()}
+
+    # Index: bulk build of the vector index, the BM25 index and the chunk stores, in index.py's layout
+    ids = np.concatenate([[chunk_id(doc_id, i) for i in range(len(doc))] for doc_id, doc in enumerate(texts)])
+    start = time.perf_counter()
+    index, vector_seconds = timed(build_index, np.vstack(vectors), ids=ids)
+    bm25, bm25_seconds = timed(BM25Index.build, ids.tolist(), (text for doc in texts for text in doc))
+    manifest = {"next_doc_id": len(texts), "documents": {}}
+    for doc_id, (doc, meta) in enumerate(zip(texts, metadata)):
+        write_chunk_store(doc, documents_dir / f"{doc_id}-1.bin")
+        with open(documents_dir / f"{doc_id}-1.meta.json", "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        manifest["documents"][f"https://wiki.example/doc{doc_id}"] = {
+            "doc_id": doc_id, "version": 1, "chunks": len(doc), "chunk_file": f"{doc_id}-1.bin",
+            "metadata_file": f"{doc_id}-1.meta.json",
+        }
+    faiss_dir.mkdir(parents=True, exist_ok=True)
+    faiss.write_index(index, str(faiss_dir / "vector_index.bin"))
+    bm25.save(faiss_dir / "bm25")
+    save_manifest(manifest, faiss_dir / "documents.json")
+    stages["index_build"] = {
+        "seconds": time.perf_counter() - start, "vector_seconds": vector_seconds, "bm25_seconds": bm25_seconds,
+        "chunks_per_s": n / (time.perf_counter() - start), "peak_rss_mb": peak_rss_mb(),
+    }
+    del index, bm25, vectors
+
+    # Incremental update: re-index one existing document into the full corpus
+    samples = []
+    for i in range(args.updates):
+        doc_id = i % len(texts)
+        embeddings = embed_chunks(texts[doc_id])
+        samples.append(timed(index_document, f"https://wiki.example/doc{doc_id}", texts[doc_id], embeddings,
+                             metadata[doc_id])[1])
+    stages["index_update"] = {"seconds": float(np.median(samples)), "peak_rss_mb": peak_rss_mb()}
+    del texts, metadata
+
+    # Load the resident index the RAG API serves from
+    manager = get_index_manager()
+    _, seconds = timed(manager.reload)
+    stages["load"] = {"seconds": seconds, "peak_rss_mb": peak_rss_mb()}
+
+    # Queries: retrieval with the chunk texts, as /api/rag does it, and the whole RAG flow with the fake LLM
+    chunks, index, bm25 = manager.get_hybrid()
+    queries = corpus.queries(args.queries)
+    query_vectors = embed_text(queries)
+
+    def retrieve_chunks(query_vector, query):
+        return lookup_chunk_matrix(retrieve(index, bm25, query_vector.reshape(1, -1), [query], args.k), chunks)[0]
+    retrieval = [timed(retrieve_chunks, vector, query)[1] for vector, query in zip(query_vectors, queries)]
+    stages["retrieval"] = {**percentiles(retrieval), "queries_per_s": len(retrieval) / sum(retrieval),
+                           "peak_rss_mb": peak_rss_mb()}
+    answers = [timed(rag_reponse, query)[1] for query in queries]
+    stages["rag"] = {**percentiles(answers), "queries_per_s": len(answers) / sum(answers), "peak_rss_mb": peak_rss_mb()}
+    return stages
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=project_dir, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def compare(results: dict, baseline: dict, max_regression: float) -> list:
+    """
+    Returns the metrics of results that are worse than in the baseline by more
+    than max_regression (0.2 = 20%). Peak RSS is compared too. Time changes
+    below NOISE_FLOOR are ignored.
+    """
+    if results["params"] != baseline["params"]:
+        print(f"Warning: the baseline was run with other parameters: {baseline['params']}")
+    regressions = []
+    for stage, metrics in results["stages"].items():
+        for metric, value in metrics.items():
+            old = baseline["stages"].get(stage, {}).get(metric)
+            if not old:
+                continue
+            if any(metric.endswith(suffix) and abs(value - old) < floor for suffix, floor in NOISE_FLOOR.items()):
+                continue
+            change = value / old - 1
+            if metric.endswith(HIGHER_IS_BETTER):
+                change = -change
+            if change > max_regression:
+                regressions.append(f"{stage}.{metric}: {old:.4g} -> {value:.4g} ({change:+.0%} worse)")
+    return regressions
+
+def report(results: dict) -> None:
+    for stage, metrics in results["stages"].items():
+        print(f"{stage:>13}  " + "  ".join(f"{metric} {value:.4g}" for metric, value in metrics.items()))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline benchmark suite of the whole RAG flow on a synthetic corpus.")
+    parser.add_argument("--chunks", type=int, default=10000, help="Chunks in the synthetic corpus (10k to 1M)")
+    parser.add_argument("--doc-chunks", type=int, default=1000, help="Chunks per synthetic document")
+    parser.add_argument("--dim", type=int, default=768, help="Dimension of the fake embeddings")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=5)
+    parser.add_argument("--updates", type=int, default=3, help="Incremental re-indexings of one document")
+    parser.add_argument("--page-paragraphs", type=int, default=2000, help="Paragraphs of the parsed page")
+    parser.add_argument("--repeat", type=int, default=5, help="Repetitions of the parse stage")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    parser.add_argument("--baseline", help="Results JSON of an earlier run to compare with")
+    parser.add_argument("--max-regression", type=float, default=0.2,
+                        help="With --baseline, fail when a metric is worse by more than this fraction")
+    args = parser.parse_args()
+
+    workspace = make_workspace()
+    config_path = workspace / "rag_config.yml"
+    config = yaml.safe_load(config_path.read_text())
+    config.update({"llm_backend": "fake", "fake_llm_tokens": 64, "fake_llm_first_token_latency": 0.0,
+                   "fake_llm_token_latency": 0.0})
+    config_path.write_text(yaml.safe_dump(config))
+    try:
+        os.chdir(workspace)  # The src modules resolve rag_config.yml and temp/ from the working directory
+        from providers import get_provider
+
+        get_provider("mock", dim=args.dim)
+        with open(os.devnull, "w") as devnull:
+            stdout, sys.stdout = sys.stdout, devnull
+            try:
+                stages = run(args, workspace)
+            finally:
+                sys.stdout = stdout
+    finally:
+        shutil.rmtree(workspace, ignore_errors=True)
+
+    params = {key: value for key, value in vars(args).items() if key not in ("output", "baseline", "max_regression")}
+    results = {
+        "version": RESULTS_VERSION,
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "params": params,
+        "stages": stages,
+    }
+    report(results)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.max_regression)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        sys.exit(1 if regressions else 0)
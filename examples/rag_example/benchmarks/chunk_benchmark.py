@@ -0,0 +1,71 @@
+import argparse
+import pathlib
+import random
+import sys
+import time
+
+src_path = pathlib.Path(__file__).resolve().parent.parent / "src"
+sys.path.insert(0, str(src_path))  # Ahead of the standard library, which also has a "chunk" module
+
+from chunk import chunk_text
+from chunker import chunk_document
+
+WORDS = ("confluence install server database user space page admin linux service "
+         "configure backup upgrade license plugin, node. cluster: proxy (port) memory").split()
+
+def synthetic_text(megabytes: float, seed: int = 1234) -> str:
+    """
+    Returns structured text of about the given size: "#" headings followed by
+    paragraphs of 20 to 120 random words, separated by blank lines.
+    """
+    rng = random.Random(seed)
+    blocks = []
+    size = 0
+    while size < megabytes * 1e6:
+        if rng.random() < 0.1:
+            block = "#" * rng.randint(1, 3) + " " + " ".join(rng.choices(WORDS, k=rng.randint(2, 6)))
+        else:
+            block = " ".join(rng.choices(WORDS, k=rng.randint(20, 120)))
+        blocks.append(block)
+        size += len(block) + 2
+    return "\n\n".join(blocks)
+
+def timed(fn, repeat: int):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return result, best
+
+def run(megabytes: float, chunk_size: int, overlap: int, repeat: int) -> None:
+    """
+    Chunks a synthetic multi-MB text with chunk_text and with each mode of
+    the chunking engine, and prints the throughput.
+    """
+    text = synthetic_text(megabytes)
+    size = len(text.encode("utf-8"))
+    flat = " ".join(text.split())  # What the extractors hand to the word chunker
+
+    baseline, baseline_time = timed(lambda: chunk_text(flat, chunk_size, overlap), repeat)
+    rows = [("chunk_text", len(baseline), baseline_time)]
+    for mode, source in (("word", flat), ("token", flat), ("structure", text)):
+        chunks, seconds = timed(lambda: chunk_document(source, mode, chunk_size, overlap), repeat)
+        rows.append((mode, len(chunks), seconds))
+        if mode == "word" and [chunk.text for chunk in chunks] != baseline:
+            print("warning: word mode chunks differ from chunk_text")
+
+    print(f"text: {size / 1e6:.2f} MB, chunk_size {chunk_size}, overlap {overlap}")
+    print(f"{'chunker':>12} {'chunks':>8} {'seconds':>8} {'MB/s':>8} {'speedup':>8}")
+    for name, count, seconds in rows:
+        print(f"{name:>12} {count:>8} {seconds:>8.3f} {size / 1e6 / seconds:>8.1f} {baseline_time / seconds:>7.2f}x")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare chunk_text with the chunking engine on a multi-MB text.")
+    parser.add_argument("--megabytes", type=float, default=8)
+    parser.add_argument("--chunk-size", type=int, default=256)
+    parser.add_argument("--overlap", type=int, default=32)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    run(args.megabytes, args.chunk_size, args.overlap, args.repeat)
@@ -0,0 +1,107 @@
+import argparse
+import json
+import pathlib
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+src_path = pathlib.Path(__file__).resolve().parent.parent / "src"
+sys.path.insert(0, str(src_path))  # Ahead of the standard library, which also has a "chunk" module
+
+from chunk_store import ChunkStore, write_chunk_store
+
+WORDS = ("confluence install server database user space page admin linux service "
+         "configure backup upgrade license plugin node cluster proxy port memory").split()
+
+def synthetic_chunks(count: int, words: int, seed: int = 1234):
+    """Yields count chunks of about the given number of random words."""
+    rng = random.Random(seed)
+    for _ in range(count):
+        yield " ".join(rng.choices(WORDS, k=rng.randint(words // 2, words)))
+
+def max_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # kB on Linux
+
+def load(kind: str, filepath: str, lookups: int) -> None:
+    """
+    Runs in a fresh interpreter: opens one file, reads random chunks, then
+    scans every chunk, and prints the timings and RSS growth as JSON.
+    """
+    rss_before = max_rss_mb()
+    start = time.perf_counter()
+    if kind == "json":
+        with open(filepath, "r", encoding="utf-8") as f:
+            chunks = json.load(f)
+    else:
+        chunks = ChunkStore(filepath)
+    open_seconds = time.perf_counter() - start
+
+    ids = random.Random(0).choices(range(len(chunks)), k=lookups)
+    start = time.perf_counter()
+    for chunk_id in ids:
+        chunks[chunk_id]
+    lookup_seconds = time.perf_counter() - start
+    rss_after = max_rss_mb()
+
+    start = time.perf_counter()
+    for _ in chunks:
+        pass
+    scan_seconds = time.perf_counter() - start
+    print(json.dumps({
+        "open_seconds": open_seconds,
+        "lookup_us": lookup_seconds / lookups * 1e6,
+        "scan_seconds": scan_seconds,
+        "rss_mb": rss_after - rss_before,
+    }))
+
+def measure(kind: str, filepath: pathlib.Path, lookups: int) -> dict:
+    output = subprocess.run([sys.executable, __file__, "--load", kind, str(filepath), "--lookups", str(lookups)],
+                            check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def run(counts, words: int, lookups: int) -> None:
+    """
+    Writes the same synthetic chunks as pretty-printed JSON (the former
+    output.json) and as chunk stores, and compares their size, load time,
+    random lookup latency, full scan time and RSS growth after the lookups.
+    """
+    workdir = pathlib.Path(tempfile.mkdtemp())
+    print(f"{'chunks':>7} {'format':>10} {'file MB':>8} {'open ms':>9} {'lookup us':>10} {'scan s':>7} {'RSS MB':>7}")
+    try:
+        for count in counts:
+            files = {
+                "json": workdir / f"{count}.json",
+                "store": workdir / f"{count}.bin",
+                "store+zstd": workdir / f"{count}.zst.bin",
+            }
+            with open(files["json"], "w", encoding="utf-8") as f:
+                json.dump(list(synthetic_chunks(count, words)), f, indent=4)
+            write_chunk_store(synthetic_chunks(count, words), files["store"])
+            write_chunk_store(synthetic_chunks(count, words), files["store+zstd"], "zstd")
+            store = ChunkStore(files["store+zstd"])
+            if store.compression != "zstd":
+                del files["store+zstd"]  # zstandard is not installed
+            store.close()
+            for name, filepath in files.items():
+                result = measure("json" if name == "json" else "store", filepath, lookups)
+                print(f"{count:>7} {name:>10} {filepath.stat().st_size / 1e6:>8.1f} {result['open_seconds'] * 1000:>9.1f} "
+                      f"{result['lookup_us']:>10.1f} {result['scan_seconds']:>7.2f} {result['rss_mb']:>7.1f}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the JSON chunk list with the binary chunk store.")
+    parser.add_argument("--chunks", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--words", type=int, default=256, help="Maximum words per chunk")
+    parser.add_argument("--lookups", type=int, default=1000, help="Random chunk reads per measurement")
+    parser.add_argument("--load", nargs=2, metavar=("KIND", "FILE"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.load:
+        load(args.load[0], args.load[1], args.lookups)
+    else:
+        run(args.chunks, args.words, args.lookups)
@@ -0,0 +1,119 @@
+import argparse
+import asyncio
+import importlib.util
+import os
+import pathlib
+import shutil
+import sys
+import time
+import types
+import uuid
+
+from ingest_benchmark import make_workspace, serve, synthetic_page
+
+project_dir = pathlib.Path(__file__).resolve().parent.parent
+src_path = project_dir / "src"
+sys.path.insert(0, str(src_path))  # Ahead of the standard library, which also has a "chunk" module
+
+STEPS = ("parse.step", "chunk.step", "embed.step", "index.step")
+
+def load_step(name: str):
+    spec = importlib.util.spec_from_file_location(name.replace(".", "_"), project_dir / "steps" / f"{name}.py")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+class Flow:
+    """
+    Stand-in for the Motia event bus: every emitted event runs the handlers
+    of the steps subscribed to it, as a task on the loop, with the emitter's
+    trace id. wait() returns once no handler is left running.
+    """
+
+    def __init__(self, steps):
+        self.steps = steps
+        self.tasks = set()
+        self.indexed = []
+
+    def context(self, trace_id: str):
+        flow = self
+
+        class Context:
+            logger = types.SimpleNamespace(info=lambda *args: None, error=lambda *args: None)
+
+            async def emit(self, event):
+                if event["type"] == "index.complete":
+                    flow.indexed.append(event["data"]["run_id"])
+                for step in flow.steps:
+                    if event["type"] in step.config.get("subscribes", []):
+                        data = types.SimpleNamespace(**event["data"])
+                        task = asyncio.ensure_future(step.handler(data, flow.context(trace_id)))
+                        flow.tasks.add(task)
+                        task.add_done_callback(flow.tasks.discard)
+
+        context = Context()
+        context.trace_id = trace_id
+        return context
+
+    async def wait(self):
+        while self.tasks:
+            await asyncio.gather(*list(self.tasks))
+
+async def ingest(parse_step, flow: Flow, urls, concurrent: bool) -> float:
+    """Posts every url to /api/parse, all at once or one flow after the other, and returns the seconds taken."""
+    async def post(url):
+        await parse_step.handler(types.SimpleNamespace(body=types.SimpleNamespace(url=url)), flow.context(uuid.uuid4().hex))
+
+    start = time.perf_counter()
+    if concurrent:
+        await asyncio.gather(*(post(url) for url in urls))
+        await flow.wait()
+    else:
+        for url in urls:
+            await post(url)
+            await flow.wait()
+    return time.perf_counter() - start
+
+def run(base_url: str, pages: int) -> None:
+    """
+    Ingests the same number of distinct pages through the parse, chunk,
+    embed and index step handlers, serialized and concurrently, and checks
+    that every page was indexed exactly once and no run workspace is left.
+    """
+    from documents import load_manifest
+
+    steps = [load_step(name) for name in STEPS]
+    for label, concurrent in (("serialized", False), ("concurrent", True)):
+        flow = Flow(steps)
+        urls = [f"{base_url}/{label}-{i}.html" for i in range(pages)]
+        with open(os.devnull, "w") as devnull:
+            stdout, sys.stdout = sys.stdout, devnull
+            try:
+                seconds = asyncio.run(ingest(steps[0], flow, urls, concurrent))
+            finally:
+                sys.stdout = stdout
+        manifest = load_manifest(pathlib.Path("temp") / "faiss_files" / "documents.json")
+        missing = [url for url in urls if url not in manifest["documents"]]
+        leftover = list((pathlib.Path("temp") / "runs").glob("*"))
+        print(f"{label:>10} {pages} pages in {seconds:>6.2f}s ({pages / seconds:>6.1f} pages/s)  "
+              f"index.complete {len(flow.indexed)}  missing {len(missing)}  leftover runs {len(leftover)}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Throughput of serialized and concurrent ingestion runs through the step handlers.")
+    parser.add_argument("--pages", type=int, default=16)
+    parser.add_argument("--paragraphs", type=int, default=50, help="Paragraphs in each synthetic page")
+    parser.add_argument("--embed-latency", type=float, default=0.05, help="Simulated seconds per embedding request")
+    args = parser.parse_args()
+
+    server = serve(synthetic_page(args.paragraphs))
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    workspace = make_workspace()
+    try:
+        os.chdir(workspace)  # The src modules and steps resolve rag_config.yml, src/ and temp/ from the working directory
+        from providers import get_provider
+
+        get_provider("mock", embed_latency=args.embed_latency)
+        run(base_url, args.pages)
+    finally:
+        server.shutdown()
+        shutil.rmtree(workspace, ignore_errors=True)
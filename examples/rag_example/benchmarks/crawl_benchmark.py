@@ -0,0 +1,97 @@
+import argparse
+import gzip
+import hashlib
+import http.server
+import os
+import pathlib
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+src_path = pathlib.Path(__file__).resolve().parent.parent / "src"
+sys.path.insert(0, str(src_path))  # Ahead of the standard library, which also has a "chunk" module
+
+from ingest_benchmark import make_workspace, synthetic_page
+
+def serve_site(pages: int, paragraphs: int, latency: float) -> http.server.HTTPServer:
+    """
+    Serves a local stand-in for a Confluence space: /sitemap.xml and /page/<n>.
+    Pages carry an ETag, answer conditional GETs with 304 and are gzipped
+    when the client accepts it. Every response waits `latency` seconds.
+    """
+    page = synthetic_page(paragraphs)
+    compressed = gzip.compress(page)
+    etag = '"' + hashlib.sha1(page).hexdigest() + '"'
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            time.sleep(latency)
+            if self.path == "/sitemap.xml":
+                host = f"http://{self.headers['Host']}"
+                urls = "".join(f"<url><loc>{host}/page/{i}</loc></url>" for i in range(pages))
+                body = f'<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">{urls}</urlset>'.encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/xml")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                return
+            if self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            use_gzip = "gzip" in self.headers.get("Accept-Encoding", "")
+            body = compressed if use_gzip else page
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("ETag", etag)
+            if use_gzip:
+                self.send_header("Content-Encoding", "gzip")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure crawler throughput against a local stand-in site.")
+    parser.add_argument("--pages", type=int, default=100)
+    parser.add_argument("--paragraphs", type=int, default=50, help="Paragraphs per page")
+    parser.add_argument("--latency", type=float, default=0.05, help="Simulated server latency per request")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    args = parser.parse_args()
+
+    server = serve_site(args.pages, args.paragraphs, args.latency)
+    sitemap = f"http://127.0.0.1:{server.server_address[1]}/sitemap.xml"
+    workspace = make_workspace()
+    os.chdir(workspace)  # The src modules resolve rag_config.yml from the working directory
+
+    from crawler import CrawlStats, ValidatorStore, expand_sitemap, iter_crawl
+
+    urls = expand_sitemap(sitemap)
+    print(f"{len(urls)} pages, {args.latency * 1000:.0f} ms server latency")
+    print(f"{'conc':>5} {'crawl':>6} {'pages':>6} {'304s':>6} {'MB':>7} {'seconds':>8} {'pages/s':>8}")
+    for concurrency in args.concurrency:
+        validators = ValidatorStore(pathlib.Path(tempfile.mkdtemp()) / "validators.json")
+        for label in ("cold", "warm"):
+            stats = CrawlStats()
+            for page in iter_crawl(urls, validators, stats, concurrency=concurrency, per_host=concurrency):
+                if not page.error and not page.not_modified:
+                    validators.update(page.url, page.etag, page.last_modified)
+            report = stats.as_dict()
+            print(f"{concurrency:>5} {label:>6} {report['pages']:>6} {report['not_modified']:>6} "
+                  f"{report['bytes'] / 1e6:>7.2f} {report['seconds']:>8.2f} {report['pages_per_second']:>8.1f}")
+    server.shutdown()
+    shutil.rmtree(workspace, ignore_errors=True)
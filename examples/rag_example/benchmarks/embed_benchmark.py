@@ -0,0 +1,41 @@
+import argparse
+import pathlib
+import sys
+import time
+
+src_path = pathlib.Path(__file__).resolve().parent.parent / "src"
+sys.path.append(str(src_path))
+
+from embed_engine import EmbeddingEngine, FakeEmbeddingBackend
+
+def synthetic_chunks(n: int, words: int = 256):
+    """Returns n distinct synthetic chunks of the given word count."""
+    return [" ".join(f"word{(i * 31 + j) % 5000}" for j in range(words)) + f" #{i}" for i in range(n)]
+
+def run(num_chunks: int, latency: float, batch_sizes, concurrencies, qps: float) -> None:
+    """
+    Embeds a synthetic corpus with the fake backend for every batch size and
+    concurrency combination and prints the throughput of each.
+    """
+    chunks = synthetic_chunks(num_chunks)
+    print(f"{'batch':>6} {'conc':>5} {'seconds':>9} {'chunks/s':>10}")
+    for batch_size in batch_sizes:
+        for concurrency in concurrencies:
+            backend = FakeEmbeddingBackend(latency=latency)
+            engine = EmbeddingEngine(backend, batch_size=batch_size, concurrency=concurrency, qps=qps)
+            start = time.perf_counter()
+            embeddings = engine.embed(chunks)
+            elapsed = time.perf_counter() - start
+            assert embeddings.shape[0] == len(chunks)
+            print(f"{batch_size:>6} {concurrency:>5} {elapsed:>9.3f} {len(chunks) / elapsed:>10.1f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the embedding engine offline with the fake backend.")
+    parser.add_argument("--chunks", type=int, default=2000, help="Number of synthetic chunks")
+    parser.add_argument("--latency", type=float, default=0.05, help="Simulated seconds per request")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 20, 100])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--qps", type=float, default=0, help="Rate limit, 0 for none")
+    args = parser.parse_args()
+
+    run(args.chunks, args.latency, args.batch_sizes, args.concurrency, args.qps)
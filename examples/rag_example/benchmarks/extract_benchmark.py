@@ -0,0 +1,52 @@
+import argparse
+import pathlib
+import sys
+import time
+
+src_path = pathlib.Path(__file__).resolve().parent.parent / "src"
+sys.path.insert(0, str(src_path))  # Ahead of the standard library, which also has a "chunk" module
+
+from extract import EXTRACTORS, _available
+
+fixtures_dir = pathlib.Path(__file__).resolve().parent / "fixtures"
+
+def run(fixtures, scale: int, repeat: int) -> None:
+    """
+    Runs every installed extractor over each HTML fixture and prints the
+    throughput and the size of the extracted text.
+
+    Args:
+        fixtures: The HTML files to extract.
+        scale (int): How many copies of the page content to concatenate, to get multi-MB pages. The
+            part between <!-- content:start --> and <!-- content:end --> is repeated, or the whole body.
+        repeat (int): Extractions per measurement; the best time is kept.
+    """
+    print(f"{'fixture':>24} {'backend':>11} {'html MB':>8} {'MB/s':>8} {'text KB':>8}")
+    for fixture in fixtures:
+        html = fixture.read_text(encoding="utf-8")
+        if scale > 1:
+            start, end = ("<!-- content:start -->", "<!-- content:end -->") if "<!-- content:start -->" in html \
+                else ("<body>", "</body>")
+            head, _, rest = html.partition(start)
+            content, _, tail = rest.rpartition(end)
+            html = head + start + content * scale + end + tail
+        size = len(html.encode("utf-8"))
+        for name, extract in EXTRACTORS.items():
+            if not _available(name):
+                print(f"{fixture.name:>24} {name:>11} {'not installed':>26}")
+                continue
+            best = float("inf")
+            for _ in range(repeat):
+                start = time.perf_counter()
+                text = extract(html)
+                best = min(best, time.perf_counter() - start)
+            print(f"{fixture.name:>24} {name:>11} {size / 1e6:>8.2f} {size / 1e6 / best:>8.1f} {len(text) / 1e3:>8.1f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the HTML-to-text extractors on saved HTML fixtures.")
+    parser.add_argument("fixtures", nargs="*", type=pathlib.Path, help="HTML files, defaults to benchmarks/fixtures/*.html")
+    parser.add_argument("--scale", type=int, default=1, help="Repeat each page's content this many times")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    run(args.fixtures or sorted(fixtures_dir.glob("*.html")), args.scale, args.repeat)
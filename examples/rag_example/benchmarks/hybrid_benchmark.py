@@ -0,0 +1,120 @@
+import argparse
+import json
+import pathlib
+import random
+import sys
+import time
+import zlib
+
+import faiss
+import numpy as np
+
+src_path = pathlib.Path(__file__).resolve().parent.parent / "src"
+sys.path.insert(0, str(src_path))  # Ahead of the standard library, which also has a "chunk" module
+
+from bm25 import BM25Index, reciprocal_rank_fusion, tokenize
+
+fixtures_dir = pathlib.Path(__file__).resolve().parent / "fixtures"
+
+def trigram_embeddings(texts, dim: int = 768) -> np.ndarray:
+    """
+    Offline stand-in for a semantic embedding model: hashed character
+    trigrams of the words, L2-normalized. Similar wording gives similar
+    vectors, but rare exact terms are diluted like in a dense embedding.
+    """
+    vectors = np.zeros((len(texts), dim), dtype=np.float32)
+    for row, text in enumerate(texts):
+        for word in tokenize(text):
+            padded = f" {word} "
+            for i in range(len(padded) - 2):
+                vectors[row, zlib.crc32(padded[i:i + 3].encode("utf-8")) % dim] += 1
+    vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    return vectors
+
+def model_embeddings(texts, model: str) -> np.ndarray:
+    from embed_engine import EmbeddingEngine, get_embedding_backend
+
+    return EmbeddingEngine(get_embedding_backend("gemini", model)).embed(texts)
+
+def quality(fixture: pathlib.Path, embedder: str, model: str, ks, candidates: int, weights) -> None:
+    """
+    Prints precision@k and recall@k of vector, BM25 and fused retrieval on a
+    fixture query set with labelled relevant chunks.
+    """
+    data = json.loads(fixture.read_text(encoding="utf-8"))
+    chunks = data["chunks"]
+    queries = [q["query"] for q in data["queries"]]
+    relevant = [set(q["relevant"]) for q in data["queries"]]
+    embed = trigram_embeddings if embedder == "trigram" else lambda texts: model_embeddings(texts, model)
+
+    index = faiss.IndexFlatL2(len(embed(chunks[:1])[0]))
+    index.add(embed(chunks))
+    _, vector_ids = index.search(embed(queries), candidates)
+    bm25 = BM25Index.build(range(len(chunks)), chunks)
+    lexical_ids = [bm25.search(query, candidates)[0] for query in queries]
+
+    rankings = {"vector": [list(ids) for ids in vector_ids], "bm25": [list(ids) for ids in lexical_ids]}
+    for weight in weights:
+        rankings[f"fused w={weight}"] = [
+            reciprocal_rank_fusion(v, l, candidates, weight) for v, l in zip(vector_ids, lexical_ids)
+        ]
+
+    print(f"{len(queries)} queries over {len(chunks)} chunks, {embedder} embeddings")
+    print(f"{'retrieval':>14} " + " ".join(f"{f'P@{k}':>6} {f'R@{k}':>6}" for k in ks))
+    for name, ranking in rankings.items():
+        cells = []
+        for k in ks:
+            hits = [len(set(ids[:k]) & rel) for ids, rel in zip(ranking, relevant)]
+            precision = np.mean([h / k for h in hits])
+            recall = np.mean([h / len(rel) for h, rel in zip(hits, relevant)])
+            cells.append(f"{precision:>6.2f} {recall:>6.2f}")
+        print(f"{name:>14} " + " ".join(cells))
+
+def latency(num_chunks: int, words: int, num_queries: int, k: int, max_postings: int, seed: int = 1234) -> None:
+    """
+    Builds a BM25 index over synthetic chunks with a Zipf-like vocabulary
+    and prints its build time, size and per-query search latency, with the
+    per-term postings cap and with exact scoring.
+    """
+    rng = np.random.default_rng(seed)
+    vocab = np.array([f"term{i}" for i in range(50000)])
+    weights = 1.0 / np.arange(1, len(vocab) + 1)
+    weights /= weights.sum()
+    words = rng.choice(len(vocab), (num_chunks, words), p=weights)
+    chunks = (" ".join(vocab[row]) for row in words)
+
+    start = time.perf_counter()
+    bm25 = BM25Index.build(range(num_chunks), chunks)
+    build_seconds = time.perf_counter() - start
+
+    query_words = rng.choice(len(vocab), (num_queries, 5), p=weights)
+    queries = [" ".join(vocab[row[:random.Random(i).randint(2, 5)]]) for i, row in enumerate(query_words)]
+    print(f"{num_chunks} chunks, {len(bm25.segments[0].vocab)} terms, {bm25.stats()['postings']} postings, built in {build_seconds:.1f}s")
+    for max_postings in (max_postings, 0):
+        times = []
+        for query in queries:
+            start = time.perf_counter()
+            bm25.search(query, k, max_postings)
+            times.append(time.perf_counter() - start)
+        times = np.array(times) * 1e6
+        label = f"max_postings={max_postings}" if max_postings else "exact"
+        print(f"BM25 search top-{k} {label:>18}: p50 {np.percentile(times, 50):.0f} us, "
+              f"p99 {np.percentile(times, 99):.0f} us, mean {times.mean():.0f} us")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Hybrid retrieval quality on a fixture query set and BM25 latency.")
+    parser.add_argument("--fixture", type=pathlib.Path, default=fixtures_dir / "hybrid_queries.json")
+    parser.add_argument("--embedder", choices=["trigram", "gemini"], default="trigram",
+                        help="trigram is an offline stand-in; gemini uses the embedding model (needs GOOGLE_DEV_API)")
+    parser.add_argument("--model", default="models/embedding-001")
+    parser.add_argument("--candidates", type=int, default=20)
+    parser.add_argument("--weights", type=float, nargs="+", default=[0.3, 0.5, 0.7])
+    parser.add_argument("--chunks", type=int, default=100000, help="Synthetic chunks for the latency test")
+    parser.add_argument("--words", type=int, default=150)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--max-postings", type=int, default=2000)
+    args = parser.parse_args()
+
+    quality(args.fixture, args.embedder, args.model, (1, 3, 5), args.candidates, args.weights)
+    print()
+    latency(args.chunks, args.words, args.queries, 5, args.max_postings)
@@ -0,0 +1,94 @@
+import argparse
+import json
+import pathlib
+import shutil
+import statistics
+import subprocess
+import sys
+
+from ingest_benchmark import make_workspace
+
+project_dir = pathlib.Path(__file__).resolve().parent.parent
+src_path = project_dir / "src"
+
+MODULES = ("parse", "chunk", "embed", "index", "rag", "pipeline")
+# Imported only by the functions that need them: no stage or step may load them at import.
+LAZY_MODULES = ("faiss", "google.generativeai", "bs4", "lxml", "selectolax", "requests")
+
+PROBE = """
+import importlib.util, json, sys, time
+sys.path.insert(0, {src!r})
+start = time.perf_counter()
+if {step!r}:
+    spec = importlib.util.spec_from_file_location("step", {step!r})
+    spec.loader.exec_module(importlib.util.module_from_spec(spec))
+else:
+    __import__({module!r})
+elapsed = time.perf_counter() - start
+print(json.dumps({{"ms": elapsed * 1000, "loaded": [name for name in {lazy!r} if name in sys.modules]}}))
+"""
+
+def heaviest_imports(importtime: str, top: int):
+    """Returns the (package, ms) of the packages with the largest total self time in a -X importtime report."""
+    packages = {}
+    for line in importtime.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, _, name = line[len("import time:"):].split("|")
+        package = name.strip().split(".")[0]
+        packages[package] = packages.get(package, 0) + int(self_us) / 1000
+    return sorted(packages.items(), key=lambda item: -item[1])[:top]
+
+def measure(label: str, workspace: pathlib.Path, repeat: int, module: str = "", step: str = ""):
+    """Imports a module or loads a step file in fresh interpreters and returns its median import time."""
+    samples = []
+    for _ in range(repeat):
+        probe = PROBE.format(src=str(src_path), step=step, module=module, lazy=LAZY_MODULES)
+        result = subprocess.run([sys.executable, "-X", "importtime", "-c", probe], cwd=workspace,
+                                capture_output=True, text=True, check=True)
+        report = json.loads(result.stdout.strip().splitlines()[-1])
+        samples.append(report["ms"])
+    return {
+        "target": label,
+        "median_ms": statistics.median(samples),
+        "loaded": report["loaded"],
+        "heaviest": heaviest_imports(result.stderr, 3),
+    }
+
+def run(repeat: int, max_ms: float, output: str) -> int:
+    """
+    Measures the import time of every pipeline stage module and of every step
+    file, loaded the way the step loader does. Returns 1 when a target loads a
+    lazy module or, with max_ms, takes longer than max_ms to import.
+    """
+    workspace = make_workspace()
+    try:
+        targets = [(f"src/{name}.py", {"module": name}) for name in MODULES]
+        targets += [(f"steps/{path.name}", {"step": str(path)}) for path in sorted((project_dir / "steps").glob("*.step.py"))]
+        results = [measure(label, workspace, repeat, **target) for label, target in targets]
+    finally:
+        shutil.rmtree(workspace, ignore_errors=True)
+
+    failures = []
+    for result in results:
+        heaviest = ", ".join(f"{name} {ms:.0f}" for name, ms in result["heaviest"])
+        print(f"{result['target']:>34} {result['median_ms']:>7.1f} ms  heaviest: {heaviest}")
+        if result["loaded"]:
+            failures.append(f"{result['target']} loads {', '.join(result['loaded'])} at import")
+        if max_ms and result["median_ms"] > max_ms:
+            failures.append(f"{result['target']} takes {result['median_ms']:.1f} ms to import (limit {max_ms:.0f} ms)")
+    if output:
+        with open(output, "w") as f:
+            json.dump({"results": results, "failures": failures}, f, indent=2)
+    for failure in failures:
+        print(f"FAIL {failure}")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import time of each pipeline stage and step file, with a regression threshold.")
+    parser.add_argument("--repeat", type=int, default=5, help="Fresh interpreters per target")
+    parser.add_argument("--max-ms", type=float, default=0, help="Fail when a target's median import time exceeds this (0 for no limit)")
+    parser.add_argument("--output", help="Also write the results as JSON to this file")
+    args = parser.parse_args()
+
+    sys.exit(run(args.repeat, args.max_ms, args.output))
@@ -0,0 +1,83 @@
+import argparse
+import pathlib
+import sys
+import time
+
+import faiss
+import numpy as np
+
+src_path = pathlib.Path(__file__).resolve().parent.parent / "src"
+sys.path.append(str(src_path))
+
+from index import INDEX_TYPES, build_index, search_parameters
+
+def synthetic_embeddings(n: int, dim: int, clusters: int = 64, seed: int = 0) -> np.ndarray:
+    """Returns n clustered float32 vectors, closer to real embeddings than uniform noise."""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim), dtype=np.float32)
+    points = centers[rng.integers(0, clusters, n)] + 0.3 * rng.standard_normal((n, dim), dtype=np.float32)
+    return np.ascontiguousarray(points, dtype=np.float32)
+
+def recall_at_k(found: np.ndarray, truth: np.ndarray) -> float:
+    """Fraction of the exact top-k neighbours that were returned."""
+    hits = sum(len(np.intersect1d(f[f >= 0], t)) for f, t in zip(found, truth))
+    return hits / truth.size
+
+def timed_search(index, queries: np.ndarray, k: int, params):
+    """Searches one query at a time, like the API does, and returns ids and per-query latencies."""
+    ids = np.empty((len(queries), k), dtype=np.int64)
+    latencies = []
+    for i, query in enumerate(queries):
+        start = time.perf_counter()
+        _, I = index.search(query.reshape(1, -1), k, params=params)
+        latencies.append(time.perf_counter() - start)
+        ids[i] = I[0]
+    return ids, np.array(latencies)
+
+def run(embeddings: np.ndarray, num_queries: int, k: int, nprobes, efs) -> None:
+    """
+    Builds every index type over the same embeddings and prints recall@k and
+    query latency against the flat (exact) baseline.
+    """
+    rng = np.random.default_rng(1)
+    queries = embeddings[rng.choice(len(embeddings), num_queries, replace=False)]
+    queries = queries + 0.05 * rng.standard_normal(queries.shape, dtype=np.float32)
+
+    print(f"{len(embeddings)} vectors, dim {embeddings.shape[1]}, {num_queries} queries, k={k}")
+    print(f"{'index':>9} {'param':>12} {'build s':>8} {'recall@k':>9} {'p50 ms':>8} {'p99 ms':>8}")
+    truth = None
+    for index_type in INDEX_TYPES:
+        start = time.perf_counter()
+        index = build_index(embeddings, index_type)
+        build_seconds = time.perf_counter() - start
+
+        if isinstance(index, faiss.IndexIVF):
+            settings = [(f"nprobe={p}", search_parameters(index, nprobe=p)) for p in nprobes]
+        elif isinstance(index, faiss.IndexHNSW):
+            settings = [(f"ef={e}", search_parameters(index, ef_search=e)) for e in efs]
+        else:
+            settings = [("exact", None)]
+
+        for label, params in settings:
+            ids, latencies = timed_search(index, queries, k, params)
+            if truth is None:
+                truth = ids
+            print(f"{index_type:>9} {label:>12} {build_seconds:>8.2f} {recall_at_k(ids, truth):>9.3f} "
+                  f"{np.percentile(latencies, 50) * 1000:>8.3f} {np.percentile(latencies, 99) * 1000:>8.3f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare recall@k and latency of the index types against the flat baseline.")
+    parser.add_argument("--embeddings", help="Path to an embeddings .npy file, synthetic vectors are used otherwise")
+    parser.add_argument("--vectors", type=int, default=20000, help="Number of synthetic vectors")
+    parser.add_argument("--dim", type=int, default=768, help="Dimension of the synthetic vectors")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=5)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--ef", type=int, nargs="+", default=[16, 64, 256])
+    args = parser.parse_args()
+
+    if args.embeddings:
+        embeddings = np.ascontiguousarray(np.load(args.embeddings), dtype=np.float32)
+    else:
+        embeddings = synthetic_embeddings(args.vectors, args.dim)
+    run(embeddings, min(args.queries, len(embeddings)), args.k, args.nprobe, args.ef)
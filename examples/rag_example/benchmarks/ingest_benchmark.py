@@ -0,0 +1,111 @@
+import argparse
+import http.server
+import os
+import pathlib
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import yaml
+
+project_dir = pathlib.Path(__file__).resolve().parent.parent
+src_path = project_dir / "src"
+sys.path.insert(0, str(src_path))  # Ahead of the standard library, which also has a "chunk" module
+
+def synthetic_page(paragraphs: int) -> bytes:
+    """Returns a Confluence-like HTML page with the given number of paragraphs."""
+    body = "".join(
+        f"<h2>Section {i}</h2><p>" + " ".join(f"token{(i * 7 + j) % 997}" for j in range(120)) + "</p>"
+        for i in range(paragraphs)
+    )
+    return f"<html><head><title>Page</title></head><body><div id='main-content'>{body}</div></body></html>".encode("utf-8")
+
+def serve(page: bytes) -> http.server.HTTPServer:
+    """Serves the page on a local port from a background thread."""
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(page)))
+            self.end_headers()
+            self.wfile.write(page)
+
+        def log_message(self, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def make_workspace(**overrides) -> pathlib.Path:
+    """
+    Creates a scratch project directory using the fake embedding backend, no
+    rate limit and no embedding cache, with the given config overrides.
+    """
+    workspace = pathlib.Path(tempfile.mkdtemp(prefix="rag-bench-"))
+    with open(project_dir / "rag_config.yml", "r") as f:
+        config = yaml.safe_load(f)
+    config.update({"embedding_backend": "fake", "embedding_qps": 0, "embedding_cache": False, **overrides})
+    with open(workspace / "rag_config.yml", "w") as f:
+        yaml.safe_dump(config, f)
+    return workspace
+
+def subprocess_run(url: str, workspace: pathlib.Path) -> None:
+    """The previous step implementation: one Python process per stage."""
+    for script, args in (("parse.py", [url]), ("chunk.py", []), ("embed.py", []), ("index.py", [])):
+        subprocess.run([sys.executable, str(src_path / script), *args], cwd=workspace, check=True,
+                       stdout=subprocess.DEVNULL)
+
+def in_process_run(url: str) -> None:
+    """The current step implementation: the same stages called in this process."""
+    from parse import save_text_to_file
+    from chunk import save_chunks
+    from embed import read_embed_chunks
+    from index import index_embeddings
+
+    save_text_to_file(url)
+    save_chunks()
+    read_embed_chunks()
+    index_embeddings()
+
+def in_memory_run(url: str) -> None:
+    """Parse, chunk, embed and index in memory, without the temp/ file hand-off."""
+    from pipeline import ingest_url
+
+    ingest_url(url)
+
+def measure(label: str, fn, repeat: int) -> None:
+    """Runs fn repeatedly with its output silenced and prints the first and median latency."""
+    samples = []
+    with open(os.devnull, "w") as devnull:
+        stdout, sys.stdout = sys.stdout, devnull
+        try:
+            for _ in range(repeat):
+                start = time.perf_counter()
+                fn()
+                samples.append(time.perf_counter() - start)
+        finally:
+            sys.stdout = stdout
+    print(f"{label:>12} first {samples[0] * 1000:>9.1f} ms  median {statistics.median(samples) * 1000:>9.1f} ms")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare end-to-end ingestion latency of subprocess and in-process stages.")
+    parser.add_argument("--paragraphs", type=int, default=200, help="Paragraphs in the synthetic page")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    server = serve(synthetic_page(args.paragraphs))
+    url = f"http://127.0.0.1:{server.server_address[1]}/page.html"
+    workspace = make_workspace()
+    try:
+        measure("subprocess", lambda: subprocess_run(url, workspace), args.repeat)
+        os.chdir(workspace)  # The src modules resolve rag_config.yml and temp/ from the working directory
+        measure("in-process", lambda: in_process_run(url), args.repeat)
+        measure("in-memory", lambda: in_memory_run(url), args.repeat)
+    finally:
+        server.shutdown()
+        shutil.rmtree(workspace, ignore_errors=True)
@@ -0,0 +1,87 @@
+import argparse
+import os
+import pathlib
+import shutil
+import statistics
+import sys
+import time
+
+import yaml
+
+from ingest_benchmark import make_workspace, serve, synthetic_page
+
+src_path = pathlib.Path(__file__).resolve().parent.parent / "src"
+sys.path.insert(0, str(src_path))  # Ahead of the standard library, which also has a "chunk" module
+
+def percentiles(samples) -> str:
+    samples = sorted(samples)
+    p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+    return f"p50 {statistics.median(samples) * 1000:>8.1f} ms  p95 {p95 * 1000:>8.1f} ms"
+
+def run(queries: int) -> None:
+    """
+    Answers distinct queries (so the query cache never hits) with the
+    blocking rag_reponse and with rag_stream, and prints the time until the
+    first answer text is available and until the answer is complete.
+    """
+    from rag import rag_reponse, rag_stream, startup_event
+
+    startup_event()
+    blocking, first, last, embed, search = [], [], [], [], []
+    with open(os.devnull, "w") as devnull:
+        stdout, sys.stdout = sys.stdout, devnull
+        try:
+            for i in range(queries):
+                start = time.perf_counter()
+                rag_reponse(f"token{i} token{i + 1} section {i}")
+                blocking.append(time.perf_counter() - start)
+
+                for event, data in rag_stream(f"token{i} token{i + 2} section {i}"):
+                    if event == "done":
+                        timings = data["timings"]
+                        embed.append(timings["embed"])
+                        search.append(timings["search"])
+                        first.append(timings["first_token"])
+                        last.append(timings["last_token"])
+        finally:
+            sys.stdout = stdout
+    print(f"{'blocking':>10} first text {percentiles(blocking)}   complete {percentiles(blocking)}")
+    print(f"{'streaming':>10} first text {percentiles(first)}   complete {percentiles(last)}")
+    print(f"{'':>10} embed done {percentiles(embed)}   search done {percentiles(search)}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare time to first token of blocking and streaming RAG answers.")
+    parser.add_argument("--queries", type=int, default=20)
+    parser.add_argument("--tokens", type=int, default=200, help="Words per fake answer")
+    parser.add_argument("--first-token-latency", type=float, default=0.3, help="Simulated seconds before the first word")
+    parser.add_argument("--token-latency", type=float, default=0.01, help="Simulated seconds between words")
+    parser.add_argument("--paragraphs", type=int, default=200, help="Paragraphs in the indexed synthetic page")
+    args = parser.parse_args()
+
+    page = synthetic_page(args.paragraphs)
+    server = serve(page)
+    url = f"http://127.0.0.1:{server.server_address[1]}/page.html"
+    workspace = make_workspace()
+    config_path = workspace / "rag_config.yml"
+    config = yaml.safe_load(config_path.read_text())
+    config.update({
+        "llm_backend": "fake",
+        "fake_llm_tokens": args.tokens,
+        "fake_llm_first_token_latency": args.first_token_latency,
+        "fake_llm_token_latency": args.token_latency,
+    })
+    config_path.write_text(yaml.safe_dump(config))
+    try:
+        os.chdir(workspace)  # The src modules resolve rag_config.yml and temp/ from the working directory
+        from pipeline import ingest_url
+
+        with open(os.devnull, "w") as devnull:
+            stdout, sys.stdout = sys.stdout, devnull
+            try:
+                ingest_url(url)
+            finally:
+                sys.stdout = stdout
+        run(args.queries)
+    finally:
+        server.shutdown()
+        shutil.rmtree(workspace, ignore_errors=True)
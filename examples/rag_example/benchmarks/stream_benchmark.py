@@ -0,0 +1,50 @@
+import argparse
+import os
+import pathlib
+import shutil
+import sys
+import time
+import tracemalloc
+
+from ingest_benchmark import make_workspace, serve, synthetic_page
+
+src_path = pathlib.Path(__file__).resolve().parent.parent / "src"
+sys.path.insert(0, str(src_path))  # Ahead of the standard library, which also has a "chunk" module
+
+def measure(label: str, fn) -> None:
+    """Runs one ingestion with its output silenced and prints latency and peak Python heap."""
+    with open(os.devnull, "w") as devnull:
+        stdout, sys.stdout = sys.stdout, devnull
+        try:
+            tracemalloc.start()
+            start = time.perf_counter()
+            result = fn()
+            elapsed = time.perf_counter() - start
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+        finally:
+            sys.stdout = stdout
+    first = result["timings"].get("first_vector")
+    first = f"{first * 1000:>9.1f} ms" if first is not None else f"{'-':>12}"
+    print(f"{label:>10} chunks {result['chunks']:>6}  first vector {first}  total {elapsed * 1000:>9.1f} ms  "
+          f"peak heap {peak / 1e6:>8.1f} MB")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare buffered and streaming ingestion of a large page.")
+    parser.add_argument("--paragraphs", type=int, default=5000, help="Paragraphs in the synthetic page")
+    args = parser.parse_args()
+
+    page = synthetic_page(args.paragraphs)
+    server = serve(page)
+    url = f"http://127.0.0.1:{server.server_address[1]}/page.html"
+    workspace = make_workspace(html_extractor="bs4", chunk_mode="word")  # The combination that can be streamed
+    print(f"page size {len(page) / 1e6:.1f} MB")
+    try:
+        os.chdir(workspace)  # The src modules resolve rag_config.yml and temp/ from the working directory
+        from pipeline import ingest_url, ingest_url_streaming
+
+        measure("buffered", lambda: ingest_url(url))
+        measure("streaming", lambda: ingest_url_streaming(url))
+    finally:
+        server.shutdown()
+        shutil.rmtree(workspace, ignore_errors=True)
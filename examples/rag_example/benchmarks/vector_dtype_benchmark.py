@@ -0,0 +1,77 @@
+import argparse
+import pathlib
+import sys
+
+import faiss
+import numpy as np
+
+src_path = pathlib.Path(__file__).resolve().parent.parent / "src"
+sys.path.append(str(src_path))
+
+from index import build_index, search_parameters
+from index_benchmark import recall_at_k, synthetic_embeddings, timed_search
+from vectors import VECTOR_DTYPES, decode_vectors, encode_vectors
+
+def stored_bytes(embeddings: np.ndarray, dtype: str) -> int:
+    """Size of the embeddings file of a run in the given storage dtype, with its int8 scale."""
+    stored, scale = encode_vectors(embeddings, dtype)
+    return stored.nbytes + (scale.nbytes if scale is not None else 0)
+
+def incremental_index(embeddings: np.ndarray, index_type: str, dtype: str, documents: int):
+    """
+    Builds the index from the first document and adds the others one by one,
+    as index.py does, so an int8 range is trained on the first document only.
+    """
+    ids = np.arange(len(embeddings), dtype=np.int64)
+    parts = np.array_split(np.arange(len(embeddings)), documents)
+    index = build_index(embeddings[parts[0]], index_type, ids=ids[parts[0]], vector_dtype=dtype)
+    for part in parts[1:]:
+        index.add_with_ids(embeddings[part], ids[part])
+    return index
+
+def run(embeddings: np.ndarray, num_queries: int, k: int, index_types, documents: int) -> None:
+    """
+    Builds each index type with every vector dtype over the same embeddings
+    and prints the stored embeddings size, the index size, recall@k against
+    the exact float32 search, and query latency.
+    """
+    rng = np.random.default_rng(1)
+    queries = embeddings[rng.choice(len(embeddings), num_queries, replace=False)]
+    queries = queries + 0.05 * rng.standard_normal(queries.shape, dtype=np.float32)
+    truth, _ = timed_search(build_index(embeddings, "flat"), queries, k, None)
+
+    for dtype in VECTOR_DTYPES:
+        stored, scale = encode_vectors(embeddings, dtype)
+        error = np.abs(decode_vectors(stored, scale) - embeddings).max()
+        print(f"{dtype:>8} embeddings file {stored_bytes(embeddings, dtype) / 2 ** 20:>8.1f} MB  max abs error {error:.5f}")
+
+    print(f"{len(embeddings)} vectors, dim {embeddings.shape[1]}, {num_queries} queries, k={k}")
+    print(f"{'index':>9} {'dtype':>8} {'build':>12} {'index MB':>9} {'saved':>6} {'recall@k':>9} {'p50 ms':>8}")
+    for index_type in index_types:
+        baseline = None
+        for dtype in VECTOR_DTYPES:
+            for build, label in ((lambda: build_index(embeddings, index_type, vector_dtype=dtype), "one pass"),
+                                 (lambda: incremental_index(embeddings, index_type, dtype, documents), f"{documents} docs")):
+                index = build()
+                size = faiss.serialize_index(index).size
+                baseline = baseline or size
+                ids, latencies = timed_search(index, queries, k, search_parameters(index))
+                print(f"{index_type:>9} {dtype:>8} {label:>12} {size / 2 ** 20:>9.1f} {max(0.0, 1 - size / baseline):>6.0%} "
+                      f"{recall_at_k(ids, truth):>9.3f} {np.percentile(latencies, 50) * 1000:>8.3f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Memory saved and recall change of float16 and int8 vector storage.")
+    parser.add_argument("--embeddings", help="Path to an embeddings .npy file, synthetic vectors are used otherwise")
+    parser.add_argument("--vectors", type=int, default=20000, help="Number of synthetic vectors")
+    parser.add_argument("--dim", type=int, default=768, help="Dimension of the synthetic vectors")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=5)
+    parser.add_argument("--index-types", nargs="+", default=["flat", "hnsw"])
+    parser.add_argument("--documents", type=int, default=20, help="Documents the vectors are split into for the incremental build")
+    args = parser.parse_args()
+
+    if args.embeddings:
+        embeddings = decode_vectors(np.load(args.embeddings))
+    else:
+        embeddings = synthetic_embeddings(args.vectors, args.dim)
+    run(embeddings, min(args.queries, len(embeddings)), args.k, args.index_types, args.documents)
@@ -0,0 +1,444 @@
+import array
+import json
+import os
+import pathlib
+import re
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from documents import purge_retired_files, retire_files
+
+# Keeps identifiers such as error codes, Jira keys and versions in one token: "CONF-1234", "6.13", "setenv.sh".
+TOKEN_PATTERN = re.compile(r"\w+(?:[-.:/]\w+)*")
+# The list of segments of an index directory, and the single-file index written before segments existed
+STATE_FILE = "segments.json"
+LEGACY_FILE = "bm25_index.npz"
+
+
+def tokenize(text: str) -> List[str]:
+    """Returns the lowercased lexical terms of a text."""
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+class BM25Segment:
+    """
+    Immutable postings of a group of chunks, stored as sparse arrays.
+
+    The postings are kept in CSR form, sorted by term: the postings of term
+    t are rows[indptr[t]:indptr[t + 1]], where a row is a position in the
+    sorted chunk_ids array. Each posting stores its raw term frequency.
+
+    Within a term the postings are ordered by decreasing term frequency
+    weight, so a search can stop after the max_postings best postings of a
+    very common term: the chunks it skips gain the least from that term.
+    Rare terms, the ones that identify error codes or keys, are always read
+    in full.
+
+    Args:
+        vocab (List[str]): The terms, in term id order.
+        indptr (np.ndarray): (terms + 1) int64 offsets into the postings.
+        rows (np.ndarray): int32 row of each posting.
+        tf (np.ndarray): uint16 term frequency of each posting.
+        chunk_ids (np.ndarray): Sorted int64 chunk id of each row.
+        lengths (np.ndarray): int32 length in terms of each row's chunk.
+        name (Optional[str]): The file the segment is saved in, None until it is saved.
+    """
+
+    def __init__(self, vocab: List[str], indptr: np.ndarray, rows: np.ndarray, tf: np.ndarray,
+                 chunk_ids: np.ndarray, lengths: np.ndarray, name: Optional[str] = None):
+        self.vocab = vocab
+        self.term_ids = {term: i for i, term in enumerate(vocab)}
+        self.indptr = indptr
+        self.rows = rows
+        self.tf = tf
+        self.chunk_ids = chunk_ids
+        self.lengths = lengths
+        self.name = name
+
+    def __len__(self) -> int:
+        return len(self.chunk_ids)
+
+    @classmethod
+    def from_postings(cls, terms: np.ndarray, chunk_ids: np.ndarray, tf: np.ndarray, vocab: Sequence[str],
+                      ids: np.ndarray, lengths: np.ndarray, k1: float = 1.2, b: float = 0.75) -> "BM25Segment":
+        """
+        Builds a segment from postings in coordinate form.
+
+        Args:
+            terms (np.ndarray): Term id (into vocab) of each posting.
+            chunk_ids (np.ndarray): Chunk id of each posting.
+            tf (np.ndarray): Term frequency of each posting.
+            vocab (Sequence[str]): The terms.
+            ids (np.ndarray): The sorted ids of every chunk of the segment.
+            lengths (np.ndarray): The length in terms of each chunk of ids.
+        """
+        used, terms = np.unique(terms, return_inverse=True)  # Drops terms left without postings
+        terms = terms.astype(np.int32)  # 32-bit intermediates halve the peak memory of a large document
+        rows = np.searchsorted(ids, chunk_ids).astype(np.int32)
+        indptr = np.zeros(len(used) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(terms, minlength=len(used)), out=indptr[1:])
+        tf = np.minimum(tf, np.iinfo(np.uint16).max).astype(np.uint16)
+        norm = k1 * (1 - b + b * lengths / max(lengths.mean(), 1.0)) if len(lengths) else np.empty(0)
+        norm = norm.astype(np.float32)
+        impact = tf * np.float32(k1 + 1) / (tf + norm[rows])
+        order = np.lexsort((-impact, terms))  # By term, best postings first within each term
+        return cls([vocab[i] for i in used.tolist()], indptr, rows[order], tf[order],
+                   ids.astype(np.int64), lengths.astype(np.int32))
+
+    @classmethod
+    def from_chunks(cls, chunk_ids: Iterable[int], chunks: Iterable[str], k1: float = 1.2, b: float = 0.75) -> "BM25Segment":
+        """
+        Tokenizes the given chunks and builds their segment. The chunks are
+        read once, as a stream, and their postings collected in typed arrays.
+        """
+        vocab, term_ids = [], {}
+        terms, posting_ids, tf = array.array("i"), array.array("q"), array.array("i")
+        ids, lengths = array.array("q"), array.array("q")
+        for chunk_id, chunk in zip(chunk_ids, chunks):
+            counts = Counter(tokenize(chunk))
+            ids.append(chunk_id)
+            lengths.append(sum(counts.values()))
+            for term, count in counts.items():
+                term_id = term_ids.get(term)
+                if term_id is None:
+                    term_id = term_ids[term] = len(vocab)
+                    vocab.append(term)
+                terms.append(term_id)
+            posting_ids.extend([chunk_id] * len(counts))
+            tf.extend(counts.values())
+        ids, lengths = np.frombuffer(ids, dtype=np.int64), np.frombuffer(lengths, dtype=np.int64)
+        order = np.argsort(ids, kind="stable")
+        return cls.from_postings(np.frombuffer(terms, dtype=np.int32), np.frombuffer(posting_ids, dtype=np.int64),
+                                 np.frombuffer(tf, dtype=np.int32), vocab, ids[order], lengths[order], k1, b)
+
+    def postings(self, live: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Returns the (term, chunk id, tf) coordinate form of the postings of the live rows."""
+        terms = np.repeat(np.arange(len(self.vocab), dtype=np.int64), np.diff(self.indptr))
+        rows, tf = self.rows, self.tf
+        if live is not None:
+            keep = live[rows]
+            terms, rows, tf = terms[keep], rows[keep], tf[keep]
+        return terms, self.chunk_ids[rows], tf.astype(np.int64)
+
+    def save(self, filepath: pathlib.Path) -> None:
+        """Writes the segment atomically as an .npz archive."""
+        filepath = pathlib.Path(filepath)
+        filepath.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = filepath.with_name(filepath.name + ".tmp")
+        with open(tmp_path, "wb") as f:
+            np.savez(
+                f,
+                vocab=np.frombuffer("\n".join(self.vocab).encode("utf-8"), dtype=np.uint8),
+                indptr=self.indptr,
+                rows=self.rows,
+                tf=self.tf,
+                chunk_ids=self.chunk_ids,
+                lengths=self.lengths,
+            )
+        os.replace(tmp_path, filepath)
+
+    @classmethod
+    def load(cls, filepath: pathlib.Path, name: Optional[str] = None) -> "BM25Segment":
+        """Reads a segment, or a whole index saved in the single-file format used before segments."""
+        with np.load(filepath) as data:
+            vocab = data["vocab"].tobytes().decode("utf-8")
+            return cls(vocab.split("\n") if vocab else [], data["indptr"], data["rows"], data["tf"],
+                       data["chunk_ids"], data["lengths"], name)
+
+
+def merge_segments(parts: Sequence[Tuple[BM25Segment, Optional[np.ndarray]]], k1: float = 1.2,
+                   b: float = 0.75) -> BM25Segment:
+    """
+    Merges the live rows of several segments into one new segment. Deleted
+    rows are dropped.
+
+    Args:
+        parts: (segment, live) pairs, where live is the boolean mask of the
+            segment's live rows, or None when none was deleted.
+    """
+    term_ids = {}
+    terms, posting_ids, tf, ids, lengths = [], [], [], [], []
+    for segment, live in parts:
+        mapping = np.array([term_ids.setdefault(term, len(term_ids)) for term in segment.vocab], dtype=np.int64)
+        segment_terms, segment_ids, segment_tf = segment.postings(live)
+        terms.append(mapping[segment_terms] if len(mapping) else segment_terms)
+        posting_ids.append(segment_ids)
+        tf.append(segment_tf)
+        ids.append(segment.chunk_ids if live is None else segment.chunk_ids[live])
+        lengths.append(segment.lengths if live is None else segment.lengths[live])
+    ids, lengths = np.concatenate(ids), np.concatenate(lengths)
+    order = np.argsort(ids, kind="stable")
+    return BM25Segment.from_postings(np.concatenate(terms), np.concatenate(posting_ids), np.concatenate(tf),
+                                     list(term_ids), ids[order], lengths[order].astype(np.int64), k1, b)
+
+
+class BM25Index:
+    """
+    Okapi BM25 inverted index over chunks, made of immutable segments.
+
+    Adding a document builds a segment of its chunks only, and removing one
+    marks its rows deleted in the segments that hold them, so an update
+    costs the size of the document, not of the corpus. Segments are merged
+    like a binary counter: the newest segment is merged into the one before
+    it once it has as many live rows, which keeps the number of segments
+    logarithmic and merges each posting a logarithmic number of times. A
+    segment with more than half of its rows deleted is compacted.
+
+    The BM25 weights depend on the chunk count, average length and document
+    frequencies of the whole index, so they are computed at query time from
+    the live rows of every segment: the scores are those of a single index
+    over the same chunks.
+
+    Args:
+        segments (List[BM25Segment]): The segments, oldest first.
+        removed (Optional[List[List[Tuple[int, int]]]]): The [start, end) chunk id ranges removed from each segment.
+        k1 (float): BM25 term frequency saturation.
+        b (float): BM25 length normalization.
+    """
+
+    def __init__(self, segments: List[BM25Segment], removed: Optional[List[List[Tuple[int, int]]]] = None,
+                 k1: float = 1.2, b: float = 0.75):
+        self.segments = list(segments)
+        self.removed = [[tuple(r) for r in ranges] for ranges in removed] if removed else [[] for _ in self.segments]
+        self.k1 = k1
+        self.b = b
+        self.live = [self._live_mask(segment, ranges) for segment, ranges in zip(self.segments, self.removed)]
+        self.live_counts = [len(s) if live is None else int(np.count_nonzero(live)) for s, live in zip(self.segments, self.live)]
+        self.num_chunks = sum(self.live_counts)
+        self.total_length = sum(int(s.lengths.sum() if live is None else s.lengths[live].sum())
+                                for s, live in zip(self.segments, self.live))
+        self._df = {}  # Term -> live document frequency, filled by the searches of this immutable index
+        self._norms = {}  # Segment position -> length normalization of its rows, for this index's average length
+
+    @staticmethod
+    def _live_mask(segment: BM25Segment, ranges: List[Tuple[int, int]]) -> Optional[np.ndarray]:
+        live = None
+        for start, end in ranges:
+            lo, hi = np.searchsorted(segment.chunk_ids, [start, end])
+            if hi > lo:
+                live = np.ones(len(segment), dtype=bool) if live is None else live
+                live[lo:hi] = False
+        return live
+
+    def __len__(self) -> int:
+        return self.num_chunks
+
+    @classmethod
+    def build(cls, chunk_ids: Iterable[int], chunks: Iterable[str], k1: float = 1.2, b: float = 0.75) -> "BM25Index":
+        """Builds the index of the given chunks, as one segment."""
+        segment = BM25Segment.from_chunks(chunk_ids, chunks, k1, b)
+        return cls([segment] if len(segment) else [], None, k1, b)
+
+    def _copy(self) -> "BM25Index":
+        index = BM25Index([], None, self.k1, self.b)
+        index.segments, index.removed = list(self.segments), [list(ranges) for ranges in self.removed]
+        index.live, index.live_counts = list(self.live), list(self.live_counts)
+        index.num_chunks, index.total_length = self.num_chunks, self.total_length
+        return index
+
+    def _replace(self, i: int, j: int, segment: BM25Segment) -> None:
+        """Replaces segments i..j - 1 with one segment that has no deleted rows."""
+        self.segments[i:j] = [segment]
+        self.removed[i:j] = [[]]
+        self.live[i:j] = [None]
+        self.live_counts[i:j] = [len(segment)]
+
+    def update(self, chunk_ids: Iterable[int], chunks: Iterable[str], remove: Optional[Tuple[int, int]] = None) -> "BM25Index":
+        """
+        Returns a new index with the chunk ids in the [start, end) remove range
+        dropped and the given chunks added. The segments of this index are
+        shared, not modified.
+        """
+        index = self._copy()
+        if remove is not None:
+            for i, segment in enumerate(index.segments):
+                lo, hi = np.searchsorted(segment.chunk_ids, remove)
+                live = index.live[i]
+                rows = np.arange(lo, hi)
+                if live is not None:
+                    rows = rows[live[lo:hi]]
+                if not len(rows):
+                    continue
+                live = np.ones(len(segment), dtype=bool) if live is None else live.copy()
+                live[rows] = False
+                index.live[i] = live
+                index.live_counts[i] -= len(rows)
+                index.removed[i] = index.removed[i] + [tuple(remove)]
+                index.num_chunks -= len(rows)
+                index.total_length -= int(segment.lengths[rows].sum())
+
+        segment = BM25Segment.from_chunks(chunk_ids, chunks, self.k1, self.b)
+        if len(segment):
+            index.segments.append(segment)
+            index.removed.append([])
+            index.live.append(None)
+            index.live_counts.append(len(segment))
+            index.num_chunks += len(segment)
+            index.total_length += int(segment.lengths.sum())
+
+        for i in reversed(range(len(index.segments))):
+            if index.live_counts[i] == 0:
+                del index.segments[i], index.removed[i], index.live[i], index.live_counts[i]
+            elif index.live_counts[i] * 2 < len(index.segments[i]):
+                index._replace(i, i + 1, merge_segments([(index.segments[i], index.live[i])], self.k1, self.b))
+        while len(index.segments) > 1 and index.live_counts[-2] <= index.live_counts[-1]:
+            parts = list(zip(index.segments[-2:], index.live[-2:]))
+            index._replace(len(index.segments) - 2, len(index.segments), merge_segments(parts, self.k1, self.b))
+        return index
+
+    def document_frequency(self, term: str) -> int:
+        """Returns the number of live chunks that contain the term."""
+        df = self._df.get(term)
+        if df is None:
+            df = 0
+            for segment, live in zip(self.segments, self.live):
+                term_id = segment.term_ids.get(term)
+                if term_id is None:
+                    continue
+                start, end = segment.indptr[term_id], segment.indptr[term_id + 1]
+                df += int(end - start) if live is None else int(np.count_nonzero(live[segment.rows[start:end]]))
+            self._df[term] = df
+        return df
+
+    def _norm(self, i: int) -> np.ndarray:
+        norm = self._norms.get(i)
+        if norm is None:
+            average_length = max(self.total_length / self.num_chunks, 1.0)
+            lengths = self.segments[i].lengths
+            norm = (self.k1 * (1 - self.b + self.b * lengths / average_length)).astype(np.float32)
+            self._norms[i] = norm
+        return norm
+
+    def search(self, query: str, k: int, max_postings: int = 2000) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Returns the ids and BM25 scores of the k best matching chunks, best first.
+        Only the postings of the query terms are touched, at most max_postings
+        per term and segment (0 reads every posting, for exact scores).
+        """
+        idf = {}
+        if k > 0 and self.num_chunks:
+            for term in set(tokenize(query)):
+                df = self.document_frequency(term)
+                if df:
+                    idf[term] = np.float32(np.log1p((self.num_chunks - df + 0.5) / (df + 0.5)))
+        if not idf:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        found_ids, found_scores = [], []
+        for i, (segment, live) in enumerate(zip(self.segments, self.live)):
+            terms = [(weight, segment.term_ids[term]) for term, weight in idf.items() if term in segment.term_ids]
+            if not terms:
+                continue
+            scores = np.zeros(len(segment), dtype=np.float32)
+            candidates = []
+            for weight, term_id in terms:
+                start, end = segment.indptr[term_id], segment.indptr[term_id + 1]
+                if max_postings:
+                    end = min(end, start + max_postings)
+                rows = segment.rows[start:end]
+                tf = segment.tf[start:end].astype(np.float32)
+                if live is not None:
+                    keep = live[rows]
+                    rows, tf = rows[keep], tf[keep]
+                scores[rows] += weight * tf * np.float32(self.k1 + 1) / (tf + self._norm(i)[rows])  # Rows are unique within a term's postings
+                candidates.append(rows)
+            candidates = np.concatenate(candidates) if len(candidates) > 1 else candidates[0]
+            top = k * len(terms)  # A row appears at most once per term, so this holds k distinct rows
+            if len(candidates) > top:
+                candidates = candidates[np.argpartition(-scores[candidates], top - 1)[:top]]
+            candidates = np.unique(candidates)
+            best = candidates[np.argsort(-scores[candidates], kind="stable")[:k]]
+            found_ids.append(segment.chunk_ids[best])
+            found_scores.append(scores[best])
+        if not found_ids:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        ids, scores = np.concatenate(found_ids), np.concatenate(found_scores)
+        best = np.lexsort((ids, -scores))[:k]  # Ties in chunk id order, as in a single segment
+        return ids[best], scores[best]
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "chunks": self.num_chunks,
+            "segments": len(self.segments),
+            "postings": sum(len(segment.rows) for segment in self.segments),
+            "deleted_rows": sum(len(segment) - count for segment, count in zip(self.segments, self.live_counts)),
+        }
+
+    def save(self, directory: pathlib.Path, retired_grace_seconds: float = 0) -> None:
+        """
+        Saves the index in a directory: each segment in its own file, written
+        once, and the list of segments with their removed ranges in
+        segments.json, replaced atomically. Segment files that are no longer
+        listed are retired and deleted by a later save, retired_grace_seconds
+        after, so a reader that has just read the previous list can still
+        open them.
+        """
+        directory = pathlib.Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        state_file = directory / STATE_FILE
+        state = json.loads(state_file.read_text(encoding="utf-8")) if state_file.exists() else {}
+        next_segment = state.get("next_segment", 0)
+        for segment in self.segments:
+            if segment.name is None or not (directory / segment.name).exists():
+                segment.name = f"segment-{next_segment}.npz"
+                next_segment += 1
+                segment.save(directory / segment.name)
+        names = [segment.name for segment in self.segments]
+        purge_retired_files(state, directory, retired_grace_seconds)
+        retire_files(state, sorted({s["file"] for s in state.get("segments", [])} - set(names)))
+        state.update({
+            "k1": self.k1,
+            "b": self.b,
+            "next_segment": next_segment,
+            "segments": [{"file": name, "removed": [list(r) for r in ranges]} for name, ranges in zip(names, self.removed)],
+        })
+        tmp_path = state_file.with_name(state_file.name + ".tmp")
+        tmp_path.write_text(json.dumps(state, indent=1), encoding="utf-8")
+        os.replace(tmp_path, state_file)
+
+    @classmethod
+    def load(cls, directory: pathlib.Path) -> "BM25Index":
+        directory = pathlib.Path(directory)
+        state = json.loads((directory / STATE_FILE).read_text(encoding="utf-8"))
+        segments = [BM25Segment.load(directory / s["file"], s["file"]) for s in state["segments"]]
+        return cls(segments, [s["removed"] for s in state["segments"]], state["k1"], state["b"])
+
+
+def empty_index(k1: float = 1.2, b: float = 0.75) -> BM25Index:
+    return BM25Index([], None, k1, b)
+
+
+def load_bm25(directory: pathlib.Path) -> Optional[BM25Index]:
+    """
+    Reads the BM25 index saved in a directory, or the single-file index
+    (bm25_index.npz) written next to it before segments existed, or returns
+    None if there is none yet.
+    """
+    directory = pathlib.Path(directory)
+    if (directory / STATE_FILE).exists():
+        return BM25Index.load(directory)
+    legacy_file = directory.parent / LEGACY_FILE
+    if legacy_file.exists():
+        return BM25Index([BM25Segment.load(legacy_file)])
+    return None
+
+
+def reciprocal_rank_fusion(vector_ids: Sequence[int], lexical_ids: Sequence[int], k: int,
+                           lexical_weight: float = 0.5, rrf_k: int = 60) -> List[int]:
+    """
+    Fuses two ranked id lists with weighted reciprocal-rank fusion.
+
+    Each list contributes weight / (rrf_k + rank) to the score of its ids,
+    with rank starting at 1; the vector list has weight 1 - lexical_weight.
+
+    Returns:
+        List[int]: The k ids with the best fused score, best first.
+    """
+    scores = {}
+    for weight, ids in ((1 - lexical_weight, vector_ids), (lexical_weight, lexical_ids)):
+        for rank, chunk_id in enumerate(ids, start=1):
+            chunk_id = int(chunk_id)
+            scores[chunk_id] = scores.get(chunk_id, 0.0) + weight / (rrf_k + rank)
+    return sorted(scores, key=lambda chunk_id: -scores[chunk_id])[:k]
@@ -1,30 +1,25 @@
 import json
-import pathlib
-from typing import List, Optional
-import yaml
+from collections import deque
+from typing import Iterable, Iterator, List, Optional
 
-def load_config(config_file="rag_config.yml"):
-    """
-    Loads configuration from a YAML file.
-
-    Args:
-        config_file (str): The path to the configuration file.
-
-    Returns:
-        dict: The configuration parameters.
-    """
-    with open(config_file, "r") as file:
-        config = yaml.safe_load(file)
-    return config
+from chunk_store import write_chunk_store
+from settings import get_config
+from chunker import CHUNK_MODES, Chunk, chunk_document, simple_token_spans, tiktoken_token_spans
+from telemetry import span
+from workspace import RunWorkspace, atomic_write
 
-config = load_config()
+config = get_config()
 chunk_size = config["chunk_size"]
 chunk_overlap = config["chunk_overlap"]
+chunk_mode = config.get("chunk_mode", "word")
+chunk_tokenizer = config.get("chunk_tokenizer", "simple")
+chunk_compression = config.get("chunk_compression", "none")
+chunk_block_size = config.get("chunk_block_size", 64)
+chunk_export_json = config.get("chunk_export_json", False)
 
-def read_text_from_file() -> Optional[str]:
-    """Reads text from a file and returns it as a string."""
-    current_dir = pathlib.Path().parent.resolve()
-    filepath = current_dir / "temp" / "text" / "parsed.txt"
+def read_text_from_file(run_id: Optional[str] = None) -> Optional[str]:
+    """Reads the parsed text of an ingestion run and returns it as a string."""
+    filepath = RunWorkspace(run_id).text_dir / "parsed.txt"
     try:
         with open(filepath, "r", encoding="utf-8") as file:
             text = file.read()
@@ -48,23 +43,125 @@ def chunk_text(text: str, chunk_size: int = chunk_size, overlap: int = chunk_ove
         chunks.append(chunk)
     return chunks
 
-def save_chunks(output_file: str = "output.json") -> None:
-    """Reads text from a file, chunks it, and saves the chunks to a JSON file."""
-    text = read_text_from_file()
+def get_token_spans():
+    """
+    Returns the token span function selected by chunk_tokenizer: "simple"
+    approximates model tokens, "tiktoken" (if installed) counts BPE tokens.
+    """
+    if chunk_tokenizer == "tiktoken":
+        try:
+            return tiktoken_token_spans()
+        except ImportError:
+            print("tiktoken is not installed, falling back to the simple tokenizer.")
+    return simple_token_spans
+
+def chunk_with_metadata(text: str, source_url: Optional[str] = None, mode: str = chunk_mode,
+                        chunk_size: int = chunk_size, overlap: int = chunk_overlap) -> List[Chunk]:
+    """
+    Chunks the input text with the configured chunk mode ("word", "token" or
+    "structure"). Each chunk carries its source URL, character offsets and
+    heading path. In "word" mode each chunk is the slice of text between its
+    offsets, so it keeps the original whitespace between words; it matches
+    chunk_text's chunk only for whitespace-normalized text, which is what
+    the flat extractors produce.
+    """
+    if mode not in CHUNK_MODES:
+        raise ValueError(f"Unknown chunk mode: {mode}")
+    token_spans = get_token_spans() if mode == "token" else simple_token_spans
+    return chunk_document(text, mode, chunk_size, overlap, source_url, token_spans)
+
+def iter_words(pieces: Iterable[str]) -> Iterator[str]:
+    """Yields the whitespace-separated words of a stream of text pieces."""
+    for piece in pieces:
+        yield from piece.split()
+
+def iter_chunks(words: Iterable[str], chunk_size: int = chunk_size, overlap: int = chunk_overlap) -> Iterator[str]:
+    """
+    Chunks a stream of words with a sliding overlap window.
+
+    Produces the same chunks as chunk_text, but only holds one window of
+    words in memory and yields each chunk as soon as it is complete.
+    """
+    for chunk in iter_chunks_with_metadata(words, None, chunk_size, overlap):
+        yield chunk.text
+
+def iter_chunks_with_metadata(words: Iterable[str], source_url: Optional[str] = None, chunk_size: int = chunk_size,
+                              overlap: int = chunk_overlap) -> Iterator[Chunk]:
+    """
+    Streaming version of chunk_with_metadata in "word" mode: yields the same
+    chunks, with the same offsets into the words joined by single spaces, as
+    soon as each one is complete.
+
+    Raises:
+        ValueError: If overlap is not smaller than chunk_size, as no window would ever move on.
+    """
+    if chunk_size <= 0 or not 0 <= overlap < chunk_size:
+        raise ValueError(f"chunk_overlap ({overlap}) must be between 0 and chunk_size ({chunk_size}) - 1")
+    step = chunk_size - overlap
+    window = deque()  # (word, start offset)
+    position = 0
+
+    def cut():
+        start, (last, last_start) = window[0][1], window[-1]
+        return Chunk(" ".join(word for word, _ in window), start, last_start + len(last), (), source_url, len(window))
+
+    for word in words:
+        window.append((word, position))
+        position += len(word) + 1
+        if len(window) == chunk_size:
+            yield cut()
+            for _ in range(step):
+                window.popleft()
+    while window:  # Like chunk_text, every window start before the end yields a chunk
+        yield cut()
+        if len(window) <= step:
+            break
+        for _ in range(step):
+            window.popleft()
+
+def save_chunks(output_file: str = "output.bin", run_id: Optional[str] = None) -> bool:
+    """
+    Reads text from a file, chunks it, and saves the chunks to a binary chunk
+    store (and to output.json as well when chunk_export_json is set).
+
+    Args:
+        output_file (str): The name of the chunk store.
+        run_id (Optional[str]): The ingestion run whose text is chunked (see workspace.py).
+
+    Returns:
+        bool: Whether the chunks were saved.
+    """
+    workspace = RunWorkspace(run_id)
+    if not workspace.ready("parse"):
+        print(f"Run {run_id} has no parsed text.")
+        return False
+    text = read_text_from_file(run_id)
     if text is None:
         print("No text to chunk.")
-        return
-    chunks = chunk_text(text)
-    current_dir = pathlib.Path().parent.resolve()
-    chunks_dir = current_dir / "temp" / "chunks"
+        return False
+    source_url_file = workspace.text_dir / "source_url.txt"
+    source_url = source_url_file.read_text(encoding="utf-8").strip() if source_url_file.exists() else None
+    with span("chunk.split", bytes=len(text)) as split:
+        chunks = chunk_with_metadata(text, source_url)
+        split.set(items=len(chunks))
+    chunks_dir = workspace.chunks_dir
     chunks_dir.mkdir(parents=True, exist_ok=True)
     output_path = chunks_dir / output_file
     try:
-        with open(output_path, "w", encoding="utf-8") as file:
-            json.dump(chunks, file, indent=4)
+        with span("chunk.save", items=len(chunks)) as save:
+            write_chunk_store((chunk.text for chunk in chunks), output_path, chunk_compression, chunk_block_size)
+            if chunk_export_json:
+                with atomic_write(chunks_dir / "output.json", encoding="utf-8") as file:
+                    json.dump([chunk.text for chunk in chunks], file, indent=4)
+            with atomic_write(chunks_dir / "metadata.json", encoding="utf-8") as file:
+                json.dump([chunk.metadata() for chunk in chunks], file)
+            save.set(bytes=output_path.stat().st_size)
+        workspace.mark_done("chunk")
         print(f"Chunks saved to {output_path}")
+        return True
     except Exception as e:
         print(f"Error saving chunks to file: {e}")
+        return False
 
 if __name__ == "__main__":
     try:
@@ -0,0 +1,239 @@
+import argparse
+import array
+import json
+import mmap
+import os
+import pathlib
+import shutil
+import struct
+import sys
+import tempfile
+import threading
+from typing import Iterable, Iterator, List, Optional
+
+# File layout:
+#   header  : magic (8 bytes), version (uint32), block size (uint32), count (uint64)
+#   offsets : (count + 1) little-endian uint64 byte offsets of the chunks in the uncompressed blob
+#   blocks  : compressed stores only, (blocks + 1) uint64 byte offsets of the blocks in the blob section
+#   blob    : the UTF-8 encoded chunks, back to back, or zstd frames of block size chunks each
+# A block size of 0 means the blob is not compressed. Version 1 files are never compressed.
+MAGIC = b"RAGCHNK1"
+VERSION = 2
+HEADER = struct.Struct("<8sIIQ")
+OFFSET = struct.Struct("<Q")
+COMPRESSIONS = ("none", "zstd")
+DEFAULT_BLOCK_SIZE = 64
+
+
+def _zstd():
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError("zstd compressed chunk stores need the zstandard package: pip install zstandard")
+    return zstandard
+
+
+def write_chunk_store(chunks: Iterable[str], filepath: pathlib.Path, compression: str = "none",
+                      block_size: int = DEFAULT_BLOCK_SIZE) -> int:
+    """
+    Writes chunks to a binary chunk store that supports random access by chunk id.
+
+    The chunks are consumed as a stream: their bytes are spooled to a
+    temporary file and only the offsets are kept in memory. The file is
+    written next to its destination and renamed into place, so readers that
+    have the previous version mapped keep a consistent view.
+
+    Args:
+        chunks (Iterable[str]): The text chunks, in chunk id order.
+        filepath (pathlib.Path): The path of the chunk store file.
+        compression (str): "none", or "zstd" to compress the chunks in blocks
+            (falls back to "none" when zstandard is not installed).
+        block_size (int): Chunks per compressed block.
+
+    Returns:
+        int: The number of chunks written.
+    """
+    if compression not in COMPRESSIONS:
+        raise ValueError(f"Unknown chunk store compression: {compression}")
+    filepath = pathlib.Path(filepath)
+    filepath.parent.mkdir(parents=True, exist_ok=True)
+    compressor = None
+    if compression == "zstd":
+        try:
+            compressor = _zstd().ZstdCompressor()
+        except ImportError as e:
+            print(f"{e}. Writing an uncompressed chunk store.")
+    offsets = array.array("Q", [0])
+    block_offsets = array.array("Q", [0])
+    block = []
+
+    with tempfile.TemporaryFile(dir=filepath.parent) as blob:
+        def flush_block():
+            frame = compressor.compress(b"".join(block))
+            blob.write(frame)
+            block_offsets.append(block_offsets[-1] + len(frame))
+            block.clear()
+
+        for chunk in chunks:
+            encoded = chunk.encode("utf-8")
+            offsets.append(offsets[-1] + len(encoded))
+            if compressor is None:
+                blob.write(encoded)
+                continue
+            block.append(encoded)
+            if len(block) == block_size:
+                flush_block()
+        if block:
+            flush_block()
+
+        count = len(offsets) - 1
+        tmp_path = filepath.with_name(filepath.name + ".tmp")
+        with open(tmp_path, "wb") as f:
+            f.write(HEADER.pack(MAGIC, VERSION, block_size if compressor else 0, count))
+            tables = [offsets, block_offsets] if compressor is not None else [offsets]
+            for table in tables:
+                if sys.byteorder == "big":
+                    table.byteswap()  # Offsets are stored little-endian
+                f.write(table.tobytes())
+            blob.seek(0)
+            shutil.copyfileobj(blob, f)
+    os.replace(tmp_path, filepath)
+    return count
+
+
+class ChunkStore:
+    """
+    Read-only, memory-mapped view over a chunk store file.
+
+    Only the header is parsed when the store is opened; a chunk is decoded
+    when it is requested. Pages are shared through the OS page cache, so
+    several worker processes opening the same file do not each hold a copy.
+    In a compressed store the last decompressed block is kept, so reading
+    the chunks of a block in turn decompresses it once.
+    """
+
+    def __init__(self, filepath: pathlib.Path):
+        self.filepath = pathlib.Path(filepath)
+        with open(self.filepath, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, block_size, count = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version not in (1, VERSION):
+            self._mm.close()
+            raise ValueError(f"Not a chunk store file: {self.filepath}")
+        self._count = count
+        self.block_size = block_size if version > 1 else 0
+        self._offsets_start = HEADER.size
+        self._blob_start = HEADER.size + (count + 1) * OFFSET.size
+        self._decompressor = None
+        self._block = (-1, b"")
+        self._block_lock = threading.Lock()  # Decompressors must not be shared by concurrent calls
+        if self.block_size:
+            self._decompressor = _zstd().ZstdDecompressor()
+            self._blocks_start = self._blob_start
+            blocks = (count + self.block_size - 1) // self.block_size
+            self._blob_start += (blocks + 1) * OFFSET.size
+
+    @property
+    def compression(self) -> str:
+        return "zstd" if self.block_size else "none"
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __bool__(self) -> bool:
+        return self._count > 0
+
+    def _offset(self, position: int) -> int:
+        return OFFSET.unpack_from(self._mm, self._offsets_start + position * OFFSET.size)[0]
+
+    def _read_block(self, block_id: int) -> bytes:
+        with self._block_lock:
+            if self._block[0] != block_id:
+                start, end = struct.unpack_from("<2Q", self._mm, self._blocks_start + block_id * OFFSET.size)
+                data = self._decompressor.decompress(self._mm[self._blob_start + start: self._blob_start + end])
+                self._block = (block_id, data)
+            return self._block[1]
+
+    def __getitem__(self, chunk_id: int) -> str:
+        chunk_id = int(chunk_id)
+        if chunk_id < 0 or chunk_id >= self._count:
+            raise IndexError(f"Chunk id {chunk_id} out of range")
+        start, end = struct.unpack_from("<2Q", self._mm, self._offsets_start + chunk_id * OFFSET.size)
+        if not self.block_size:
+            return self._mm[self._blob_start + start: self._blob_start + end].decode("utf-8")
+        block_id = chunk_id // self.block_size
+        base = self._offset(block_id * self.block_size)
+        return self._read_block(block_id)[start - base: end - base].decode("utf-8")
+
+    def __iter__(self) -> Iterator[str]:
+        for chunk_id in range(self._count):
+            yield self[chunk_id]
+
+    def close(self) -> None:
+        self._mm.close()
+
+
+def load_chunks(filepath: pathlib.Path) -> List[str]:
+    """
+    Reads every chunk of a chunk store, or of a JSON list of chunks when the
+    file has a .json suffix.
+    """
+    filepath = pathlib.Path(filepath)
+    if filepath.suffix == ".json":
+        with open(filepath, "r", encoding="utf-8") as f:
+            return json.load(f)
+    store = ChunkStore(filepath)
+    try:
+        return list(store)
+    finally:
+        store.close()
+
+
+def import_json(json_path: pathlib.Path, filepath: pathlib.Path, compression: str = "none",
+                block_size: int = DEFAULT_BLOCK_SIZE) -> int:
+    """
+    Converts a JSON list of chunks (the former output.json) to a chunk store.
+
+    Returns:
+        int: The number of chunks imported.
+    """
+    with open(json_path, "r", encoding="utf-8") as f:
+        chunks = json.load(f)
+    return write_chunk_store(chunks, filepath, compression, block_size)
+
+
+def export_json(filepath: pathlib.Path, json_path: pathlib.Path, indent: Optional[int] = 4) -> int:
+    """
+    Writes the chunks of a chunk store as a JSON list, for inspection or older tools.
+
+    Returns:
+        int: The number of chunks exported.
+    """
+    store = ChunkStore(filepath)
+    try:
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump(list(store), f, indent=indent)
+        return len(store)
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert between JSON chunk lists and binary chunk stores.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    import_parser = subparsers.add_parser("import", help="JSON list of chunks to chunk store")
+    import_parser.add_argument("json_file", type=pathlib.Path)
+    import_parser.add_argument("store_file", type=pathlib.Path)
+    import_parser.add_argument("--compression", choices=COMPRESSIONS, default="none")
+    import_parser.add_argument("--block-size", type=int, default=DEFAULT_BLOCK_SIZE)
+    export_parser = subparsers.add_parser("export", help="Chunk store to JSON list of chunks")
+    export_parser.add_argument("store_file", type=pathlib.Path)
+    export_parser.add_argument("json_file", type=pathlib.Path)
+    args = parser.parse_args()
+
+    if args.command == "import":
+        count = import_json(args.json_file, args.store_file, args.compression, args.block_size)
+        print(f"Imported {count} chunks into {args.store_file}")
+    else:
+        count = export_json(args.store_file, args.json_file)
+        print(f"Exported {count} chunks to {args.json_file}")
@@ -0,0 +1,241 @@
+import re
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+CHUNK_MODES = ("word", "token", "structure")
+
+# Structured text (see extract.extract_structured_text): blocks separated by blank lines,
+# headings written as "#"-prefixed lines.
+BLOCK_PATTERN = re.compile(r"[^\n]+(?:\n[^\n]+)*")
+HEADING_PATTERN = re.compile(r"(#{1,6}) +(.*)")
+
+
+@dataclass
+class Chunk:
+    """
+    A chunk of a document and where it comes from.
+
+    start and end are character offsets into the chunked text, so
+    text == document_text[start:end].
+    """
+
+    text: str
+    start: int
+    end: int
+    heading_path: Tuple[str, ...] = ()
+    source_url: Optional[str] = None
+    tokens: int = 0
+
+    def metadata(self) -> Dict[str, Any]:
+        return {
+            "source_url": self.source_url,
+            "start": self.start,
+            "end": self.end,
+            "heading_path": list(self.heading_path),
+            "tokens": self.tokens,
+        }
+
+
+SPACE, WORD, PUNCT = 0, 1, 2
+
+
+def _char_class(char: str) -> int:
+    if char.isspace():
+        return SPACE
+    if char.isalnum() or char == "_":
+        return WORD
+    return PUNCT
+
+
+_ASCII_CLASSES = np.array([_char_class(chr(code)) for code in range(128)], dtype=np.int8)
+_EMPTY = np.empty(0, dtype=np.int64)
+
+
+def char_classes(text: str) -> np.ndarray:
+    """
+    Classifies every character of text as SPACE, WORD or PUNCT in one vectorized pass.
+
+    The text is viewed as an array of code points, so indexes into the
+    result are string offsets. ASCII goes through a lookup table and each
+    distinct non-ASCII character is classified once.
+    """
+    codes = np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32)
+    classes = _ASCII_CLASSES[np.minimum(codes, 127)]
+    non_ascii = codes > 127
+    if non_ascii.any():
+        unique, inverse = np.unique(codes[non_ascii], return_inverse=True)
+        classes[non_ascii] = np.array([_char_class(chr(code)) for code in unique], dtype=np.int8)[inverse]
+    return classes
+
+
+def _run_spans(starts_mask: np.ndarray, ends_mask: np.ndarray, offset: int) -> Tuple[np.ndarray, np.ndarray]:
+    starts = np.flatnonzero(starts_mask)
+    if not len(starts):
+        return _EMPTY, _EMPTY
+    return starts + offset, np.flatnonzero(ends_mask) + 1 + offset
+
+
+def word_spans(text: str, offset: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Returns the start and end offsets of the whitespace-separated words of
+    text (the words of str.split), shifted by offset.
+    """
+    filled = char_classes(text) != SPACE
+    before = np.concatenate(([False], filled[:-1]))
+    after = np.concatenate((filled[1:], [False]))
+    return _run_spans(filled & ~before, filled & ~after, offset)
+
+
+def simple_token_spans(text: str, offset: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Returns the start and end offsets of approximate model tokens, shifted by
+    offset: runs of letters and digits, and every punctuation mark on its own.
+    """
+    classes = char_classes(text)
+    word = classes == WORD
+    token = classes != SPACE
+    word_before = np.concatenate(([False], word[:-1]))
+    word_after = np.concatenate((word[1:], [False]))
+    return _run_spans(token & ~(word & word_before), token & ~(word & word_after), offset)
+
+
+def tiktoken_token_spans(encoding_name: str = "cl100k_base") -> Callable[[str, int], Tuple[np.ndarray, np.ndarray]]:
+    """
+    Returns a span function that uses a tiktoken encoding, for exact BPE token counts.
+    """
+    import tiktoken
+
+    encoding = tiktoken.get_encoding(encoding_name)
+
+    def spans(text: str, offset: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+        tokens = encoding.encode(text, disallowed_special=())
+        if not tokens:
+            return _EMPTY, _EMPTY
+        _, starts = encoding.decode_with_offsets(tokens)
+        starts = np.array(starts, dtype=np.int64)
+        ends = np.append(starts[1:], len(text))
+        return starts + offset, ends + offset
+
+    return spans
+
+
+def window_chunks(text: str, starts: np.ndarray, ends: np.ndarray, chunk_size: int, overlap: int,
+                  heading_path: Tuple[str, ...] = (), source_url: Optional[str] = None) -> List[Chunk]:
+    """
+    Cuts overlapping windows of chunk_size units (words or tokens) in one pass.
+
+    Window boundaries are computed on the unit offsets with numpy and each
+    chunk is a slice of the original string, so nothing is re-joined.
+
+    Args:
+        text (str): The text the spans refer to.
+        starts (np.ndarray): Start offset of every unit.
+        ends (np.ndarray): End offset of every unit.
+        chunk_size (int): Units per chunk.
+        overlap (int): Units shared by consecutive chunks.
+
+    Returns:
+        List[Chunk]: The chunks, with the same windows as chunk.chunk_text.
+    """
+    n = len(starts)
+    if n == 0:
+        return []
+    first = np.arange(0, n, chunk_size - overlap)
+    last = np.minimum(first + chunk_size, n) - 1
+    chunk_starts = starts[first].tolist()
+    chunk_ends = ends[last].tolist()
+    counts = (last - first + 1).tolist()
+    return [
+        Chunk(text[a:b], a, b, heading_path, source_url, count)
+        for a, b, count in zip(chunk_starts, chunk_ends, counts)
+    ]
+
+
+def structure_chunks(text: str, chunk_size: int, overlap: int, spans=word_spans,
+                     source_url: Optional[str] = None) -> List[Chunk]:
+    """
+    Chunks structured text along its headings and paragraphs.
+
+    Consecutive paragraphs under the same heading are packed into a chunk
+    while they fit in chunk_size units; a heading always starts a new chunk
+    and a paragraph that is larger than chunk_size is split into windows.
+    Each chunk records the path of headings it sits under.
+
+    Args:
+        text (str): Text with blank-line separated blocks and "#" headings.
+        chunk_size (int): Maximum units per chunk.
+        overlap (int): Units shared by the windows of a split paragraph.
+        spans: The unit span function (word_spans or a token span function).
+
+    Returns:
+        List[Chunk]: The chunks.
+    """
+    chunks = []
+    headings: List[str] = []
+    pending = []  # (start, end) of the paragraphs waiting to be packed
+    pending_units = 0
+    starts, ends = spans(text)  # Unit offsets of the whole text, computed once
+
+    def flush():
+        nonlocal pending_units
+        if pending:
+            start, end = pending[0][0], pending[-1][1]
+            chunks.append(Chunk(text[start:end], start, end, tuple(headings), source_url, pending_units))
+            pending.clear()
+            pending_units = 0
+
+    for block in BLOCK_PATTERN.finditer(text):
+        heading = HEADING_PATTERN.fullmatch(block.group())
+        if heading:
+            flush()
+            level = len(heading.group(1))
+            del headings[level - 1:]
+            headings.extend([""] * (level - 1 - len(headings)))
+            headings.append(heading.group(2).strip())
+            continue
+
+        first, last = np.searchsorted(starts, (block.start(), block.end())).tolist()
+        units = last - first
+        if units == 0:
+            continue
+        if units > chunk_size:
+            flush()
+            chunks.extend(window_chunks(text, starts[first:last], ends[first:last], chunk_size, overlap,
+                                        tuple(headings), source_url))
+            continue
+        if pending_units + units > chunk_size:
+            flush()
+        pending.append((block.start(), block.end()))
+        pending_units += units
+    flush()
+    return chunks
+
+
+def chunk_document(text: str, mode: str = "word", chunk_size: int = 256, overlap: int = 32,
+                   source_url: Optional[str] = None, token_spans=simple_token_spans) -> List[Chunk]:
+    """
+    Chunks a document with the given mode.
+
+    Args:
+        text (str): The document text.
+        mode (str): "word" (whitespace words), "token" (model tokens) or
+            "structure" (heading/paragraph aware, counted in words).
+        chunk_size (int): Units per chunk.
+        overlap (int): Units shared by consecutive chunks.
+        source_url (Optional[str]): The URL recorded on every chunk.
+        token_spans: The token span function used by the "token" mode.
+
+    Returns:
+        List[Chunk]: The chunks with their metadata.
+    """
+    if mode == "word":
+        starts, ends = word_spans(text)
+        return window_chunks(text, starts, ends, chunk_size, overlap, source_url=source_url)
+    if mode == "token":
+        starts, ends = token_spans(text)
+        return window_chunks(text, starts, ends, chunk_size, overlap, source_url=source_url)
+    if mode == "structure":
+        return structure_chunks(text, chunk_size, overlap, word_spans, source_url)
+    raise ValueError(f"Unknown chunk mode: {mode}")
@@ -0,0 +1,197 @@
+import zlib
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from chunker import simple_token_spans
+from documents import split_chunk_id
+
+SEPARATOR = "\n---\n"
+_MINHASH_PRIME = (1 << 61) - 1
+
+
+@dataclass
+class Passage:
+    """One or more retrieved chunks of a document, merged into a continuous passage."""
+
+    text: str
+    rank: int
+    doc_id: int
+    positions: List[int]
+    start: Optional[int] = None
+    end: Optional[int] = None
+    chunk_ids: List[int] = field(default_factory=list)
+
+
+def count_tokens(text: str) -> int:
+    """Approximates the number of model tokens of a text (words and punctuation marks)."""
+    return len(simple_token_spans(text)[0])
+
+
+def truncate_to_tokens(text: str, budget: int) -> str:
+    """Returns the longest prefix of text with at most budget tokens, cut at a token boundary."""
+    _, ends = simple_token_spans(text)
+    if len(ends) <= budget:
+        return text
+    return text[:ends[budget - 1]] if budget > 0 else ""
+
+
+def _merge_words(left: str, right: str, max_overlap: int) -> Optional[str]:
+    """
+    Joins two consecutive chunks that share words at the seam (the chunk
+    overlap), or returns None if they do not overlap.
+    """
+    left_words, right_words = left.split(), right.split()
+    for n in range(min(max_overlap, len(left_words), len(right_words)), 0, -1):
+        if left_words[-n:] == right_words[:n]:
+            return " ".join(left_words + right_words[n:])
+    return None
+
+
+def merge_passages(retrieved: Sequence[Tuple[int, str]], metadata: Sequence[Optional[Dict[str, Any]]],
+                   max_overlap: int = 64) -> List[Passage]:
+    """
+    Merges retrieved chunks of the same document that overlap or touch.
+
+    Chunks with metadata are merged by their character offsets, so the
+    overlapping text is kept once. Chunks without metadata (indexed before
+    offsets were recorded) are merged when they are consecutive in their
+    document and share words at the seam.
+
+    Args:
+        retrieved (Sequence[Tuple[int, str]]): (chunk id, text) pairs, best first.
+        metadata (Sequence[Optional[Dict[str, Any]]]): The metadata of each chunk, or None.
+        max_overlap (int): The largest word overlap looked for between chunks without metadata.
+
+    Returns:
+        List[Passage]: The passages, ordered by the best rank of their chunks.
+    """
+    by_document: Dict[int, List[Passage]] = {}
+    for rank, ((chunk_id, text), meta) in enumerate(zip(retrieved, metadata)):
+        doc_id, position = split_chunk_id(chunk_id)
+        start = meta.get("start") if meta else None
+        end = meta.get("end") if meta else None
+        by_document.setdefault(doc_id, []).append(Passage(text, rank, doc_id, [position], start, end, [chunk_id]))
+
+    passages = []
+    for parts in by_document.values():
+        parts.sort(key=lambda p: p.positions[0])
+        current = parts[0]
+        for part in parts[1:]:
+            merged = None
+            if current.end is not None and part.start is not None:
+                gap = part.start - current.end
+                if part.end <= current.end:  # Contained in the passage
+                    merged = current.text
+                elif gap <= 0:  # Overlapping: keep the shared characters once
+                    merged = current.text + part.text[-gap:]
+                elif gap <= 2:  # Adjacent: separated by a space or a paragraph break
+                    merged = current.text + (" " if gap == 1 else "\n\n") + part.text
+            elif part.positions[0] == current.positions[-1] + 1:
+                merged = _merge_words(current.text, part.text, max_overlap)
+            if merged is None:
+                passages.append(current)
+                current = part
+                continue
+            current = Passage(merged, min(current.rank, part.rank), current.doc_id,
+                              current.positions + part.positions, current.start,
+                              max(current.end, part.end) if current.end is not None else None,
+                              current.chunk_ids + part.chunk_ids)
+        passages.append(current)
+    return sorted(passages, key=lambda p: p.rank)
+
+
+def minhash_signature(text: str, num_perm: int = 64, shingle: int = 3, seed: int = 1) -> np.ndarray:
+    """
+    Returns the MinHash signature of the word shingles of a text. The share
+    of equal values between two signatures estimates their Jaccard similarity.
+    """
+    words = text.lower().split()
+    shingles = {" ".join(words[i:i + shingle]) for i in range(max(1, len(words) - shingle + 1))}
+    hashes = np.array([zlib.crc32(s.encode("utf-8")) for s in shingles], dtype=np.uint64)
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, _MINHASH_PRIME, num_perm, dtype=np.uint64)
+    b = rng.integers(0, _MINHASH_PRIME, num_perm, dtype=np.uint64)
+    # a * h + b wraps around in uint64, which still gives independent enough permutations for MinHash
+    return ((np.outer(a, hashes) + b[:, None]) % np.uint64(_MINHASH_PRIME)).min(axis=1)
+
+
+def drop_near_duplicates(passages: List[Passage], threshold: float) -> Tuple[List[Passage], int]:
+    """
+    Drops passages whose estimated Jaccard similarity with a better ranked
+    passage reaches threshold.
+
+    Returns:
+        Tuple[List[Passage], int]: The kept passages and the number dropped.
+    """
+    kept, signatures = [], []
+    for passage in passages:
+        signature = minhash_signature(passage.text)
+        if any(np.mean(signature == other) >= threshold for other in signatures):
+            continue
+        kept.append(passage)
+        signatures.append(signature)
+    return kept, len(passages) - len(kept)
+
+
+def assemble_context(retrieved: Sequence[Tuple[int, str]], chunks=None, token_budget: int = 0,
+                     merge: bool = True, dedup_threshold: float = 0.0) -> Tuple[str, Dict[str, int]]:
+    """
+    Turns the retrieved chunks into the "responses" section of the prompt.
+
+    Overlapping and adjacent chunks of a document are merged, near-duplicate
+    passages are dropped and the passages are packed, best first, into the
+    token budget (the last one that does not fit is truncated).
+
+    Args:
+        retrieved (Sequence[Tuple[int, str]]): (chunk id, text) pairs, best first.
+        chunks: The resident chunks; their metadata (offsets) is used when they have any.
+        token_budget (int): The maximum number of context tokens, 0 for no limit.
+        merge (bool): Whether to merge overlapping and adjacent chunks.
+        dedup_threshold (float): The Jaccard similarity from which a passage is dropped, 0 to keep all.
+
+    Returns:
+        Tuple[str, Dict[str, int]]: The context and its statistics, including
+        the tokens saved compared with joining every retrieved chunk.
+    """
+    get_metadata = getattr(chunks, "metadata", None)
+    metadata = [get_metadata(chunk_id) if get_metadata else None for chunk_id, _ in retrieved]
+    tokens_before = count_tokens(SEPARATOR.join(text for _, text in retrieved))
+
+    if merge:
+        passages = merge_passages(retrieved, metadata)
+    else:
+        passages = []
+        for rank, (chunk_id, text) in enumerate(retrieved):
+            doc_id, position = split_chunk_id(chunk_id)
+            passages.append(Passage(text, rank, doc_id, [position], chunk_ids=[chunk_id]))
+    merged = len(retrieved) - len(passages)
+    duplicates = 0
+    if dedup_threshold > 0:
+        passages, duplicates = drop_near_duplicates(passages, dedup_threshold)
+
+    packed, used, truncated = [], 0, 0
+    for passage in passages:
+        tokens = count_tokens(passage.text)
+        if token_budget and used + tokens > token_budget:
+            remaining = token_budget - used
+            if remaining > 0:
+                packed.append(truncate_to_tokens(passage.text, remaining))
+                truncated += 1
+            break
+        packed.append(passage.text)
+        used += tokens
+
+    context = SEPARATOR.join(packed)
+    tokens_after = count_tokens(context)
+    return context, {
+        "chunks": len(retrieved),
+        "passages": len(packed),
+        "merged": merged,
+        "duplicates": duplicates,
+        "truncated": truncated,
+        "tokens_before": tokens_before,
+        "tokens_after": tokens_after,
+        "tokens_saved": tokens_before - tokens_after,
+    }
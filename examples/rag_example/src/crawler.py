@@ -0,0 +1,223 @@
+import json
+import os
+import pathlib
+import threading
+import time
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, Iterator, List, Optional
+from urllib.parse import urlsplit
+
+from settings import get_config
+from telemetry import in_context, span
+
+config = get_config()
+crawl_concurrency = config.get("crawl_concurrency", 8)
+crawl_per_host_concurrency = config.get("crawl_per_host_concurrency", 4)
+http_timeout = config.get("http_timeout_seconds", 30)
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session() -> "requests.Session":
+    """
+    Returns the process-wide HTTP session. Its connection pool is sized for
+    the crawler's concurrency, so connections to a host are kept alive and reused.
+    requests is imported here, on first use, so modules that never fetch a
+    page do not pay for it.
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=crawl_concurrency, pool_maxsize=crawl_concurrency)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                session.headers.update({"Accept-Encoding": "gzip, deflate"})
+                _session = session
+    return _session
+
+
+class ValidatorStore:
+    """
+    Remembers the ETag and Last-Modified of every fetched URL, so the next
+    crawl can send conditional GETs and skip pages that did not change.
+
+    Args:
+        filepath (pathlib.Path): The JSON file the validators are kept in.
+    """
+
+    def __init__(self, filepath: pathlib.Path):
+        self.filepath = pathlib.Path(filepath)
+        self._lock = threading.Lock()
+        try:
+            with open(self.filepath, "r", encoding="utf-8") as f:
+                self._validators = json.load(f)
+        except FileNotFoundError:
+            self._validators = {}
+
+    def headers(self, url: str) -> Dict[str, str]:
+        """Returns the conditional request headers for a URL."""
+        with self._lock:
+            validators = self._validators.get(url, {})
+        headers = {}
+        if validators.get("etag"):
+            headers["If-None-Match"] = validators["etag"]
+        if validators.get("last_modified"):
+            headers["If-Modified-Since"] = validators["last_modified"]
+        return headers
+
+    def update(self, url: str, etag: Optional[str], last_modified: Optional[str]) -> None:
+        with self._lock:
+            self._validators[url] = {"etag": etag, "last_modified": last_modified}
+
+    def save(self) -> None:
+        """Writes the validators atomically."""
+        self.filepath.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.filepath.with_name(self.filepath.name + ".tmp")
+        with self._lock:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self._validators, f, indent=4)
+        os.replace(tmp_path, self.filepath)
+
+
+@dataclass
+class FetchResult:
+    url: str
+    status: int = 0
+    html: str = ""
+    bytes: int = 0
+    not_modified: bool = False
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    error: Optional[str] = None
+
+
+@dataclass
+class CrawlStats:
+    pages: int = 0
+    not_modified: int = 0
+    errors: int = 0
+    bytes: int = 0
+    started: float = field(default_factory=time.perf_counter)
+    seconds: float = 0.0
+
+    def as_dict(self) -> Dict[str, float]:
+        return {
+            "pages": self.pages,
+            "not_modified": self.not_modified,
+            "errors": self.errors,
+            "bytes": self.bytes,
+            "seconds": self.seconds,
+            "pages_per_second": (self.pages + self.not_modified) / self.seconds if self.seconds else 0.0,
+        }
+
+
+def fetch_page(url: str, validators: Optional[ValidatorStore] = None, timeout: float = http_timeout) -> FetchResult:
+    """
+    Fetches one page through the shared session, with a conditional GET when
+    validators are known for the URL.
+
+    Args:
+        url (str): The URL to fetch.
+        validators (Optional[ValidatorStore]): The ETag/Last-Modified store.
+        timeout (float): Connect and read timeout in seconds.
+
+    Returns:
+        FetchResult: The page, or not_modified / error set.
+    """
+    import requests
+
+    headers = validators.headers(url) if validators is not None else {}
+    try:
+        response = get_session().get(url, headers=headers, timeout=timeout)
+        if response.status_code == 304:
+            return FetchResult(url, status=304, not_modified=True)
+        response.raise_for_status()
+        return FetchResult(
+            url,
+            status=response.status_code,
+            html=response.text,
+            bytes=len(response.content),
+            etag=response.headers.get("ETag"),
+            last_modified=response.headers.get("Last-Modified"),
+        )
+    except requests.exceptions.RequestException as e:
+        return FetchResult(url, error=str(e))
+
+
+def expand_sitemap(url: str, timeout: float = http_timeout) -> List[str]:
+    """
+    Returns the page URLs listed in a sitemap (nested sitemap indexes are followed).
+
+    Args:
+        url (str): The URL of the sitemap XML.
+
+    Returns:
+        List[str]: The page URLs, in sitemap order.
+    """
+    response = get_session().get(url, timeout=timeout)
+    response.raise_for_status()
+    root = ET.fromstring(response.content)
+    namespace = root.tag.split("}")[0] + "}" if root.tag.startswith("{") else ""
+    locations = [loc.text.strip() for loc in root.iter(f"{namespace}loc") if loc.text]
+    if root.tag == f"{namespace}sitemapindex":
+        return [page for sitemap in locations for page in expand_sitemap(sitemap, timeout)]
+    return locations
+
+
+def iter_crawl(urls: Iterable[str], validators: Optional[ValidatorStore] = None, stats: Optional[CrawlStats] = None,
+               concurrency: int = crawl_concurrency, per_host: int = crawl_per_host_concurrency,
+               timeout: float = http_timeout) -> Iterator[FetchResult]:
+    """
+    Fetches URLs concurrently and yields each result as soon as it is available.
+
+    At most `concurrency` requests are in flight overall and at most
+    `per_host` per host. Pages that did not change since the last crawl
+    come back as not_modified with no body.
+
+    Args:
+        urls (Iterable[str]): The URLs to fetch; duplicates are fetched once.
+        validators (Optional[ValidatorStore]): The ETag/Last-Modified store.
+        stats (Optional[CrawlStats]): Counters updated as pages arrive.
+        concurrency (int): Maximum requests in flight.
+        per_host (int): Maximum requests in flight per host.
+        timeout (float): Connect and read timeout in seconds.
+
+    Yields:
+        FetchResult: One result per URL, in completion order.
+    """
+    stats = stats if stats is not None else CrawlStats()
+    host_limits = {}
+    host_lock = threading.Lock()
+
+    def fetch(url):
+        host = urlsplit(url).netloc
+        with host_lock:
+            limit = host_limits.setdefault(host, threading.BoundedSemaphore(per_host))
+        with limit, span("parse.fetch", items=1) as fetched:
+            result = fetch_page(url, validators, timeout)
+            fetched.set(bytes=result.bytes)
+            if result.error:
+                fetched.fail(result.error)
+            return result
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        futures = [pool.submit(in_context(fetch), url) for url in dict.fromkeys(urls)]
+        for future in as_completed(futures):
+            result = future.result()
+            if result.error:
+                stats.errors += 1
+            elif result.not_modified:
+                stats.not_modified += 1
+            else:
+                stats.pages += 1
+                stats.bytes += result.bytes
+            stats.seconds = time.perf_counter() - stats.started
+            yield result
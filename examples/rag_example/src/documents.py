@@ -0,0 +1,141 @@
+import json
+import os
+import pathlib
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from chunk_store import ChunkStore
+
+# A chunk id is (doc_id << DOC_ID_SHIFT) | position, so the ids of a document
+# form one contiguous range that can be removed from the index in one call.
+DOC_ID_SHIFT = 20
+MAX_CHUNKS_PER_DOCUMENT = 1 << DOC_ID_SHIFT
+
+
+def chunk_id(doc_id: int, position: int) -> int:
+    """Returns the stable chunk id of the chunk at the given position of a document."""
+    return (doc_id << DOC_ID_SHIFT) | position
+
+
+def split_chunk_id(chunk_id: int) -> Tuple[int, int]:
+    """Returns the (doc_id, position) encoded in a chunk id."""
+    return chunk_id >> DOC_ID_SHIFT, chunk_id & (MAX_CHUNKS_PER_DOCUMENT - 1)
+
+
+def document_id_range(doc_id: int) -> Tuple[int, int]:
+    """Returns the [start, end) range of chunk ids reserved for a document."""
+    return chunk_id(doc_id, 0), chunk_id(doc_id + 1, 0)
+
+
+def load_manifest(filepath: pathlib.Path) -> Dict:
+    """
+    Reads the document manifest that maps each ingested URL to its document id,
+    version and chunk store file.
+
+    Returns:
+        Dict: The manifest, or an empty one if the file does not exist.
+    """
+    try:
+        with open(filepath, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"next_doc_id": 0, "documents": {}}
+
+
+def save_manifest(manifest: Dict, filepath: pathlib.Path) -> None:
+    """Writes the document manifest atomically."""
+    filepath = pathlib.Path(filepath)
+    filepath.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = filepath.with_name(filepath.name + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=4)
+    os.replace(tmp_path, filepath)
+
+
+def retire_files(manifest: Dict, files: List[str]) -> None:
+    """
+    Records files that the manifest no longer references. They are not
+    deleted yet: a query that started on the previous snapshot may still
+    open them, since DocumentChunks opens each chunk store on first use.
+    """
+    now = time.time()
+    manifest.setdefault("retired", []).extend({"file": name, "retired_at": now} for name in files)
+
+
+def purge_retired_files(manifest: Dict, directory: pathlib.Path, grace_seconds: float) -> None:
+    """
+    Deletes the retired files of the manifest that were retired more than
+    grace_seconds ago, by which time every reader has loaded a newer
+    manifest, and forgets them.
+    """
+    cutoff = time.time() - grace_seconds
+    kept = []
+    for retired in manifest.get("retired", []):
+        if retired["retired_at"] <= cutoff:
+            (pathlib.Path(directory) / retired["file"]).unlink(missing_ok=True)
+        else:
+            kept.append(retired)
+    manifest["retired"] = kept
+
+
+class DocumentChunks:
+    """
+    Read-only view of the chunks of every ingested document, addressed by chunk id.
+
+    Each document has its own memory-mapped chunk store, opened the first
+    time one of its chunks is requested.
+
+    Args:
+        manifest (Dict): The document manifest.
+        chunks_dir (pathlib.Path): The directory holding the per-document chunk stores.
+    """
+
+    def __init__(self, manifest: Dict, chunks_dir: pathlib.Path):
+        self.chunks_dir = pathlib.Path(chunks_dir)
+        self._files = {}
+        self._metadata_files = {}
+        self._count = 0
+        for document in manifest["documents"].values():
+            self._files[document["doc_id"]] = document["chunk_file"]
+            if document.get("metadata_file"):
+                self._metadata_files[document["doc_id"]] = document["metadata_file"]
+            self._count += document["chunks"]
+        self._stores = {}
+        self._metadata: Dict[int, List[Dict[str, Any]]] = {}
+
+    def _store(self, doc_id: int) -> Optional[ChunkStore]:
+        store = self._stores.get(doc_id)
+        if store is None and doc_id in self._files:
+            store = ChunkStore(self.chunks_dir / self._files[doc_id])
+            self._stores[doc_id] = store
+        return store
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __bool__(self) -> bool:
+        return self._count > 0
+
+    def __getitem__(self, chunk_id: int) -> str:
+        doc_id, position = split_chunk_id(int(chunk_id))
+        store = self._store(doc_id)
+        if store is None:
+            raise KeyError(f"Chunk id {chunk_id} does not belong to an ingested document")
+        return store[position]
+
+    def __iter__(self) -> Iterator[str]:
+        for doc_id in sorted(self._files):
+            yield from self._store(doc_id)
+
+    def metadata(self, chunk_id: int) -> Optional[Dict[str, Any]]:
+        """
+        Returns the metadata of a chunk (source URL, character offsets, heading
+        path), or None if its document was indexed without metadata.
+        """
+        doc_id, position = split_chunk_id(int(chunk_id))
+        if doc_id not in self._metadata_files:
+            return None
+        if doc_id not in self._metadata:
+            with open(self.chunks_dir / self._metadata_files[doc_id], "r", encoding="utf-8") as f:
+                self._metadata[doc_id] = json.load(f)
+        return self._metadata[doc_id][position]
@@ -1,29 +1,45 @@
 import json
-import os
 import pathlib
 import numpy as np
-import google.generativeai as genai
-from typing import List
-import yaml
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import Iterable, Iterator, List, Optional, Tuple
 
-GOOGLE_API_KEY = os.environ.get('GOOGLE_DEV_API')
+from chunk_store import load_chunks
+from embed_cache import EmbeddingCache, cache_key
+from embed_engine import EmbeddingEngine, get_embedding_backend
+from settings import get_config
+from telemetry import in_context
+from vectors import as_float32, encode_vectors, scale_path, vector_dtype
+from workspace import RunWorkspace, atomic_write
 
-def load_config(config_file="rag_config.yml"):
+config = get_config()
+embedding_model = config["embedding_model"]
+
+_engines = {}
+
+def get_embedding_engine(model_name: str = embedding_model) -> EmbeddingEngine:
     """
-    Loads configuration from a YAML file.
+    Returns the embedding engine for the given model, built once from the
+    embedding_* settings in rag_config.yml.
 
     Args:
-        config_file (str): The path to the configuration file.
+        model_name (str): The name of the embedding model.
 
     Returns:
-        dict: The configuration parameters.
+        EmbeddingEngine: The batching, rate-limited embedding engine.
     """
-    with open(config_file, "r") as file:
-        config = yaml.safe_load(file)
-    return config
-
-config = load_config()
-embedding_model = config["embedding_model"]
+    if model_name not in _engines:
+        backend = get_embedding_backend(config.get("embedding_backend", "gemini"), model_name, retries=0)
+        _engines[model_name] = EmbeddingEngine(
+            backend,
+            batch_size=config.get("embedding_batch_size", 100),
+            concurrency=config.get("embedding_concurrency", 4),
+            qps=config.get("embedding_qps", 0),
+            max_retries=config.get("embedding_max_retries", 3),
+        )
+    return _engines[model_name]
 
 def embed_text(text: List[str], model_name: str = embedding_model) -> np.ndarray:
     """
@@ -34,44 +50,154 @@ def embed_text(text: List[str], model_name: str = embedding_model) -> np.ndarray
         model_name (str): The name of the embedding model.
 
     Returns:
-        np.ndarray: The embeddings as a NumPy array.
+        np.ndarray: The embeddings as a float32 NumPy array, one row per text.
+    """
+    return get_embedding_engine(model_name).embed(text)
+
+_cache = None
+
+def get_embedding_cache() -> EmbeddingCache:
+    """
+    Returns the persistent embedding cache in temp/embeddings, bounded by
+    embedding_cache_max_mb from rag_config.yml. It is opened once per process.
+    """
+    global _cache
+    if _cache is None:
+        current_dir = pathlib.Path().parent.resolve()
+        max_mb = config.get("embedding_cache_max_mb", 512)
+        _cache = EmbeddingCache(current_dir / "temp" / "embeddings" / "cache.sqlite", max_bytes=int(max_mb * 1024 * 1024))
+    return _cache
+
+def embed_chunks_cached(chunks: List[str], cache: EmbeddingCache, model_name: str = embedding_model) -> np.ndarray:
+    """
+    Embeds chunks, calling the embedding API only for chunks that are not in the cache.
+
+    Args:
+        chunks (List[str]): The chunks to embed.
+        cache (EmbeddingCache): The cache to read from and write the new vectors to.
+        model_name (str): The name of the embedding model.
+
+    Returns:
+        np.ndarray: The embeddings as a float32 NumPy array, one row per chunk.
+    """
+    keys = [cache_key(chunk, model_name) for chunk in chunks]
+    cached = cache.get_many(keys)
+
+    missing = {}
+    for key, chunk in zip(keys, chunks):
+        if key not in cached and key not in missing:
+            missing[key] = chunk
+    if missing:
+        vectors = embed_text(list(missing.values()), model_name)
+        new = dict(zip(missing.keys(), vectors))
+        cache.put_many(new)
+        cached.update(new)
+
+    if not keys:
+        return np.empty((0, 0), dtype=np.float32)
+    return as_float32([cached[key] for key in keys])
+
+def embed_chunks(chunks: List[str], model_name: str = embedding_model) -> np.ndarray:
+    """
+    Embeds chunks in memory, going through the embedding cache when it is enabled.
+
+    Args:
+        chunks (List[str]): The chunks to embed.
+        model_name (str): The name of the embedding model.
+
+    Returns:
+        np.ndarray: The embeddings as a float32 NumPy array, one row per chunk.
+    """
+    if config.get("embedding_cache", True):
+        cache = get_embedding_cache()
+        embeddings = embed_chunks_cached(chunks, cache, model_name)
+        print(f"Embedding cache: {cache.stats()}")
+        return embeddings
+    return embed_text(chunks, model_name)
+
+def iter_embed_chunks(chunks: Iterable[str], model_name: str = embedding_model) -> Iterator[Tuple[str, np.ndarray]]:
     """
-    genai.configure(api_key=GOOGLE_API_KEY)
-    embeddings = genai.embed_content(model=model_name, content=text)
-    return np.array(embeddings["embedding"])
+    Embeds a stream of chunks, starting on each batch as soon as it is full.
 
-def read_embed_chunks(json_name: str = "output.json", embedding_file: str = "embeddings_file.npy", model_name: str = embedding_model) -> None:
+    Up to embedding_concurrency batches are in flight at once; the pairs are
+    yielded in input order, so only a bounded number of chunks is buffered.
+
+    Args:
+        chunks (Iterable[str]): The chunks to embed, e.g. from chunk.iter_chunks.
+        model_name (str): The name of the embedding model.
+
+    Yields:
+        Tuple[str, np.ndarray]: Each chunk with its float32 embedding.
+    """
+    engine = get_embedding_engine(model_name)
+    use_cache = config.get("embedding_cache", True)
+
+    def embed_batch(batch):
+        if use_cache:
+            return embed_chunks_cached(batch, get_embedding_cache(), model_name)
+        return embed_text(batch, model_name)
+
+    chunks = iter(chunks)
+    in_flight = deque()
+    with ThreadPoolExecutor(max_workers=engine.concurrency) as pool:
+        while True:
+            batch = list(islice(chunks, engine.batch_size))
+            if batch:
+                in_flight.append((batch, pool.submit(in_context(embed_batch), batch)))
+            if in_flight and (not batch or len(in_flight) >= engine.concurrency):
+                done_batch, future = in_flight.popleft()
+                yield from zip(done_batch, future.result())
+            if not batch and not in_flight:
+                break
+
+def read_embed_chunks(chunks_name: str = "output.bin", embedding_file: str = "embeddings_file.npy", model_name: str = embedding_model,
+                      run_id: Optional[str] = None) -> bool:
     """
-    Reads chunks from a JSON file, embeds them, and saves the embeddings to a file.
+    Reads chunks from the chunk store, embeds them, and saves the embeddings to a file
+    in the vector_dtype of rag_config.yml (see vectors.py).
+    Chunks already in the embedding cache are not sent to the API again.
 
     Args:
-        json_name (str): The name of the JSON file containing the chunks.
+        chunks_name (str): The name of the chunk store (or JSON file) containing the chunks.
         embedding_file (str): The name of the file to save the embeddings.
         model_name (str): The name of the embedding model.
+        run_id (Optional[str]): The ingestion run whose chunks are embedded (see workspace.py).
+
+    Returns:
+        bool: Whether the embeddings were saved.
     """
-    current_dir = pathlib.Path().parent.resolve()
-    json_file = current_dir / "temp" / "chunks" / json_name
-    e_file = current_dir / "temp" / "embeddings" / embedding_file
+    workspace = RunWorkspace(run_id)
+    if not workspace.ready("chunk"):
+        print(f"Run {run_id} has no chunks.")
+        return False
+    chunks_file = workspace.chunks_dir / chunks_name
+    e_file = workspace.embeddings_dir / embedding_file
 
     try:
-        with open(json_file, "r", encoding="utf-8") as f:
-            chunks = json.load(f)
+        chunks = load_chunks(chunks_file)
     except FileNotFoundError:
-        print(f"File not found: {json_file}")
-        return
+        print(f"File not found: {chunks_file}")
+        return False
     except json.JSONDecodeError as e:
-        print(f"Error decoding JSON from {json_file}: {e}")
-        return
+        print(f"Error decoding JSON from {chunks_file}: {e}")
+        return False
     except Exception as e:
-        print(f"Error reading {json_file}: {e}")
-        return
+        print(f"Error reading {chunks_file}: {e}")
+        return False
 
     try:
-        embeddings = embed_text(chunks, model_name)
-        np.save(e_file, embeddings, allow_pickle=False)  # Use np.save for binary format (recommended)
+        stored, scale = encode_vectors(embed_chunks(chunks, model_name), vector_dtype)
+        if scale is not None:
+            with atomic_write(scale_path(e_file), "wb") as f:
+                np.save(f, scale, allow_pickle=False)
+        with atomic_write(e_file, "wb") as f:
+            np.save(f, stored, allow_pickle=False)  # Use np.save for binary format (recommended)
+        workspace.mark_done("embed")
         print(f"ndarray successfully written to: {e_file}")
+        return True
     except Exception as e:
         print(f"Error writing ndarray to {e_file}: {e}")
+        return False
 
 if __name__ == "__main__":
     try:
@@ -0,0 +1,125 @@
+import hashlib
+import pathlib
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+
+def cache_key(text: str, model_name: str) -> str:
+    """
+    Returns the content address of a chunk: a hash of the embedding model and the text.
+    """
+    h = hashlib.sha256()
+    h.update(model_name.encode("utf-8"))
+    h.update(b"\0")
+    h.update(text.encode("utf-8"))
+    return h.hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Persistent, content-addressed embedding cache stored in SQLite.
+
+    Vectors are stored as raw float32 blobs keyed by cache_key(). When the
+    stored vectors exceed max_bytes the least recently used entries are
+    evicted. Hit and miss counts are kept for the lifetime of the object.
+
+    Args:
+        filepath (pathlib.Path): The SQLite database file.
+        max_bytes (int): Size bound for the stored vectors, 0 for unbounded.
+    """
+
+    def __init__(self, filepath: pathlib.Path, max_bytes: int = 0):
+        self.filepath = pathlib.Path(filepath)
+        self.filepath.parent.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.filepath), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key TEXT PRIMARY KEY, vector BLOB NOT NULL, size INTEGER NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+        self._conn.commit()
+
+    def get_many(self, keys: List[str]) -> Dict[str, np.ndarray]:
+        """
+        Looks up several keys at once and marks the hits as recently used.
+
+        Returns:
+            Dict[str, np.ndarray]: The cached float32 vectors of the keys that were found.
+        """
+        found = {}
+        unique = list(dict.fromkeys(keys))
+        with self._lock:
+            for i in range(0, len(unique), 500):  # Stay under SQLite's host parameter limit
+                part = unique[i: i + 500]
+                marks = ",".join("?" * len(part))
+                rows = self._conn.execute(f"SELECT key, vector FROM embeddings WHERE key IN ({marks})", part)
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32)
+                self._conn.execute(
+                    f"UPDATE embeddings SET last_used = ? WHERE key IN ({marks})", [time.time(), *part]
+                )
+            self._conn.commit()
+        self.hits += sum(1 for key in keys if key in found)
+        self.misses += sum(1 for key in keys if key not in found)
+        return found
+
+    def put_many(self, items: Dict[str, np.ndarray]) -> None:
+        """
+        Stores vectors under their keys, then evicts old entries if the cache is over its bound.
+        """
+        now = time.time()
+        rows = []
+        for key, vector in items.items():
+            blob = np.ascontiguousarray(vector, dtype=np.float32).tobytes()
+            rows.append((key, blob, len(blob), now))
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, size, last_used) VALUES (?, ?, ?, ?)", rows
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self) -> None:
+        if not self.max_bytes:
+            return
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM embeddings").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        doomed = []
+        for key, size in self._conn.execute("SELECT key, size FROM embeddings ORDER BY last_used"):
+            if total <= self.max_bytes:
+                break
+            doomed.append((key,))
+            total -= size
+        self._conn.executemany("DELETE FROM embeddings WHERE key = ?", doomed)
+        self.evictions += len(doomed)
+
+    def stats(self) -> Dict[str, Optional[float]]:
+        """
+        Returns hit/miss counters and the current size of the cache.
+        """
+        with self._lock:
+            entries, size = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM embeddings").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else None,
+            "evictions": self.evictions,
+            "entries": entries,
+            "bytes": size,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,161 @@
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional
+
+import numpy as np
+
+from providers import MockProvider, get_provider
+from telemetry import in_context, span
+from vectors import as_float32
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket used to cap the request rate to the embedding API.
+
+    Args:
+        rate (float): Tokens added per second (the sustained QPS). 0 disables the limit.
+        capacity (Optional[float]): Maximum burst size, defaults to one second of tokens.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """Blocks until one token is available."""
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class ProviderEmbeddingBackend:
+    """
+    Embeds batches of text through a shared provider (see providers.py).
+
+    Args:
+        provider (Provider): The shared provider.
+        model_name (str): The name of the embedding model.
+        retries (Optional[int]): Overrides the provider's retries. EmbeddingEngine
+            backends use 0, since the engine retries a failed batch itself after
+            taking a new token from its rate limiter.
+    """
+
+    def __init__(self, provider, model_name: str, retries: Optional[int] = None):
+        self.provider = provider
+        self.model_name = model_name
+        self.retries = retries
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        return self.provider.embed(texts, self.model_name, retries=self.retries)
+
+
+class GeminiEmbeddingBackend(ProviderEmbeddingBackend):
+    """Embeds batches of text with the Gemini embedding endpoint of the shared Gemini provider."""
+
+    def __init__(self, model_name: str, retries: Optional[int] = None):
+        super().__init__(get_provider("gemini"), model_name, retries)
+
+
+class FakeEmbeddingBackend(ProviderEmbeddingBackend):
+    """
+    Deterministic local embedding backend for offline runs and benchmarks,
+    backed by its own mock provider.
+
+    Args:
+        dim (int): Dimension of the generated vectors.
+        latency (float): Simulated seconds per request.
+    """
+
+    def __init__(self, model_name: str = "fake", dim: int = 768, latency: float = 0.0):
+        super().__init__(MockProvider(dim=dim, embed_latency=latency), model_name, retries=0)
+
+
+def get_embedding_backend(name: str, model_name: str, retries: Optional[int] = None):
+    """
+    Returns the embedding backend registered under the given name ("gemini" or
+    "fake", which uses the shared mock provider).
+    """
+    if name == "gemini":
+        return GeminiEmbeddingBackend(model_name, retries)
+    if name == "fake":
+        return ProviderEmbeddingBackend(get_provider("mock"), model_name, retries)
+    raise ValueError(f"Unknown embedding backend: {name}")
+
+
+class EmbeddingEngine:
+    """
+    Splits texts into batches and embeds them concurrently under a rate limit.
+
+    Batches are submitted to a thread pool; each request first takes a token
+    from the bucket and failed requests are retried with exponential backoff.
+    The output rows are in the same order as the input texts.
+
+    Args:
+        backend: An object with an embed(List[str]) -> List[List[float]] method.
+        batch_size (int): Maximum number of texts per request.
+        concurrency (int): Maximum number of requests in flight.
+        qps (float): Maximum requests per second, 0 for no limit.
+        max_retries (int): Retries per batch before the error is raised.
+        backoff (float): Initial backoff in seconds, doubled after every failure.
+    """
+
+    def __init__(self, backend, batch_size: int = 100, concurrency: int = 4, qps: float = 0,
+                 max_retries: int = 3, backoff: float = 1.0, sleep: Callable[[float], None] = time.sleep):
+        self.backend = backend
+        self.batch_size = max(1, batch_size)
+        self.concurrency = max(1, concurrency)
+        self.bucket = TokenBucket(qps)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self._sleep = sleep
+
+    def _embed_batch(self, batch: List[str]) -> List[List[float]]:
+        with span("embed.batch", items=len(batch), bytes=sum(len(text.encode("utf-8")) for text in batch)):
+            attempt = 0
+            while True:
+                self.bucket.acquire()
+                try:
+                    return self.backend.embed(batch)
+                except Exception as e:
+                    if attempt >= self.max_retries:
+                        raise
+                    delay = self.backoff * (2 ** attempt) * (1 + random.random() * 0.1)
+                    print(f"Embedding batch failed ({e}), retrying in {delay:.2f}s")
+                    self._sleep(delay)
+                    attempt += 1
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """
+        Embeds the given texts.
+
+        Args:
+            texts (List[str]): The texts to embed.
+
+        Returns:
+            np.ndarray: A (len(texts), dim) float32 array, in input order.
+        """
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+        batches = [texts[i: i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        if len(batches) == 1 or self.concurrency == 1:
+            results = [self._embed_batch(batch) for batch in batches]
+        else:
+            with ThreadPoolExecutor(max_workers=min(self.concurrency, len(batches))) as pool:
+                results = list(pool.map(in_context(self._embed_batch), batches))  # map keeps batch order
+        rows = [row for batch in results for row in batch]
+        return as_float32(rows)
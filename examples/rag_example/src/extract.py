@@ -0,0 +1,186 @@
+from typing import Callable, Dict
+
+from settings import get_config
+
+config = get_config()
+html_extractor = config.get("html_extractor", "auto")
+chunk_mode = config.get("chunk_mode", "word")
+
+# Page chrome removed by the fast extractors before the text is collected.
+BOILERPLATE_TAGS = ["script", "style", "noscript", "template", "nav", "header", "footer", "aside"]
+# Containers holding the page content, tried in order; the body is used when none matches.
+MAIN_CONTENT_SELECTORS = ["#main-content", "main", "[role=main]", "article", "#content"]
+_MAIN_CONTENT_XPATHS = ["//*[@id='main-content']", "//main", "//*[@role='main']", "//article", "//*[@id='content']"]
+HEADING_TAGS = {"h1": 1, "h2": 2, "h3": 3, "h4": 4, "h5": 5, "h6": 6}
+# Elements that start a new paragraph in the structured text.
+BLOCK_TAGS = set(HEADING_TAGS) | {
+    "p", "div", "section", "article", "main", "li", "ul", "ol", "dl", "dt", "dd", "pre", "blockquote",
+    "table", "tr", "td", "th", "figure", "figcaption", "br", "hr",
+}
+
+
+def extract_text_bs4(html: str) -> str:
+    """
+    Extracts the whitespace-normalized text of the whole page body with
+    BeautifulSoup's pure-Python parser. This is the original extractor and
+    the fallback when no C-backed parser is installed.
+    """
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(html, "html.parser")
+    body = soup.find("body")
+    if not body:
+        return ""
+    text = body.get_text("\n")
+    return " ".join(text.split())  # Normalize whitespace
+
+
+def extract_text_lxml(html: str) -> str:
+    """
+    Extracts the text of the main content of a page with lxml, leaving out
+    navigation, header, footer and sidebar chrome.
+    """
+    container = _lxml_main_content(html)
+    if container is None:
+        return ""
+    return " ".join(" ".join(container.itertext()).split())
+
+
+def _lxml_main_content(html: str):
+    """Returns the main content element of a page, or None if the page has no element content."""
+    import lxml.etree
+    import lxml.html
+
+    if not html.strip():
+        return None
+    try:
+        root = lxml.html.document_fromstring(html)
+    except lxml.etree.ParserError:  # "Document is empty": only comments, processing instructions or whitespace
+        return None
+    for element in root.xpath("|".join(f"//{tag}" for tag in BOILERPLATE_TAGS) + "|//*[@role='navigation']"):
+        element.drop_tree()  # Keeps the element's tail text
+    for xpath in _MAIN_CONTENT_XPATHS:
+        found = root.xpath(xpath)
+        if found:
+            return found[0]
+    return root.body
+
+
+def extract_text_selectolax(html: str) -> str:
+    """
+    Extracts the text of the main content of a page with selectolax (lexbor),
+    leaving out navigation, header, footer and sidebar chrome.
+    """
+    from selectolax.lexbor import LexborHTMLParser
+
+    tree = LexborHTMLParser(html)
+    tree.strip_tags(BOILERPLATE_TAGS)
+    for node in tree.css("[role=navigation]"):
+        node.decompose()
+    container = None
+    for selector in MAIN_CONTENT_SELECTORS:
+        container = tree.css_first(selector)
+        if container is not None:
+            break
+    container = container if container is not None else tree.body
+    if container is None:
+        return ""
+    return " ".join(container.text(separator=" ").split())
+
+
+def extract_structured_text(html: str) -> str:
+    """
+    Extracts the main content of a page keeping its structure, for the
+    "structure" chunk mode: one paragraph per block element, separated by
+    blank lines, and headings written as "#"-prefixed lines ("## Setup").
+    Falls back to the flat text when lxml is not installed.
+    """
+    if not _available("lxml"):
+        return get_extractor()(html)
+    container = _lxml_main_content(html)
+    if container is None:
+        return ""
+    blocks = []
+    inline = []
+
+    def flush(level: int = 0):
+        text = " ".join(" ".join(inline).split())
+        inline.clear()
+        if text:
+            blocks.append(f"{'#' * level} {text}" if level else text)
+
+    def walk(element):
+        tag = element.tag if isinstance(element.tag, str) else None  # Comments and processing instructions
+        if tag is None:
+            return
+        is_block = tag in BLOCK_TAGS or tag in HEADING_TAGS
+        if is_block:
+            flush()
+        if element.text:
+            inline.append(element.text)
+        for child in element:
+            walk(child)
+            if child.tail:
+                inline.append(child.tail)
+        if is_block:
+            flush(HEADING_TAGS.get(tag, 0))
+
+    walk(container)
+    flush()
+    return "\n\n".join(blocks)
+
+
+EXTRACTORS: Dict[str, Callable[[str], str]] = {
+    "lxml": extract_text_lxml,
+    "selectolax": extract_text_selectolax,
+    "bs4": extract_text_bs4,
+}
+
+
+_extractors: Dict[str, Callable[[str], str]] = {}
+
+
+def _available(name: str) -> bool:
+    try:
+        if name == "lxml":
+            import lxml.html  # noqa: F401
+        elif name == "selectolax":
+            from selectolax.lexbor import LexborHTMLParser  # noqa: F401
+        else:
+            import bs4  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def get_extractor(name: str = html_extractor) -> Callable[[str], str]:
+    """
+    Returns the HTML-to-text extractor registered under the given name.
+
+    "auto" picks the first installed backend among lxml, selectolax and bs4.
+    A named C-backed backend that is not installed falls back to bs4.
+
+    Args:
+        name (str): "auto", "lxml", "selectolax" or "bs4".
+
+    Returns:
+        Callable[[str], str]: A function from HTML to normalized text.
+    """
+    if name in _extractors:
+        return _extractors[name]
+    _extractors[name] = _resolve_extractor(name)
+    return _extractors[name]
+
+
+
+def _resolve_extractor(name: str) -> Callable[[str], str]:
+    if name == "auto":
+        for candidate in ("lxml", "selectolax", "bs4"):
+            if _available(candidate):
+                return EXTRACTORS[candidate]
+    if name not in EXTRACTORS:
+        raise ValueError(f"Unknown HTML extractor: {name}")
+    if not _available(name):
+        print(f"HTML extractor {name} is not installed, falling back to bs4.")
+        return extract_text_bs4
+    return EXTRACTORS[name]
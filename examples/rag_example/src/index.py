@@ -1,25 +1,236 @@
+import json
 import os
 import pathlib
 import numpy as np
-import faiss
-from typing import Optional
+from typing import Dict, List, Optional, Tuple
 
-def read_embeddings() -> Optional[np.ndarray]:
+from settings import get_config
+from telemetry import span
+from vectors import VECTOR_DTYPES, as_float32, decode_vectors, scale_path, vector_dtype
+from bm25 import LEGACY_FILE, BM25Index, empty_index, load_bm25
+from chunk_store import load_chunks, write_chunk_store
+from workspace import RunWorkspace, atomic_write, commit_lock, purge_stale_runs
+from documents import (MAX_CHUNKS_PER_DOCUMENT, DocumentChunks, chunk_id, document_id_range, load_manifest,
+                       purge_retired_files, retire_files, save_manifest)
+
+INDEX_TYPES = ("flat", "ivf_flat", "ivf_pq", "hnsw")
+
+config = get_config()
+index_type = config.get("index_type", "flat")
+chunk_compression = config.get("chunk_compression", "none")
+chunk_block_size = config.get("chunk_block_size", 64)
+retired_file_grace_seconds = config.get("retired_file_grace_seconds", 300)
+
+def build_index(embeddings: np.ndarray, index_type: str = index_type, params: Optional[dict] = None, seed: int = 1234,
+                ids: Optional[np.ndarray] = None, vector_dtype: str = vector_dtype):
+    """
+    Builds a Faiss index of the given type and adds the embeddings to it.
+    When ids are given the index is wrapped in an IndexIDMap2 so vectors can
+    later be added and removed by chunk id.
+
+    IVF and PQ indexes are trained on a random sample of the embeddings.
+    When the corpus is too small to train the requested index, a flat index
+    is built instead.
+
+    With a float16 or int8 vector_dtype, the flat, ivf_flat and hnsw indexes
+    store their vectors with a Faiss scalar quantizer (half or a quarter of
+    the float32 size). int8 codes use a per-dimension range trained on the
+    first vectors, widened by index_sq_range_margin for the documents added
+    later. ivf_pq indexes are already compressed and ignore vector_dtype.
+
+    Args:
+        embeddings (np.ndarray): The (n, dim) embeddings.
+        index_type (str): One of "flat", "ivf_flat", "ivf_pq" or "hnsw".
+        params (Optional[dict]): Build parameters, defaults to the index_* values of rag_config.yml.
+        seed (int): Seed for the training sample.
+        ids (Optional[np.ndarray]): The int64 id of every embedding.
+        vector_dtype (str): "float32", "float16" or "int8".
+
+    Returns:
+        faiss.Index: The populated index.
+    """
+    import faiss
+
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type: {index_type}")
+    if vector_dtype not in VECTOR_DTYPES:
+        raise ValueError(f"Unknown vector dtype: {vector_dtype}")
+    params = config if params is None else params
+    embeddings = as_float32(embeddings)
+    n, dim = embeddings.shape
+
+    nlist = max(1, min(params.get("index_nlist", 100), n // 39))  # Faiss wants ~39 points per centroid
+    pq_m = params.get("index_pq_m", 16)
+    pq_nbits = params.get("index_pq_nbits", 8)
+    if index_type == "ivf_pq" and (dim % pq_m or n < 2 ** pq_nbits):
+        print(f"Cannot train ivf_pq with {n} vectors of dim {dim}, building a flat index instead.")
+        index_type = "flat"
+    if index_type == "ivf_flat" and n < 39:
+        print(f"Too few vectors ({n}) to train ivf_flat, building a flat index instead.")
+        index_type = "flat"
+
+    qtype = {"float16": faiss.ScalarQuantizer.QT_fp16, "int8": faiss.ScalarQuantizer.QT_8bit}.get(vector_dtype)
+    if index_type == "flat":
+        index = faiss.IndexFlatL2(dim) if qtype is None else faiss.IndexScalarQuantizer(dim, qtype, faiss.METRIC_L2)
+    elif index_type == "hnsw":
+        m = params.get("index_hnsw_m", 32)
+        index = faiss.IndexHNSWFlat(dim, m) if qtype is None else faiss.IndexHNSWSQ(dim, qtype, m)
+        index.hnsw.efConstruction = params.get("index_hnsw_ef_construction", 40)
+    else:
+        quantizer = faiss.IndexFlatL2(dim)
+        if index_type == "ivf_flat" and qtype is not None:
+            index = faiss.IndexIVFScalarQuantizer(quantizer, dim, nlist, qtype, faiss.METRIC_L2)
+        elif index_type == "ivf_flat":
+            index = faiss.IndexIVFFlat(quantizer, dim, nlist)
+        else:
+            index = faiss.IndexIVFPQ(quantizer, dim, nlist, pq_m, pq_nbits)
+
+    coded = faiss.downcast_index(index.storage) if isinstance(index, faiss.IndexHNSW) else index
+    sq = getattr(coded, "sq", None)
+    if sq is not None:
+        sq.rangestat = faiss.ScalarQuantizer.RS_minmax
+        sq.rangestat_arg = params.get("index_sq_range_margin", 0.1)
+    if not index.is_trained:
+        sample_size = min(n, params.get("index_train_sample", 50000))
+        sample = embeddings[np.random.default_rng(seed).choice(n, sample_size, replace=False)]
+        index.train(sample)
+
+    if ids is not None:
+        index = faiss.IndexIDMap2(index)
+        index.add_with_ids(embeddings, np.ascontiguousarray(ids, dtype=np.int64))
+    else:
+        index.add(embeddings)
+    return index
+
+def search_parameters(index, nprobe: int = config.get("search_nprobe", 8), ef_search: int = config.get("search_ef", 64)):
+    """
+    Returns per-query search parameters for the given index, or None for a flat index.
+
+    Args:
+        index (faiss.Index): The Faiss index.
+        nprobe (int): Number of IVF lists visited per query.
+        ef_search (int): Size of the HNSW candidate list per query.
+
+    Returns:
+        Optional[faiss.SearchParameters]: The parameters to pass to index.search.
     """
-    Reads embeddings from a file and returns them as a NumPy array.
+    import faiss
+
+    if isinstance(index, faiss.IndexIDMap):
+        index = faiss.downcast_index(index.index)
+    if isinstance(index, faiss.IndexIVF):
+        return faiss.SearchParametersIVF(nprobe=nprobe)
+    if isinstance(index, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(efSearch=ef_search)
+    return None
+
+def index_spec(index) -> Tuple[str, dict, str]:
+    """
+    Returns the type, build parameters and vector dtype an existing index was
+    built with, so it can be rebuilt as the same kind of index whatever
+    rag_config.yml says now.
+
+    Args:
+        index (faiss.Index): The index, optionally wrapped in an IndexIDMap.
+
+    Returns:
+        Tuple[str, dict, str]: The index type, the index_* parameters and the vector dtype.
+    """
+    import faiss
+
+    inner = faiss.downcast_index(index.index if isinstance(index, faiss.IndexIDMap) else index)  # Owned by index
+    params = {key: value for key, value in config.items() if key.startswith("index_")}
+    if isinstance(inner, faiss.IndexHNSW):
+        index_type = "hnsw"
+        params["index_hnsw_m"] = inner.hnsw.nb_neighbors(1)  # Layer 0 has twice as many links
+        params["index_hnsw_ef_construction"] = inner.hnsw.efConstruction
+        coded = faiss.downcast_index(inner.storage)
+    elif isinstance(inner, faiss.IndexIVF):
+        index_type = "ivf_pq" if isinstance(inner, faiss.IndexIVFPQ) else "ivf_flat"
+        params["index_nlist"] = inner.nlist
+        if index_type == "ivf_pq":
+            params["index_pq_m"], params["index_pq_nbits"] = inner.pq.M, inner.pq.nbits
+        coded = inner
+    else:
+        index_type = "flat"
+        coded = inner
+    sq = getattr(coded, "sq", None)
+    dtype = "float32"
+    if sq is not None:
+        dtype = {faiss.ScalarQuantizer.QT_fp16: "float16", faiss.ScalarQuantizer.QT_8bit: "int8"}[sq.qtype]
+        params["index_sq_range_margin"] = round(float(sq.rangestat_arg), 6)
+    return index_type, params, dtype
+
+def training_threshold(index_type: str, params: Optional[dict] = None) -> int:
+    """
+    Returns the number of vectors an IVF index of the given type needs to be
+    trained with its full index_nlist centroids, or 0 for the other types.
+    """
+    params = config if params is None else params
+    if index_type == "ivf_flat":
+        return 39 * params.get("index_nlist", 100)
+    if index_type == "ivf_pq":
+        return max(39 * params.get("index_nlist", 100), 2 ** params.get("index_pq_nbits", 8))
+    return 0
+
+def needs_training(index, requested_type: str) -> bool:
+    """
+    Returns whether an incremental index should be rebuilt as the requested
+    IVF type: it is still the flat index it started as, or it was trained
+    with fewer centroids than index_nlist, and it now holds enough vectors
+    to train them all. This happens at most once in the life of an index.
+    """
+    threshold = training_threshold(requested_type)
+    if not threshold or index.ntotal < threshold:
+        return False
+    own_type, params, _ = index_spec(index)
+    return own_type != requested_type or params["index_nlist"] < config.get("index_nlist", 100)
+
+def rebuild_index(index, keep: Optional[np.ndarray] = None, index_type: Optional[str] = None,
+                  vector_dtype: Optional[str] = None):
+    """
+    Rebuilds an IndexIDMap index from its own vectors, as the same type with
+    the same parameters unless another type is given.
+
+    Args:
+        index (faiss.IndexIDMap2): The index.
+        keep (Optional[np.ndarray]): A mask of the vectors to keep, in id_map order; all by default.
+        index_type (Optional[str]): The type to rebuild as, the index's own type by default.
+        vector_dtype (Optional[str]): The vector dtype, the index's own by default.
+
+    Returns:
+        faiss.IndexIDMap2: The new index.
+    """
+    import faiss
+
+    own_type, params, own_dtype = index_spec(index)
+    inner = faiss.downcast_index(index.index)
+    if isinstance(inner, faiss.IndexIVF):
+        inner.make_direct_map()  # IVF lists are not stored in id order
+    ids = faiss.vector_to_array(index.id_map)
+    vectors = inner.reconstruct_n(0, index.ntotal)
+    if keep is not None:
+        ids, vectors = ids[keep], vectors[keep]
+    return build_index(vectors, index_type or own_type, params, ids=ids, vector_dtype=vector_dtype or own_dtype)
+
+def read_embeddings(run_id: Optional[str] = None) -> Optional[np.ndarray]:
+    """
+    Reads embeddings from a file and returns them as a float32 NumPy array.
+    float16 and int8 files (see vectors.py) are decoded.
+
+    Args:
+        run_id (Optional[str]): The ingestion run whose embeddings are read (see workspace.py).
 
     Returns:
         Optional[np.ndarray]: The embeddings as a NumPy array, or None if an error occurs.
     """
-    current_dir = pathlib.Path().parent.resolve()
-    embeddings_dir = current_dir / "temp" / "embeddings"
-    embeddings_dir.mkdir(parents=True, exist_ok=True) # Ensure the directory exists
-    filepath = embeddings_dir / "embeddings_file.npy"
+    filepath = RunWorkspace(run_id).embeddings_dir / "embeddings_file.npy"
     
     try:
-        arr = np.load(filepath)  # Use np.load to read binary format
+        arr = np.load(filepath, mmap_mode="r")  # Map the file instead of reading it into the heap
+        scale = np.load(scale_path(filepath)) if arr.dtype == np.int8 else None
         print(f"ndarray successfully read from: {filepath}")
-        return arr
+        return decode_vectors(arr, scale)  # float32 files stay mapped, without a copy
     except FileNotFoundError:
         print(f"File not found: {filepath}")
         return None
@@ -27,32 +238,264 @@ def read_embeddings() -> Optional[np.ndarray]:
         print(f"Error reading ndarray from {filepath}: {e}")
         return None
 
-def index_embeddings() -> None:
+def read_chunks(run_id: Optional[str] = None) -> Optional[List[str]]:
+    """
+    Reads the chunks of the document being indexed from the run's chunk store
+    chunks/output.bin (or output.json, as written by older versions).
+
+    Args:
+        run_id (Optional[str]): The ingestion run whose chunks are read.
+
+    Returns:
+        Optional[List[str]]: The chunks, or None if an error occurs.
+    """
+    chunks_file = RunWorkspace(run_id).chunks_dir / "output.bin"
+    if not chunks_file.exists() and chunks_file.with_suffix(".json").exists():
+        chunks_file = chunks_file.with_suffix(".json")
+    try:
+        return load_chunks(chunks_file)
+    except FileNotFoundError:
+        print(f"File not found: {chunks_file}")
+        return None
+    except Exception as e:
+        print(f"Error reading chunks from {chunks_file}: {e}")
+        return None
+
+def read_chunk_metadata(run_id: Optional[str] = None) -> Optional[List[Dict]]:
+    """
+    Reads the per-chunk metadata (offsets, heading path) saved by chunk.py
+    next to the chunks, or returns None if there is none.
+    """
+    json_file = RunWorkspace(run_id).chunks_dir / "metadata.json"
+    try:
+        with open(json_file, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+def read_source_url(run_id: Optional[str] = None) -> str:
+    """
+    Returns the URL of the document being indexed, as saved by parse.py.
+    """
+    try:
+        return (RunWorkspace(run_id).text_dir / "source_url.txt").read_text(encoding="utf-8").strip()
+    except FileNotFoundError:
+        return "unknown"
+
+def load_index(filepath: pathlib.Path):
+    """
+    Reads the incremental index, or returns None if there is none yet.
+    An index written before documents were tracked is not reused.
+    """
+    import faiss
+
+    if not filepath.exists():
+        return None
+    index = faiss.read_index(str(filepath))
+    if not isinstance(index, faiss.IndexIDMap):
+        print(f"{filepath} has no document ids, starting a new incremental index.")
+        return None
+    return index
+
+def remove_document(index, doc_id: int):
+    """
+    Removes every vector of a document from the index.
+
+    Args:
+        index (faiss.IndexIDMap2): The index.
+        doc_id (int): The document id.
+
+    Returns:
+        faiss.IndexIDMap2: The index without the document's vectors. HNSW
+        indexes cannot remove vectors, so they are rebuilt from the remaining
+        ones, with the type and parameters they were built with.
     """
-    Reads embeddings, creates a Faiss index, and saves the index to a file.
+    import faiss
+
+    start, end = document_id_range(doc_id)
+    try:
+        removed = index.remove_ids(faiss.IDSelectorRange(start, end))
+        print(f"Removed {removed} vectors of document {doc_id}")
+        return index
+    except RuntimeError:
+        ids = faiss.vector_to_array(index.id_map)
+        keep = (ids < start) | (ids >= end)
+        print(f"Rebuilding index without the {int((~keep).sum())} vectors of document {doc_id}")
+        return rebuild_index(index, keep)
+
+def rebuild_bm25(manifest: dict, chunks_dir: pathlib.Path) -> BM25Index:
+    """
+    Builds the BM25 index of every document in the manifest from their chunk
+    stores, for indexes created before the lexical index existed.
+    """
+    chunks = DocumentChunks(manifest, chunks_dir)
+    ids = []
+    for document in manifest["documents"].values():
+        start, _ = document_id_range(document["doc_id"])
+        ids.extend(range(start, start + document["chunks"]))
+    texts = [chunks[i] for i in ids]
+    print(f"Building the BM25 index of {len(manifest['documents'])} existing documents")
+    return BM25Index.build(ids, texts)
+
+def update_document(url: str, chunks: List[str], embeddings: np.ndarray, faiss_dir: pathlib.Path,
+                    chunks_dir: pathlib.Path, metadata: Optional[List[Dict]] = None) -> None:
+    """
+    Adds a document to the incremental index, replacing its previous version.
+
+    Only the document's vectors are added (and its previous vectors removed);
+    the rest of the index is left as is. The BM25 index next to the vector
+    index gets the same update. Its chunks are written to their own chunk
+    store and the manifest is updated last.
+
+    Args:
+        url (str): The URL of the document.
+        chunks (List[str]): The document's chunks.
+        embeddings (np.ndarray): One embedding per chunk.
+        faiss_dir (pathlib.Path): The directory of the index and manifest.
+        chunks_dir (pathlib.Path): The directory of the per-document chunk stores.
+        metadata (Optional[List[Dict]]): One metadata dict per chunk (offsets, heading path).
+    """
+    if len(chunks) != len(embeddings):
+        raise ValueError(f"{len(chunks)} chunks but {len(embeddings)} embeddings")
+    if len(chunks) > MAX_CHUNKS_PER_DOCUMENT:
+        raise ValueError(f"A document can have at most {MAX_CHUNKS_PER_DOCUMENT} chunks")
+    if metadata is not None and len(metadata) != len(chunks):
+        raise ValueError(f"{len(chunks)} chunks but {len(metadata)} metadata entries")
+    with commit_lock(faiss_dir):  # Concurrent runs read, modify and rewrite the same index files
+        _update_document(url, chunks, embeddings, faiss_dir, chunks_dir, metadata)
+
+def _update_document(url: str, chunks: List[str], embeddings: np.ndarray, faiss_dir: pathlib.Path,
+                     chunks_dir: pathlib.Path, metadata: Optional[List[Dict]]) -> None:
+    import faiss
+
+    index_file = faiss_dir / "vector_index.bin"
+    manifest_file = faiss_dir / "documents.json"
+    bm25_dir = faiss_dir / "bm25"
+    manifest = load_manifest(manifest_file)
+    index = load_index(index_file)
+    if index is None:
+        manifest = {"next_doc_id": 0, "documents": {}, "index": {"type": index_type, "vector_dtype": vector_dtype}}
+        bm25 = empty_index()
+    else:
+        bm25 = load_bm25(bm25_dir) or rebuild_bm25(manifest, chunks_dir)
+        if "index" not in manifest:  # Written before the requested type was recorded
+            own_type, _, own_dtype = index_spec(index)
+            manifest["index"] = {"type": own_type, "vector_dtype": own_dtype}
+    requested_type, requested_dtype = manifest["index"]["type"], manifest["index"]["vector_dtype"]
+
+    previous = manifest["documents"].get(url)
+    if previous is None:
+        doc_id = manifest["next_doc_id"]
+        manifest["next_doc_id"] = doc_id + 1
+        version = 1
+    else:
+        doc_id = previous["doc_id"]
+        version = previous["version"] + 1
+        index = remove_document(index, doc_id)
+
+    ids = np.array([chunk_id(doc_id, i) for i in range(len(chunks))], dtype=np.int64)
+    embeddings = as_float32(embeddings)
+    with span("index.add", items=len(ids), bytes=embeddings.nbytes):
+        if index is None:
+            # An IVF index stays flat until there are enough vectors to train all of its centroids
+            initial_type = "flat" if len(ids) < training_threshold(requested_type) else requested_type
+            index = build_index(embeddings, initial_type, ids=ids, vector_dtype=requested_dtype)
+        else:
+            index.add_with_ids(embeddings, ids)
+    if needs_training(index, requested_type):
+        with span("index.train", items=index.ntotal):
+            print(f"Training the {requested_type} index on its {index.ntotal} vectors")
+            index = rebuild_index(index, index_type=requested_type, vector_dtype=requested_dtype)
+    with span("index.bm25", items=len(chunks)):
+        bm25 = bm25.update(ids.tolist(), chunks, document_id_range(doc_id) if previous is not None else None)
+
+    chunk_file = f"{doc_id}-{version}.bin"
+    write_chunk_store(chunks, chunks_dir / chunk_file, chunk_compression, chunk_block_size)
+    document = {"doc_id": doc_id, "version": version, "chunks": len(chunks), "chunk_file": chunk_file}
+    if metadata is not None:
+        document["metadata_file"] = f"{doc_id}-{version}.meta.json"
+        with atomic_write(chunks_dir / document["metadata_file"], encoding="utf-8") as f:
+            json.dump(metadata, f)
+
+    faiss_dir.mkdir(parents=True, exist_ok=True)
+    with span("index.save", items=index.ntotal) as save:
+        bm25.save(bm25_dir, retired_file_grace_seconds)
+        (faiss_dir / LEGACY_FILE).unlink(missing_ok=True)  # Superseded by bm25/ once it is written
+        tmp_path = index_file.with_name(index_file.name + ".tmp")
+        faiss.write_index(index, str(tmp_path))
+        os.replace(tmp_path, index_file)  # Readers mapping the old file keep a consistent view
+        save.set(bytes=index_file.stat().st_size)
+
+    manifest["documents"][url] = document
+    # The previous version's files are deleted by a later commit, once no query can still be reading them
+    purge_retired_files(manifest, chunks_dir, retired_file_grace_seconds)
+    if previous is not None:
+        retire_files(manifest, [previous["chunk_file"]] + ([previous["metadata_file"]] if previous.get("metadata_file") else []))
+    save_manifest(manifest, manifest_file)
+    print(f"Indexed document {doc_id} ({url}), version {version}: {len(chunks)} chunks, {index.ntotal} vectors in total")
+
+def index_document(url: str, chunks: List[str], embeddings: np.ndarray, metadata: Optional[List[Dict]] = None) -> None:
+    """
+    Adds an in-memory document (its chunks and embeddings) to the incremental
+    index in temp/faiss_files.
+
+    Args:
+        url (str): The URL of the document.
+        chunks (List[str]): The document's chunks.
+        embeddings (np.ndarray): One embedding per chunk.
+        metadata (Optional[List[Dict]]): One metadata dict per chunk.
     """
     current_dir = pathlib.Path().parent.resolve()
-    faiss_dir = current_dir / "temp" / "faiss_files"
-    faiss_dir.mkdir(parents=True, exist_ok=True)  # Ensure the directory exists
-    filepath = faiss_dir / "vector_index.bin"
-    
-    embeddings = read_embeddings()
-    if embeddings is None:
-        print("No embeddings to index.")
-        return
-    
-    n, dim = embeddings.shape
-    index = faiss.IndexFlatL2(dim)
-    index.add(embeddings)
-    
+    update_document(url, chunks, embeddings, current_dir / "temp" / "faiss_files",
+                    current_dir / "temp" / "chunks" / "documents", metadata)
+
+def index_embeddings(run_id: Optional[str] = None) -> bool:
+    """
+    Reads the embeddings and chunks of a parsed document and adds them to the
+    incremental Faiss index, replacing the document's previous version.
+
+    A run is indexed once both its chunks and its embeddings are done, and
+    only by the first caller after that, however many completion events
+    trigger it. A failed run gives up its claim, so it can be indexed again.
+
+    Args:
+        run_id (Optional[str]): The ingestion run to index. Its files are
+            deleted once the document is committed, together with the files
+            of runs abandoned for run_workspace_max_age_seconds.
+
+    Returns:
+        bool: Whether the document was indexed by this call.
+    """
+    workspace = RunWorkspace(run_id)
+    if not workspace.ready("chunk", "embed"):
+        print(f"Run {run_id} is still waiting for its chunks and embeddings.")
+        return False
+    if not workspace.claim("index"):
+        print(f"Run {run_id} is already being indexed.")
+        return False
+
+    indexed = False
     try:
-        faiss.write_index(index, str(filepath))
-        print(f"Index saved to {filepath}")
+        embeddings = read_embeddings(run_id)
+        chunks = read_chunks(run_id)
+        if embeddings is None or chunks is None:
+            print("No embeddings to index.")
+            return False
+        index_document(read_source_url(run_id), chunks, embeddings, read_chunk_metadata(run_id))
+        indexed = True
     except Exception as e:
-        print(f"Error saving index to {filepath}: {e}")
+        print(f"Error indexing document: {e}")
+        return False
+    finally:
+        if not indexed:
+            workspace.release("index")  # Let a later event retry the run
+    del embeddings  # Unmap the run's embeddings before removing them
+    workspace.remove()
+    purge_stale_runs()
+    return True
 
 if __name__ == "__main__":
     try:
         index_embeddings()
     except Exception as e:
-        print(f"Indexing Failed: {e}")
\ No newline at end of file
+        print(f"Indexing Failed: {e}")
@@ -0,0 +1,164 @@
+import os
+import pathlib
+import threading
+import time
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+from bm25 import LEGACY_FILE, STATE_FILE, BM25Index, load_bm25
+from documents import DocumentChunks, load_manifest
+
+
+def read_index_mmap(filepath: pathlib.Path):
+    """
+    Reads a Faiss index with its storage memory-mapped instead of copied to the
+    heap, so worker processes share the same pages through the OS cache.
+    Falls back to a regular read for index types that cannot be mapped.
+    """
+    import faiss
+
+    flags = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+    try:
+        return faiss.read_index(str(filepath), flags)
+    except Exception:
+        return faiss.read_index(str(filepath))
+
+
+class IndexManager:
+    """
+    Keeps the chunks and the Faiss index resident in memory across queries.
+
+    Both are memory-mapped: chunks come from the per-document chunk stores
+    listed in temp/faiss_files/documents.json and the index storage is mapped
+    by Faiss.
+
+    The files are read once on first use and are only read again when their
+    modification time or size changes, or when reload() is called (for example
+    after the indexing step emits index.complete). A reload builds a complete
+    new snapshot before swapping it in, so concurrent queries always see a
+    consistent (chunks, index) pair. The manifest stands for the chunk
+    stores: they are written under new names before it and never modified, so
+    any change to the chunks changes the manifest.
+    """
+
+    def __init__(self, index_file: Optional[str] = None):
+        current_dir = pathlib.Path().parent.resolve()
+        self.index_file = pathlib.Path(index_file or current_dir / "temp" / "faiss_files" / "vector_index.bin")
+        self.manifest_file = self.index_file.parent / "documents.json"
+        self.bm25_dir = self.index_file.parent / "bm25"
+        self.documents_dir = current_dir / "temp" / "chunks" / "documents"
+        self._lock = threading.Lock()
+        self._snapshot = None  # (chunks, index, bm25, signature)
+        self.generation = 0
+        self.load_count = 0
+        self.last_load_seconds = 0.0
+        self.total_load_seconds = 0.0
+
+    def _signature(self) -> Optional[Tuple[int, ...]]:
+        """
+        Returns the (mtime, size) of the manifest, index and BM25 files, or
+        None if the manifest or index file is missing. The BM25 index is optional.
+        """
+        try:
+            c = os.stat(self.manifest_file)
+            i = os.stat(self.index_file)
+        except FileNotFoundError:
+            return None
+        bm25 = (0, 0)
+        for bm25_file in (self.bm25_dir / STATE_FILE, self.index_file.parent / LEGACY_FILE):
+            try:
+                b = os.stat(bm25_file)
+                bm25 = (b.st_mtime_ns, b.st_size)
+                break
+            except FileNotFoundError:
+                continue
+        return (c.st_mtime_ns, c.st_size, i.st_mtime_ns, i.st_size) + bm25
+
+    def _load(self, signature) -> None:
+        start = time.perf_counter()
+        chunks = DocumentChunks(load_manifest(self.manifest_file), self.documents_dir)
+        index = read_index_mmap(self.index_file)
+        bm25 = load_bm25(self.bm25_dir)
+        elapsed = time.perf_counter() - start
+
+        self._snapshot = (chunks, index, bm25, signature)
+        self.generation += 1
+        self.load_count += 1
+        self.last_load_seconds = elapsed
+        self.total_load_seconds += elapsed
+        print(f"Data loaded successfully (generation {self.generation}, {elapsed:.3f}s).")
+
+    def get(self) -> Tuple[Sequence[str], Optional[Any]]:
+        """
+        Returns the resident chunks and Faiss index, loading them on first use
+        or when the files on disk have changed.
+
+        Returns:
+            Tuple[Sequence[str], Optional[faiss.Index]]: The chunks and the index, or ([], None) if no data is available.
+        """
+        chunks, index, _ = self.get_hybrid()
+        return chunks, index
+
+    def get_hybrid(self) -> Tuple[Sequence[str], Optional[Any], Optional[BM25Index]]:
+        """
+        Like get(), but also returns the BM25 index of the same snapshot, or
+        None when the index was built without one.
+        """
+        signature = self._signature()
+        snapshot = self._snapshot
+        if snapshot is not None and (signature is None or snapshot[3] == signature):
+            return snapshot[0], snapshot[1], snapshot[2]
+        if signature is None:
+            return [], None, None
+
+        with self._lock:
+            snapshot = self._snapshot
+            if snapshot is None or snapshot[3] != signature:
+                try:
+                    self._load(signature)
+                except Exception as e:
+                    print(f"Error loading data: {e}")
+                    if snapshot is None:
+                        return [], None, None
+            snapshot = self._snapshot
+        return snapshot[0], snapshot[1], snapshot[2]
+
+    def reload(self) -> None:
+        """
+        Forces the chunks and index to be read again from disk.
+        """
+        signature = self._signature()
+        if signature is None:
+            print("No data to load.")
+            return
+        with self._lock:
+            try:
+                self._load(signature)
+            except Exception as e:
+                print(f"Error loading data: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Returns load counters so that per-request reloads can be ruled out.
+        """
+        return {
+            "generation": self.generation,
+            "load_count": self.load_count,
+            "last_load_seconds": self.last_load_seconds,
+            "total_load_seconds": self.total_load_seconds,
+        }
+
+
+_index_manager = None
+_index_manager_lock = threading.Lock()
+
+
+def get_index_manager() -> IndexManager:
+    """
+    Returns the process-wide IndexManager, creating it on first use.
+    """
+    global _index_manager
+    if _index_manager is None:
+        with _index_manager_lock:
+            if _index_manager is None:
+                _index_manager = IndexManager()
+    return _index_manager
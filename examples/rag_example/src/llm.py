@@ -0,0 +1,32 @@
+from typing import Iterator
+
+from providers import get_provider
+
+
+class ProviderLLMBackend:
+    """
+    Generates answers with a model of a shared provider (see providers.py),
+    in one piece or streamed.
+    """
+
+    def __init__(self, provider, model_name: str):
+        self.provider = provider
+        self.model_name = model_name
+
+    def generate(self, prompt: str) -> str:
+        return self.provider.generate(prompt, self.model_name)
+
+    def stream(self, prompt: str) -> Iterator[str]:
+        return self.provider.stream(prompt, self.model_name)
+
+
+def get_llm_backend(name: str, model_name: str):
+    """
+    Returns the LLM backend registered under the given name ("gemini" or
+    "fake", which uses the shared mock provider).
+    """
+    if name == "gemini":
+        return ProviderLLMBackend(get_provider("gemini"), model_name)
+    if name == "fake":
+        return ProviderLLMBackend(get_provider("mock"), model_name)
+    raise ValueError(f"Unknown LLM backend: {name}")
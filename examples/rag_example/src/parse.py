@@ -1,9 +1,27 @@
-import requests
-from bs4 import BeautifulSoup
 import argparse
-import json
-import pathlib
-from typing import Optional
+from html.parser import HTMLParser
+from typing import Iterator, List, Optional
+
+from crawler import get_session, http_timeout
+from extract import chunk_mode, extract_structured_text, get_extractor
+from telemetry import span
+from workspace import RunWorkspace, atomic_write
+
+def extract_text(html: str) -> str:
+    """
+    Extracts the whitespace-normalized text of an HTML page with the
+    extractor selected by html_extractor in rag_config.yml. With the
+    "structure" chunk mode the headings and paragraphs are kept.
+
+    Args:
+        html (str): The HTML of the page.
+
+    Returns:
+        str: The text content of the page, or "" if it has no body.
+    """
+    if chunk_mode == "structure":
+        return extract_structured_text(html)
+    return get_extractor()(html)
 
 def fetch_confluence_page(page_url: str) -> str:
     """
@@ -15,44 +33,126 @@ def fetch_confluence_page(page_url: str) -> str:
     Returns:
         str: The parsed text content of the page.
     """
+    import requests
+
     try:
-        response = requests.get(page_url)
-        response.raise_for_status()
-        soup = BeautifulSoup(response.text, "html.parser")
-        body = soup.find("body")
-        if not body:
-            return ""
-        text = body.get_text("\n")
-        text = " ".join(text.split())  # Normalize whitespace
+        with span("parse.fetch", items=1) as fetch:
+            response = get_session().get(page_url, timeout=http_timeout)
+            response.raise_for_status()
+            fetch.set(bytes=len(response.content))
+        with span("parse.extract", bytes=len(response.content)) as extract:
+            text = extract_text(response.text)
+            extract.set(items=int(bool(text)))
         print("Website parsed successfully.")
         return text
     except requests.exceptions.RequestException as e:
         print(f"Error fetching URL: {e}")
         return ""
 
-def save_text_to_file(url: str) -> None:
+class BodyTextParser(HTMLParser):
+    """
+    Incremental HTML parser that collects the text nodes inside <body>.
+
+    Text split across feed() calls is joined back into one node, and the
+    contents of script, style and template elements are skipped, matching
+    what BeautifulSoup's get_text returns for the body.
+    """
+
+    SKIPPED = {"script", "style", "template"}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.in_body = False
+        self.skip_depth = 0
+        self._data = []
+        self.nodes: List[str] = []
+
+    def _flush(self) -> None:
+        if self._data:
+            if self.in_body and not self.skip_depth:
+                self.nodes.append("".join(self._data))
+            self._data = []
+
+    def handle_starttag(self, tag, attrs):
+        self._flush()
+        if tag == "body":
+            self.in_body = True
+        elif tag in self.SKIPPED:
+            self.skip_depth += 1
+
+    def handle_endtag(self, tag):
+        self._flush()
+        if tag == "body":
+            self.in_body = False
+        elif tag in self.SKIPPED and self.skip_depth:
+            self.skip_depth -= 1
+
+    def handle_data(self, data):
+        self._data.append(data)
+
+    def close(self):
+        super().close()
+        self._flush()
+
+    def pop_nodes(self) -> List[str]:
+        nodes, self.nodes = self.nodes, []
+        return nodes
+
+def iter_confluence_text(page_url: str, chunk_size: int = 64 * 1024) -> Iterator[str]:
+    """
+    Streams a Confluence page and yields the text of its body as it arrives.
+
+    The response is read in pieces and fed to an incremental parser, so
+    neither the full HTML nor the full text is held in memory.
+
+    Args:
+        page_url (str): The URL of the Confluence page.
+        chunk_size (int): Bytes read from the response at a time.
+
+    Yields:
+        str: The text of each body text node, in document order.
+    """
+    parser = BodyTextParser()
+    with get_session().get(page_url, stream=True, timeout=http_timeout) as response:
+        response.raise_for_status()
+        if response.encoding is None:
+            response.encoding = "utf-8"
+        for piece in response.iter_content(chunk_size=chunk_size, decode_unicode=True):
+            parser.feed(piece)
+            yield from parser.pop_nodes()
+    parser.close()
+    yield from parser.pop_nodes()
+
+def save_text_to_file(url: str, run_id: Optional[str] = None) -> bool:
     """
     Fetches the content of a Confluence page and saves it to a file.
 
     Args:
         url (str): The URL of the Confluence page.
+        run_id (Optional[str]): The ingestion run whose workspace the text is saved in (see workspace.py).
+
+    Returns:
+        bool: Whether the text was saved.
     """
     text = fetch_confluence_page(url)
     if not text:
         print("No text to save.")
-        return
+        return False
 
-    current_dir = pathlib.Path().parent.resolve()
-    text_dir = current_dir / "temp" / "text"
-    text_dir.mkdir(parents=True, exist_ok=True)  # Ensure the directory exists
-    filepath = text_dir / "parsed.txt"
+    workspace = RunWorkspace(run_id)
+    filepath = workspace.text_dir / "parsed.txt"
 
     try:
-        with open(filepath, "w", encoding="utf-8") as f:  # Explicit encoding
+        with atomic_write(filepath, encoding="utf-8") as f:  # Explicit encoding
             f.write(text)
+        with atomic_write(workspace.text_dir / "source_url.txt", encoding="utf-8") as f:  # Document key for the incremental index
+            f.write(url)
+        workspace.mark_done("parse")
         print(f"Text saved to {filepath}")
+        return True
     except Exception as e:
         print(f"Error saving text to file: {e}")
+        return False
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Fetch and chunk a Confluence page.")
@@ -0,0 +1,187 @@
+import pathlib
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from chunk import chunk_mode, chunk_with_metadata, iter_chunks_with_metadata, iter_words
+from chunk_store import ChunkStore, write_chunk_store
+from crawler import CrawlStats, ValidatorStore, expand_sitemap, iter_crawl
+from embed import embed_chunks, iter_embed_chunks
+from extract import extract_text_bs4, get_extractor
+from index import index_document
+from parse import extract_text, fetch_confluence_page, iter_confluence_text
+from settings import get_config
+from telemetry import span
+from vectors import as_float32
+
+config = get_config()
+streaming_ingestion = config.get("streaming_ingestion", False)
+html_extractor = config.get("html_extractor", "auto")
+
+def ingest_url(url: str) -> Dict[str, Any]:
+    """
+    Runs parse, chunk, embed and index for one URL in the current process,
+    passing the text, chunk list and embeddings in memory.
+
+    Args:
+        url (str): The URL of the Confluence page.
+
+    Returns:
+        Dict[str, Any]: The number of chunks and the seconds spent in each stage.
+    """
+    timings = {}
+
+    start = time.perf_counter()
+    text = fetch_confluence_page(url)
+    timings["parse"] = time.perf_counter() - start
+    if not text:
+        return {"chunks": 0, "timings": timings}
+
+    start = time.perf_counter()
+    with span("chunk.split", bytes=len(text)) as split:
+        chunks = chunk_with_metadata(text, url)
+        split.set(items=len(chunks))
+    texts = [chunk.text for chunk in chunks]
+    timings["chunk"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    embeddings = embed_chunks(texts)
+    timings["embed"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    index_document(url, texts, embeddings, [chunk.metadata() for chunk in chunks])
+    timings["index"] = time.perf_counter() - start
+
+    return {"chunks": len(chunks), "timings": timings}
+
+def streaming_unsupported() -> Optional[str]:
+    """
+    Returns why the configured extractor and chunk mode cannot be streamed,
+    or None if they can.
+
+    The stream parser yields the body text node by node, which is what the
+    bs4 extractor returns, and the stream is cut into word chunks. The other
+    extractors pick the main content container and the other chunk modes
+    need the headings and paragraphs, so they need the whole page first.
+    """
+    if get_extractor(html_extractor) is not extract_text_bs4:
+        return (f"streaming_ingestion needs html_extractor: bs4 (got {html_extractor}, which extracts the main "
+                "content of the whole page); set streaming_ingestion: false to use it")
+    if chunk_mode != "word":
+        return f"streaming_ingestion needs chunk_mode: word (got {chunk_mode}); set streaming_ingestion: false to use it"
+    return None
+
+def ingest_url_streaming(url: str) -> Dict[str, Any]:
+    """
+    Streaming version of ingest_url for large pages.
+
+    The page is parsed while it downloads, chunks are cut from the word
+    stream with a sliding window and handed to the embedding batcher as they
+    appear, so embedding starts before parsing has finished and the full
+    HTML and text are never held in memory. The embedded chunks and vectors
+    are spooled to a chunk store and a vector file in temp/ as they arrive,
+    and the document is indexed from memory maps of both files, so neither
+    the chunk texts nor the vectors are collected on the heap, only the
+    small metadata of each chunk.
+
+    The chunks, and their metadata, are the ones ingest_url produces with
+    the bs4 extractor and the "word" chunk mode, the only combination that
+    can be streamed.
+
+    Args:
+        url (str): The URL of the Confluence page.
+
+    Returns:
+        Dict[str, Any]: The number of chunks, the time to the first vector and the total time.
+
+    Raises:
+        ValueError: If html_extractor or chunk_mode cannot be streamed (see streaming_unsupported).
+    """
+    reason = streaming_unsupported()
+    if reason:
+        raise ValueError(reason)
+    start = time.perf_counter()
+    timings = {}
+    temp_dir = pathlib.Path().parent.resolve() / "temp"
+    temp_dir.mkdir(parents=True, exist_ok=True)
+    with tempfile.TemporaryDirectory(dir=temp_dir) as spool_dir:
+        spool_dir = pathlib.Path(spool_dir)
+        dims = []
+        metadata = []
+
+        def texts():
+            for chunk in iter_chunks_with_metadata(iter_words(iter_confluence_text(url)), url):
+                metadata.append(chunk.metadata())
+                yield chunk.text
+
+        with open(spool_dir / "vectors.f32", "wb") as vector_file:
+            def spool_vectors():
+                for text, vector in iter_embed_chunks(texts()):
+                    if not dims:
+                        timings["first_vector"] = time.perf_counter() - start
+                        dims.append(len(vector))
+                    vector_file.write(as_float32(vector).tobytes())
+                    yield text
+
+            count = write_chunk_store(spool_vectors(), spool_dir / "chunks.bin")
+        if not count:
+            timings["total"] = time.perf_counter() - start
+            return {"chunks": 0, "timings": timings}
+
+        chunks = ChunkStore(spool_dir / "chunks.bin")
+        try:
+            vectors = np.memmap(spool_dir / "vectors.f32", dtype=np.float32, mode="r", shape=(count, dims[0]))
+            index_document(url, chunks, vectors, metadata)
+            del vectors
+        finally:
+            chunks.close()
+    timings["total"] = time.perf_counter() - start
+    return {"chunks": count, "timings": timings}
+
+def ingest_urls(urls: List[str], sitemap: str = None) -> Dict[str, Any]:
+    """
+    Crawls several pages concurrently and ingests each one as it arrives.
+
+    Pages are fetched through the shared connection pool with conditional
+    GETs; pages that did not change since the last crawl are skipped. The
+    ETag/Last-Modified of a page is only remembered once it is indexed.
+
+    Args:
+        urls (List[str]): The URLs of the Confluence pages.
+        sitemap (str): Optional sitemap URL whose pages are added to the list.
+
+    Returns:
+        Dict[str, Any]: Crawl statistics (pages, bytes, pages/sec), the ingested URLs and the failures.
+    """
+    urls = list(urls)
+    if sitemap:
+        urls.extend(expand_sitemap(sitemap))
+
+    current_dir = pathlib.Path().parent.resolve()
+    validators = ValidatorStore(current_dir / "temp" / "text" / "validators.json")
+    stats = CrawlStats()
+    ingested = []
+    failed = {}
+    for page in iter_crawl(urls, validators, stats):
+        if page.error:
+            failed[page.url] = page.error
+            continue
+        if page.not_modified:
+            continue
+        try:
+            with span("parse.extract", bytes=page.bytes, items=1):
+                text = extract_text(page.html)
+            with span("chunk.split", bytes=len(text)) as split:
+                chunks = chunk_with_metadata(text, page.url)
+                split.set(items=len(chunks))
+            if chunks:
+                texts = [chunk.text for chunk in chunks]
+                index_document(page.url, texts, embed_chunks(texts), [chunk.metadata() for chunk in chunks])
+            validators.update(page.url, page.etag, page.last_modified)
+            ingested.append(page.url)
+        except Exception as e:
+            failed[page.url] = str(e)
+    validators.save()
+    return {"crawl": stats.as_dict(), "ingested": ingested, "failed": failed}
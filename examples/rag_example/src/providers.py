@@ -0,0 +1,288 @@
+import hashlib
+import os
+import random
+import threading
+import time
+from contextlib import nullcontext
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+import numpy as np
+
+from settings import get_config
+
+GOOGLE_API_KEY = os.environ.get('GOOGLE_DEV_API')
+
+config = get_config()
+
+
+class ProviderStats:
+    """
+    Thread-safe counters of the calls made through a provider, per operation:
+    calls, errors, retries, latency and input/output tokens.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._operations: Dict[str, Dict[str, float]] = {}
+
+    def record(self, operation: str, seconds: float, error: bool = False, retries: int = 0,
+               input_tokens: int = 0, output_tokens: int = 0) -> None:
+        with self._lock:
+            counters = self._operations.setdefault(operation, {
+                "calls": 0, "errors": 0, "retries": 0, "latency_total": 0.0, "latency_max": 0.0,
+                "input_tokens": 0, "output_tokens": 0,
+            })
+            counters["calls"] += 1
+            counters["errors"] += int(error)
+            counters["retries"] += retries
+            counters["latency_total"] += seconds
+            counters["latency_max"] = max(counters["latency_max"], seconds)
+            counters["input_tokens"] += input_tokens
+            counters["output_tokens"] += output_tokens
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        """Returns a copy of the counters, with the mean latency of each operation."""
+        with self._lock:
+            snapshot = {operation: dict(counters) for operation, counters in self._operations.items()}
+        for counters in snapshot.values():
+            counters["latency_mean"] = counters["latency_total"] / counters["calls"]
+        return snapshot
+
+
+class Provider:
+    """
+    Base class of the model providers.
+
+    A provider is created once per process and shared by every caller. Each
+    call goes through `call`, which holds a slot of the concurrency limit,
+    retries failures with exponential backoff and records the latency and
+    token counters.
+
+    Args:
+        timeout (float): Seconds before a request is abandoned.
+        max_retries (int): Retries of a failed call before the error is raised.
+        concurrency (int): Maximum calls in flight at once, 0 for no limit.
+        backoff (float): Initial backoff in seconds, doubled after every failure.
+    """
+
+    name = "provider"
+
+    def __init__(self, timeout: float = 60, max_retries: int = 2, concurrency: int = 0, backoff: float = 1.0,
+                 sleep: Callable[[float], None] = time.sleep):
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.stats = ProviderStats()
+        self._slots = threading.BoundedSemaphore(concurrency) if concurrency > 0 else None
+        self._sleep = sleep
+
+    def slot(self):
+        """Returns a context manager holding one slot of the concurrency limit."""
+        return self._slots if self._slots is not None else nullcontext()
+
+    def call(self, operation: str, fn: Callable[..., Any], *args, retries: Optional[int] = None,
+             usage: Callable[[Any], tuple] = lambda result: (0, 0), hold_slot: bool = True, **kwargs) -> Any:
+        """
+        Calls fn(*args, **kwargs) under the provider's limits.
+
+        Args:
+            operation (str): The name the call is counted under ("embed", "generate", ...).
+            fn (Callable): The client call.
+            retries (Optional[int]): Overrides the provider's max_retries for this call.
+            usage (Callable): Returns the (input, output) token counts of a result.
+            hold_slot (bool): False when the caller already holds a concurrency slot.
+
+        Returns:
+            Any: The result of fn.
+        """
+        retries = self.max_retries if retries is None else retries
+        attempt = 0
+        start = time.perf_counter()
+        while True:
+            try:
+                with self.slot() if hold_slot else nullcontext():
+                    result = fn(*args, **kwargs)
+            except Exception as e:
+                if attempt >= retries:
+                    self.stats.record(operation, time.perf_counter() - start, error=True, retries=attempt)
+                    raise
+                delay = self.backoff * (2 ** attempt) * (1 + random.random() * 0.1)
+                print(f"{self.name} {operation} failed ({e}), retrying in {delay:.2f}s")
+                self._sleep(delay)
+                attempt += 1
+                continue
+            input_tokens, output_tokens = usage(result)
+            self.stats.record(operation, time.perf_counter() - start, retries=attempt,
+                              input_tokens=input_tokens, output_tokens=output_tokens)
+            return result
+
+    def embed(self, texts: List[str], model_name: str, retries: Optional[int] = None) -> List[List[float]]:
+        raise NotImplementedError
+
+    def generate(self, prompt: str, model_name: str) -> str:
+        raise NotImplementedError
+
+    def stream(self, prompt: str, model_name: str) -> Iterator[str]:
+        raise NotImplementedError
+
+
+class GeminiProvider(Provider):
+    """
+    Gemini embeddings and generation. The client is configured once and one
+    GenerativeModel is kept per model name, so requests reuse its connections.
+    """
+
+    name = "gemini"
+
+    def __init__(self, **limits):
+        super().__init__(**limits)
+        import google.generativeai as genai
+
+        genai.configure(api_key=GOOGLE_API_KEY)
+        self._genai = genai
+        self._models = {}
+        self._models_lock = threading.Lock()
+
+    def model(self, model_name: str):
+        with self._models_lock:
+            if model_name not in self._models:
+                self._models[model_name] = self._genai.GenerativeModel(model_name)
+            return self._models[model_name]
+
+    @staticmethod
+    def _usage(response) -> tuple:
+        usage = getattr(response, "usage_metadata", None)
+        if usage is None:
+            return 0, 0
+        return getattr(usage, "prompt_token_count", 0) or 0, getattr(usage, "candidates_token_count", 0) or 0
+
+    def embed(self, texts: List[str], model_name: str, retries: Optional[int] = None) -> List[List[float]]:
+        response = self.call("embed", self._genai.embed_content, retries=retries, model=model_name, content=texts,
+                             request_options={"timeout": self.timeout})
+        return response["embedding"]
+
+    def generate(self, prompt: str, model_name: str) -> str:
+        response = self.call("generate", self.model(model_name).generate_content, prompt, usage=self._usage,
+                             request_options={"timeout": self.timeout})
+        return response.text
+
+    def stream(self, prompt: str, model_name: str) -> Iterator[str]:
+        # Only opening the stream is retried: once text was sent to the caller it cannot be taken back.
+        # The concurrency slot is held until the stream is consumed.
+        start = time.perf_counter()
+        with self.slot():
+            responses = self.call("stream_open", self.model(model_name).generate_content, prompt, stream=True,
+                                  hold_slot=False, request_options={"timeout": self.timeout})
+            usage = (0, 0)
+            for response in responses:
+                usage = self._usage(response) if getattr(response, "usage_metadata", None) else usage
+                if response.parts:  # Safety and finish-reason chunks carry no text
+                    yield response.text
+        self.stats.record("stream", time.perf_counter() - start, input_tokens=usage[0], output_tokens=usage[1])
+
+
+
+class MockProvider(Provider):
+    """
+    Deterministic local provider for tests, offline runs and benchmarks.
+
+    Embeddings are pseudo-random unit vectors seeded by the hash of the text,
+    so identical text always gets the same vector. Answers are pseudo-random
+    words seeded by the hash of the prompt, produced with a simulated time to
+    first token and per-token delay. Token counts are word counts.
+
+    Args:
+        dim (int): Dimension of the embeddings.
+        embed_latency (float): Simulated seconds per embedding request.
+        tokens (int): Words in each answer.
+        first_token_latency (float): Simulated seconds before the first word.
+        token_latency (float): Simulated seconds between words.
+    """
+
+    name = "mock"
+    WORDS = ("the server confluence page space user install database backup upgrade "
+             "plugin node cluster license configure memory port proxy service admin").split()
+
+    def __init__(self, dim: int = 768, embed_latency: float = 0.0, tokens: int = 64,
+                 first_token_latency: float = 0.0, token_latency: float = 0.0, **limits):
+        super().__init__(**limits)
+        self.dim = dim
+        self.embed_latency = embed_latency
+        self.tokens = tokens
+        self.first_token_latency = first_token_latency
+        self.token_latency = token_latency
+
+    @staticmethod
+    def _seed(text: str) -> int:
+        return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little")
+
+    def _embed(self, texts: List[str]) -> List[np.ndarray]:
+        if self.embed_latency:
+            time.sleep(self.embed_latency)
+        vectors = []
+        for text in texts:
+            vector = np.random.default_rng(self._seed(text)).standard_normal(self.dim, dtype=np.float32)
+            vectors.append(vector / np.linalg.norm(vector))
+        return vectors
+
+    def _words(self, prompt: str) -> Iterator[str]:
+        rng = random.Random(self._seed(prompt))
+        if self.first_token_latency:
+            time.sleep(self.first_token_latency)
+        for i in range(self.tokens):
+            if i and self.token_latency:
+                time.sleep(self.token_latency)
+            yield ("" if i == 0 else " ") + rng.choice(self.WORDS)
+
+    def embed(self, texts: List[str], model_name: str, retries: Optional[int] = None) -> List[List[float]]:
+        return self.call("embed", self._embed, texts, retries=retries,
+                         usage=lambda result: (sum(len(text.split()) for text in texts), 0))
+
+    def generate(self, prompt: str, model_name: str) -> str:
+        return self.call("generate", lambda: "".join(self._words(prompt)),
+                         usage=lambda result: (len(prompt.split()), len(result.split())))
+
+    def stream(self, prompt: str, model_name: str) -> Iterator[str]:
+        start = time.perf_counter()
+        words = 0
+        with self.slot():
+            for word in self._words(prompt):
+                words += 1
+                yield word
+        self.stats.record("stream", time.perf_counter() - start, input_tokens=len(prompt.split()), output_tokens=words)
+
+
+PROVIDERS = {"gemini": GeminiProvider, "mock": MockProvider}
+_providers: Dict[str, Provider] = {}
+_providers_lock = threading.Lock()
+
+def get_provider(name: str, **options) -> Provider:
+    """
+    Returns the shared provider registered under the given name ("gemini" or
+    "mock"), created on first use with the provider_* limits from
+    rag_config.yml, and for the mock provider the fake_llm_* answer length
+    and latencies. The options override them when the provider is created.
+    """
+    with _providers_lock:
+        if name not in _providers:
+            if name not in PROVIDERS:
+                raise ValueError(f"Unknown provider: {name}")
+            limits = {
+                "timeout": config.get("provider_timeout_seconds", 60),
+                "max_retries": config.get("provider_max_retries", 2),
+                "concurrency": config.get("provider_concurrency", 8),
+            }
+            if name == "mock":
+                limits.update({
+                    "tokens": config.get("fake_llm_tokens", 64),
+                    "first_token_latency": config.get("fake_llm_first_token_latency", 0.0),
+                    "token_latency": config.get("fake_llm_token_latency", 0.0),
+                })
+            _providers[name] = PROVIDERS[name](**{**limits, **options})
+        return _providers[name]
+
+def provider_stats() -> Dict[str, Dict[str, Dict[str, float]]]:
+    """Returns the call counters of every provider created in this process."""
+    with _providers_lock:
+        providers = dict(_providers)
+    return {name: provider.stats.snapshot() for name, provider in providers.items()}
@@ -0,0 +1,82 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+
+def normalize_query(query: str) -> str:
+    """
+    Normalizes a query so that trivially different spellings share cache entries.
+    """
+    return " ".join(query.lower().split())
+
+
+class TTLCache:
+    """
+    Thread-safe LRU cache whose entries also expire after ttl seconds.
+
+    Args:
+        max_entries (int): Number of entries kept before the least recently used one is evicted.
+        ttl (float): Seconds an entry stays valid, 0 for no expiry.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and self.ttl and time.monotonic() - item[1] > self.ttl:
+                del self._data[key]
+                item = None
+            if item is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def set(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._data[key] = (value, time.monotonic())
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self._data)}
+
+
+class QueryCache:
+    """
+    Two-level cache for the RAG endpoint.
+
+    The first level maps a normalized query to its embedding. The second maps
+    (query, retrieved chunk ids, prompt template, llm model) to the generated
+    answer and is cleared whenever the index generation changes.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 0):
+        self.embeddings = TTLCache(max_entries, ttl)
+        self.answers = TTLCache(max_entries, ttl)
+        self._generation = None
+
+    def check_generation(self, generation: int) -> None:
+        """
+        Drops cached answers that were generated against a previous index.
+        """
+        if generation != self._generation:
+            self.answers.clear()
+            self._generation = generation
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        return {"embeddings": self.embeddings.stats(), "answers": self.answers.stats()}
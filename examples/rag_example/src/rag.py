@@ -1,74 +1,105 @@
-import sys
-import pathlib
 import json
-import google.generativeai as genai
-import faiss
-import os
-import numpy as np
-import yaml
-
-chunks = []
-faiss_index = None
-
-GOOGLE_API_KEY = os.environ.get('GOOGLE_DEV_API')
-
-def load_config(config_file="rag_config.yml"):
-    """
-    Loads configuration from a YAML file.
-
-    Args:
-        config_file (str): The path to the configuration file.
+import time
+from concurrent.futures import ThreadPoolExecutor
 
-    Returns:
-        dict: The configuration parameters.
-    """
-    with open(config_file, "r") as file:
-        config = yaml.safe_load(file)
-    return config
+import numpy as np
 
-config = load_config()
+from bm25 import reciprocal_rank_fusion
+from context import assemble_context
+from embed_engine import get_embedding_backend
+from index import search_parameters
+from index_manager import get_index_manager
+from llm import get_llm_backend
+from query_cache import QueryCache, normalize_query
+from settings import get_config
+from telemetry import in_context, record_span, span
+from vectors import as_float32
+
+config = get_config()
 llm_model = config["llm_model"]
 embedding_model = config["embedding_model"]
 prompt_template = config["prompt"]
 num_retrievals = config["num_retrival"]
+hybrid_search = config.get("hybrid_search", True)
+hybrid_lexical_weight = config.get("hybrid_lexical_weight", 0.5)
+hybrid_rrf_k = config.get("hybrid_rrf_k", 60)
+hybrid_candidates = config.get("hybrid_candidates", 20)
+bm25_max_postings = config.get("bm25_max_postings", 2000)
+rag_batch_concurrency = config.get("rag_batch_concurrency", 4)
+rag_batch_max_queries = config.get("rag_batch_max_queries", 256)
+context_token_budget = config.get("context_token_budget", 0)
+context_merge = config.get("context_merge", True)
+context_dedup_threshold = config.get("context_dedup_threshold", 0.0)
+llm_backend = config.get("llm_backend", "gemini")
+
+query_cache = QueryCache(
+    max_entries=config.get("query_cache_max_entries", 1024),
+    ttl=config.get("query_cache_ttl_seconds", 3600),
+)
+
+_backends = {}
+
+def get_backend(kind, model_name):
+    """
+    Returns the embedding or LLM backend of a model. The backends share the
+    providers of providers.py, so each client is configured once per process
+    and every call gets the same timeouts, retries and concurrency limit.
+
+    Args:
+        kind (str): "embedding" or "llm".
+        model_name (str): The name of the model.
+    """
+    backend = _backends.get((kind, model_name))
+    if backend is None:
+        if kind == "embedding":
+            backend = get_embedding_backend(config.get("embedding_backend", "gemini"), model_name)
+        else:
+            backend = get_llm_backend(llm_backend, model_name)
+        _backends[(kind, model_name)] = backend
+    return backend
 
 def embed_text(text, model_name=embedding_model):
     """
     Embeds the given text using the specified model.
 
     Args:
-        text (List[str]): The text to embed.
+        text (Union[str, List[str]]): The text to embed.
         model_name (str): The name of the embedding model.
 
     Returns:
-        np.ndarray: The embeddings as a NumPy array.
+        np.ndarray: The float32 embedding of a single text, or one embedding per row for a list.
     """
-    genai.configure(api_key=GOOGLE_API_KEY)
-    embeddings = genai.embed_content(model=model_name, content=text)
-    return np.array(embeddings["embedding"])
+    texts = [text] if isinstance(text, str) else list(text)
+    embeddings = as_float32(get_backend("embedding", model_name).embed(texts))  # Faiss wants float32, not the float64 of a list
+    return embeddings[0] if isinstance(text, str) else embeddings
 
-def startup_event():
+def embed_query(query, normalized, model_name=embedding_model):
     """
-    Loads chunks and Faiss index from files.
+    Returns the embedding of a query from the query cache, embedding and
+    caching it on a miss, and whether it was a cache hit.
     """
-    global chunks, faiss_index
+    query_embedding = query_cache.embeddings.get((normalized, model_name))
+    if query_embedding is not None:
+        return query_embedding, True
+    query_embedding = embed_text(query, model_name)
+    query_cache.embeddings.set((normalized, model_name), query_embedding)
+    return query_embedding, False
 
-    current_dir = pathlib.Path().parent.resolve()
-    chunks_file = str(current_dir / "temp" / "chunks" / "output.json")
-    index_file = str(current_dir / "temp" / "faiss_files" / "vector_index.bin")
-
-    try:
-        with open(chunks_file, "r", encoding="utf-8") as f:
-            chunks = json.load(f)
-        faiss_index = faiss.read_index(index_file)
-        print("Data loaded successfully.")
-    except Exception as e:
-        print(f"Error loading data: {e}")
+def startup_event():
+    """
+    Loads chunks and Faiss index from files into the resident index manager.
+    """
+    get_index_manager().reload()
 
 def rag_reponse(query: str,num_retrievals = num_retrievals, model_name: str = embedding_model):
     """
     Performs retrieval-augmented generation (RAG) for a given query.
 
+    Query embeddings and generated answers are served from the query cache
+    when possible; the "cache" entry of the response tells which levels hit.
+    The "context" entry reports how the retrieved chunks were packed into the
+    prompt and how many tokens that saved.
+
     Args:
         query (str): The query to process.
         model_name (str): The name of the embedding model.
@@ -76,61 +107,235 @@ def rag_reponse(query: str,num_retrievals = num_retrievals, model_name: str = em
     Returns:
         Dict[str, Any]: The RAG response or an error message.
     """
-    startup_event()
-    global chunks, faiss_index
+    manager = get_index_manager()
+    chunks, faiss_index, bm25 = manager.get_hybrid()
 
     if not chunks or faiss_index is None:
         return {"error": "Data not loaded. Check server logs."}
 
+    query_cache.check_generation(manager.generation)
+    normalized = normalize_query(query)
+    cache_hits = {"embedding": False, "answer": False}
+
     try:
-        query_embedding = embed_text(query, model_name)
-        retrieved_chunks = knn_search_with_text_retrieval(faiss_index, query_embedding, num_retrievals, chunks)
+        with span("rag.embed", items=1):
+            query_embedding, cache_hits["embedding"] = embed_query(query, normalized, model_name)
+
+        with span("rag.search", items=1) as search:
+            ids = retrieve(faiss_index, bm25, query_embedding.reshape(1, -1), [query], num_retrievals)
+            retrieved_chunks = lookup_chunk_matrix(ids, chunks)[0]
+            search.set(bytes=sum(len(text.encode("utf-8")) for _, text in retrieved_chunks))
 
         if not retrieved_chunks:
             return {"error": "No relevant information found for your query."}
 
-        # Format retrieved chunks for the prompt:
-        formatted_chunks = "\n---\n".join(retrieved_chunks)
+        # Merge overlapping chunks, drop near-duplicates and fit the token budget:
+        formatted_chunks, context_stats = build_context(retrieved_chunks, chunks)
 
-        gemini_response = generate_response(formatted_chunks, query)
+        answer_key = (normalized, tuple(chunk_id for chunk_id, _ in retrieved_chunks), prompt_template, llm_model)
+        gemini_response = query_cache.answers.get(answer_key)
+        if gemini_response is None:
+            with span("rag.generate", items=1) as generate:
+                gemini_response = generate_response(formatted_chunks, query)
+                generate.set(bytes=len(gemini_response.encode("utf-8")))
+            query_cache.answers.set(answer_key, gemini_response)
+        else:
+            cache_hits["answer"] = True
 
-        return {"result": gemini_response}
+        return {"result": gemini_response, "cache": cache_hits, "context": context_stats}
     except Exception as e:
         print(f"Error during search: {e}")
         return {"error": str(e)}
 
-def knn_search_with_text_retrieval(index, query_vector, k, chunks):
+def knn_search(index, query_vector, k):
     """
-    Performs k-NN search and retrieves the corresponding text chunks.
+    Performs k-NN search and returns the ids of the nearest chunks.
+    Approximate indexes are searched with the search_nprobe / search_ef
+    values from rag_config.yml.
 
     Args:
         index (faiss.Index): The Faiss index.
         query_vector (np.ndarray): The query vector.
         k (int): The number of nearest neighbors to retrieve.
-        chunks (List[str]): The list of text chunks.
 
     Returns:
-        List[str]: The retrieved text chunks.
+        List[int]: The chunk ids, nearest first.
     """
-    try:
-        if query_vector.ndim == 1:
-            query_vector = query_vector.reshape(1, -1)
+    ids = knn_search_batch(index, query_vector.reshape(1, -1), k)
+    return [int(i) for i in ids[0] if i >= 0]  # Faiss pads with -1 when fewer than k vectors exist
 
-        D, I = index.search(query_vector, k)
-        results = []
+def knn_search_batch(index, query_vectors, k):
+    """
+    Searches the nearest chunks of several queries with one Faiss call.
 
-        for i in range(len(I[0])):
-            index_val = I[0][i]
-            try:
-                text = chunks[index_val]
-                results.append(text)
-            except KeyError:
-                print(f"Warning: Index {index_val} not found in the chunks dictionary.")
+    Args:
+        index (faiss.Index): The Faiss index.
+        query_vectors (np.ndarray): One query vector per row.
+        k (int): The number of nearest neighbors to retrieve per query.
 
-        return results
-    except Exception as e:
-        print(f"Error during k-NN search: {e}")
-        return []
+    Returns:
+        np.ndarray: A (queries, k) int64 array of chunk ids, nearest first, padded with -1.
+    """
+    query_vectors = as_float32(query_vectors)
+    D, I = index.search(query_vectors, k, params=search_parameters(index))
+    return I
+
+def retrieve(index, bm25, query_vectors, queries, k, lexical_weight: float = hybrid_lexical_weight):
+    """
+    Retrieves the k best chunk ids of each query.
+
+    With hybrid_search enabled and a BM25 index available, the top
+    hybrid_candidates ids of the vector search and of the BM25 search are
+    fused with weighted reciprocal-rank fusion; otherwise this is a plain
+    vector search.
+
+    Args:
+        index (faiss.Index): The Faiss index.
+        bm25 (Optional[BM25Index]): The lexical index.
+        query_vectors (np.ndarray): One query vector per row.
+        queries (List[str]): The query texts, for the lexical search.
+        k (int): The number of chunks to retrieve per query.
+        lexical_weight (float): The weight of the lexical ranking, between 0 and 1.
+
+    Returns:
+        np.ndarray: A (queries, k) int64 array of chunk ids, best first, padded with -1.
+    """
+    if not hybrid_search or bm25 is None or not len(bm25):
+        return knn_search_batch(index, query_vectors, k)
+    candidates = max(k, hybrid_candidates)
+    vector_ids = knn_search_batch(index, query_vectors, candidates)
+    ids = np.full((len(queries), k), -1, dtype=np.int64)
+    for i, query in enumerate(queries):
+        lexical_ids, _ = bm25.search(query, candidates, bm25_max_postings)
+        fused = reciprocal_rank_fusion(vector_ids[i][vector_ids[i] >= 0], lexical_ids, k, lexical_weight, hybrid_rrf_k)
+        ids[i, :len(fused)] = fused
+    return ids
+
+def lookup_chunk_matrix(ids, chunks):
+    """
+    Maps a matrix of chunk ids to their text, reading each distinct chunk once.
+
+    Args:
+        ids (np.ndarray): A (queries, k) array of chunk ids, -1 for no result.
+        chunks (Sequence[str]): The text chunks (a list or a ChunkStore).
+
+    Returns:
+        List[List[Tuple[int, str]]]: The (chunk id, text) pairs retrieved for each query, best first.
+    """
+    unique, inverse = np.unique(ids, return_inverse=True)
+    texts = []
+    for index_val in unique.tolist():
+        try:
+            texts.append(chunks[index_val] if index_val >= 0 else None)
+        except (KeyError, IndexError):
+            print(f"Warning: Index {index_val} not found in the chunks dictionary.")
+            texts.append(None)
+    rows = np.array(texts, dtype=object)[inverse.reshape(ids.shape)]
+    return [[(chunk_id, text) for chunk_id, text in zip(id_row, row) if text is not None]
+            for id_row, row in zip(ids.tolist(), rows.tolist())]
+
+def build_context(retrieved, chunks):
+    """
+    Assembles the prompt context of the retrieved chunks with the context_*
+    settings from rag_config.yml, and logs the tokens it saved.
+
+    Args:
+        retrieved (List[Tuple[int, str]]): The (chunk id, text) pairs, best first.
+        chunks: The resident chunks, whose metadata gives the chunk offsets.
+
+    Returns:
+        Tuple[str, Dict[str, int]]: The context and its statistics.
+    """
+    context, stats = assemble_context(retrieved, chunks, context_token_budget, context_merge, context_dedup_threshold)
+    print(f"Context: {stats['chunks']} chunks -> {stats['passages']} passages, "
+          f"{stats['tokens_after']} tokens ({stats['tokens_saved']} saved)")
+    return context, stats
+
+def rag_batch_response(queries, num_retrievals=num_retrievals, model_name: str = embedding_model,
+                       concurrency: int = rag_batch_concurrency):
+    """
+    Performs retrieval-augmented generation for several queries at once.
+
+    The queries missing from the query cache are embedded in one batched
+    call, all of them are searched with one Faiss call over the stacked query
+    matrix, and the answers are generated concurrently, at most
+    `concurrency` LLM calls at a time.
+
+    Args:
+        queries (List[str]): The queries to process.
+        model_name (str): The name of the embedding model.
+        concurrency (int): The maximum number of concurrent LLM calls.
+
+    Returns:
+        Dict[str, Any]: One result per query, in order, each with its cache
+        hits and timings, and the timings of the shared stages; or an error message.
+    """
+    start = time.perf_counter()
+    if len(queries) > rag_batch_max_queries:
+        return {"error": f"A batch can have at most {rag_batch_max_queries} queries."}
+    manager = get_index_manager()
+    chunks, faiss_index, bm25 = manager.get_hybrid()
+    if not chunks or faiss_index is None:
+        return {"error": "Data not loaded. Check server logs."}
+    if not queries:
+        return {"results": [], "timings": {"total": 0.0}}
+
+    query_cache.check_generation(manager.generation)
+    normalized = [normalize_query(query) for query in queries]
+    timings = {}
+
+    embeddings = [query_cache.embeddings.get((n, model_name)) for n in normalized]
+    missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+    missing_set = set(missing)
+    to_embed = {}  # Normalized query -> first query with that text, so duplicates are embedded once
+    for i in missing:
+        to_embed.setdefault(normalized[i], i)
+    if to_embed:
+        with span("rag.embed", items=len(to_embed)):
+            vectors = dict(zip(to_embed, np.asarray(embed_text([queries[i] for i in to_embed.values()], model_name))))
+        for n, vector in vectors.items():
+            query_cache.embeddings.set((n, model_name), vector)
+        for i in missing:
+            embeddings[i] = vectors[normalized[i]]
+    timings["embed"] = time.perf_counter() - start
+
+    search_start = time.perf_counter()
+    with span("rag.search", items=len(queries)):
+        ids = retrieve(faiss_index, bm25, np.vstack(embeddings), queries, num_retrievals)
+        retrieved = lookup_chunk_matrix(ids, chunks)
+    timings["search"] = time.perf_counter() - search_start
+
+    def answer(i):
+        query_start = time.perf_counter()
+        result = {"query": queries[i], "cache": {"embedding": i not in missing_set, "answer": False}}
+        try:
+            if not retrieved[i]:
+                result["error"] = "No relevant information found for your query."
+            else:
+                context, result["context"] = build_context(retrieved[i], chunks)
+                answer_key = (normalized[i], tuple(chunk_id for chunk_id, _ in retrieved[i]), prompt_template, llm_model)
+                response = query_cache.answers.get(answer_key)
+                if response is None:
+                    with span("rag.generate", items=1) as generate:
+                        response = generate_response(context, queries[i])
+                        generate.set(bytes=len(response.encode("utf-8")))
+                    query_cache.answers.set(answer_key, response)
+                else:
+                    result["cache"]["answer"] = True
+                result["result"] = response
+        except Exception as e:
+            print(f"Error answering query {i}: {e}")
+            result["error"] = str(e)
+        now = time.perf_counter()
+        result["timings"] = {"generate": now - query_start, "total": now - start}
+        return result
+
+    generate_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(queries)))) as pool:
+        results = list(pool.map(in_context(answer), range(len(queries))))
+    timings["generate"] = time.perf_counter() - generate_start
+    timings["total"] = time.perf_counter() - start
+    return {"results": results, "timings": timings}
 
 def generate_gemini_prompt(query, responses, prompt_template=prompt_template):
     """
@@ -159,9 +364,114 @@ def generate_response(retrived_chunks, query, model_name=llm_model):
         str: The generated response.
     """
     prompt = generate_gemini_prompt(query, retrived_chunks)
-    genai.configure(api_key=GOOGLE_API_KEY)
-    response = genai.GenerativeModel(model_name).generate_content(prompt)
-    return response.text
+    return get_backend("llm", model_name).generate(prompt)
+
+def generate_response_stream(retrived_chunks, query, model_name=llm_model):
+    """
+    Generates a response with the Gemini model, yielding the text as it is produced.
+
+    Args:
+        retrived_chunks (str): The retrieved text chunks.
+        query (str): The user's query.
+        model_name (str): The name of the Gemini model.
+
+    Yields:
+        str: The next piece of the response.
+    """
+    prompt = generate_gemini_prompt(query, retrived_chunks)
+    yield from get_backend("llm", model_name).stream(prompt)
+
+def rag_stream(query: str, num_retrievals=num_retrievals, model_name: str = embedding_model):
+    """
+    Performs retrieval-augmented generation for a query, yielding events as
+    the answer is produced, so the first words arrive before the whole answer
+    is generated.
 
+    The events are (name, data) pairs:
+        "retrieval": the retrieved chunks and context statistics, sent before generation starts.
+        "token": {"text": ...}, the next piece of the answer.
+        "done": the cache hits and the timings, in seconds since the request
+            started: embed, search, first_token (None for an empty answer)
+            and last_token.
+        "error": {"error": ...}, after which no other event follows.
 
+    A cached answer is sent as a single token.
 
+    Args:
+        query (str): The query to process.
+        model_name (str): The name of the embedding model.
+
+    Yields:
+        Tuple[str, Dict[str, Any]]: The events.
+    """
+    start = time.perf_counter()
+    manager = get_index_manager()
+    chunks, faiss_index, bm25 = manager.get_hybrid()
+    if not chunks or faiss_index is None:
+        yield "error", {"error": "Data not loaded. Check server logs."}
+        return
+
+    query_cache.check_generation(manager.generation)
+    normalized = normalize_query(query)
+    cache_hits = {"embedding": False, "answer": False}
+    timings = {}
+    try:
+        # The spans are closed before each yield: the next event may be produced in another worker context
+        with span("rag.embed", items=1):
+            query_embedding, cache_hits["embedding"] = embed_query(query, normalized, model_name)
+        timings["embed"] = time.perf_counter() - start
+
+        with span("rag.search", items=1):
+            ids = retrieve(faiss_index, bm25, query_embedding.reshape(1, -1), [query], num_retrievals)
+            retrieved_chunks = lookup_chunk_matrix(ids, chunks)[0]
+        if not retrieved_chunks:
+            yield "error", {"error": "No relevant information found for your query."}
+            return
+        formatted_chunks, context_stats = build_context(retrieved_chunks, chunks)
+        timings["search"] = time.perf_counter() - start
+
+        get_metadata = getattr(chunks, "metadata", None)
+        sources = []
+        for chunk_id, text in retrieved_chunks:
+            metadata = get_metadata(chunk_id) if get_metadata else None
+            sources.append({"id": chunk_id, "source_url": (metadata or {}).get("source_url"), "text": text})
+        yield "retrieval", {"chunks": sources, "context": context_stats}
+
+        answer_key = (normalized, tuple(chunk_id for chunk_id, _ in retrieved_chunks), prompt_template, llm_model)
+        gemini_response = query_cache.answers.get(answer_key)
+        if gemini_response is not None:
+            cache_hits["answer"] = True
+            pieces = [gemini_response]
+        else:
+            pieces = generate_response_stream(formatted_chunks, query)
+
+        answer = []
+        timings["first_token"] = None  # Stays None when the model returns no text
+        generate_start = time.perf_counter()
+        for piece in pieces:
+            if timings["first_token"] is None:
+                timings["first_token"] = time.perf_counter() - start
+            answer.append(piece)
+            yield "token", {"text": piece}
+        timings["last_token"] = time.perf_counter() - start
+        if not cache_hits["answer"]:
+            record_span("rag.generate", time.perf_counter() - generate_start, items=1,
+                        bytes=len("".join(answer).encode("utf-8")))
+            query_cache.answers.set(answer_key, "".join(answer))
+        yield "done", {"cache": cache_hits, "timings": timings}
+    except Exception as e:
+        print(f"Error during streaming: {e}")
+        yield "error", {"error": str(e)}
+
+def format_sse(event, data):
+    """
+    Formats an event as a server-sent event (text/event-stream).
+
+    Args:
+        event (str): The event name.
+        data (Dict[str, Any]): The event data, sent as JSON.
+
+    Returns:
+        str: The event, terminated by a blank line.
+    """
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
@@ -0,0 +1,61 @@
+import os
+import pathlib
+import threading
+from typing import Any, Dict, Optional
+
+import yaml
+
+CONFIG_ENV = "RAG_CONFIG"
+CONFIG_NAME = "rag_config.yml"
+project_dir = pathlib.Path(__file__).resolve().parent.parent
+
+_config: Optional[Dict[str, Any]] = None
+_lock = threading.Lock()
+
+def config_path() -> pathlib.Path:
+    """
+    Returns the path of the configuration file: the file named by the
+    RAG_CONFIG environment variable, else rag_config.yml in the working
+    directory, else the rag_config.yml of the project next to src/.
+    """
+    if os.environ.get(CONFIG_ENV):
+        return pathlib.Path(os.environ[CONFIG_ENV]).resolve()
+    local = pathlib.Path.cwd() / CONFIG_NAME
+    if local.exists():
+        return local
+    return project_dir / CONFIG_NAME
+
+def load_config(config_file=None):
+    """
+    Loads configuration from a YAML file.
+
+    Args:
+        config_file (str): The path to the configuration file, resolved by config_path() when None.
+
+    Returns:
+        dict: The configuration parameters.
+    """
+    with open(config_file or config_path(), "r") as file:
+        config = yaml.safe_load(file)
+    return config
+
+def get_config() -> Dict[str, Any]:
+    """
+    Returns the configuration shared by every module of the process. The file
+    is read once, on first use; call reload_config() to read it again.
+    """
+    global _config
+    with _lock:
+        if _config is None:
+            _config = load_config()
+        return _config
+
+def reload_config() -> Dict[str, Any]:
+    """
+    Reads the configuration file again. Modules that copied settings into
+    module-level names at import keep their values until they are reloaded.
+    """
+    global _config
+    with _lock:
+        _config = None
+    return get_config()
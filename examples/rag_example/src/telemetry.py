@@ -0,0 +1,260 @@
+import bisect
+import contextlib
+import contextvars
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from settings import get_config
+
+config = get_config()
+telemetry_max_traces = config.get("telemetry_max_traces", 500)
+
+# Upper bounds, in seconds, of the span duration histogram buckets
+DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_trace_id = contextvars.ContextVar("rag_trace_id", default=None)
+_parent = contextvars.ContextVar("rag_span_parent", default=None)
+
+
+class Span:
+    """
+    One timed stage or sub-step of a trace.
+
+    The code in the span sets the number of items (pages, chunks, vectors,
+    queries) and bytes it processed, and marks the span failed when it
+    returns a failure instead of raising.
+    """
+
+    def __init__(self, name: str, trace_id: Optional[str], parent: Optional[str]):
+        self.name = name
+        self.trace_id = trace_id
+        self.parent = parent
+        self.started = time.time()
+        self.seconds = 0.0
+        self.items = 0
+        self.bytes = 0
+        self.ok = True
+        self.error: Optional[str] = None
+
+    def set(self, items: Optional[int] = None, bytes: Optional[int] = None) -> None:
+        if items is not None:
+            self.items = items
+        if bytes is not None:
+            self.bytes = bytes
+
+    def fail(self, error: str) -> None:
+        self.ok = False
+        self.error = error
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name, "parent": self.parent, "started": self.started, "seconds": self.seconds,
+            "items": self.items, "bytes": self.bytes, "ok": self.ok, "error": self.error,
+        }
+
+
+class Telemetry:
+    """
+    Thread-safe store of the finished spans.
+
+    Every span is aggregated into Prometheus-style counters and a duration
+    histogram per span name and status. Spans with a trace id are also kept
+    per trace, for the timing breakdown of the last max_traces traces.
+    """
+
+    def __init__(self, max_traces: int = telemetry_max_traces):
+        self.max_traces = max_traces
+        self._lock = threading.Lock()
+        self._traces: "OrderedDict[str, List[Dict[str, Any]]]" = OrderedDict()
+        self._metrics: Dict[tuple, Dict[str, Any]] = {}
+
+    def record(self, span: Span) -> None:
+        status = "ok" if span.ok else "error"
+        with self._lock:
+            metrics = self._metrics.setdefault((span.name, status), {
+                "count": 0, "seconds": 0.0, "items": 0, "bytes": 0, "buckets": [0] * len(DURATION_BUCKETS),
+            })
+            metrics["count"] += 1
+            metrics["seconds"] += span.seconds
+            metrics["items"] += span.items
+            metrics["bytes"] += span.bytes
+            bucket = bisect.bisect_left(DURATION_BUCKETS, span.seconds)
+            if bucket < len(DURATION_BUCKETS):
+                metrics["buckets"][bucket] += 1
+            if span.trace_id is None:
+                return
+            if span.trace_id not in self._traces:
+                self._traces[span.trace_id] = []
+                while len(self._traces) > self.max_traces:
+                    self._traces.popitem(last=False)
+            self._traces.move_to_end(span.trace_id)
+            self._traces[span.trace_id].append(span.to_dict())
+
+    def metrics(self) -> Dict[tuple, Dict[str, Any]]:
+        """Returns a copy of the aggregated metrics, keyed by (span name, status)."""
+        with self._lock:
+            return {key: {**metrics, "buckets": list(metrics["buckets"])} for key, metrics in self._metrics.items()}
+
+    def spans(self, trace_id: str) -> List[Dict[str, Any]]:
+        """Returns the finished spans of a trace, oldest first."""
+        with self._lock:
+            return [dict(span) for span in self._traces.get(trace_id, [])]
+
+    def trace_ids(self) -> List[str]:
+        """Returns the ids of the kept traces, most recent first."""
+        with self._lock:
+            return list(reversed(self._traces))
+
+
+_telemetry = Telemetry()
+
+def get_telemetry() -> Telemetry:
+    """Returns the span store shared by the steps and the src modules of this process."""
+    return _telemetry
+
+@contextlib.contextmanager
+def trace(trace_id: Optional[str]) -> Iterator[None]:
+    """
+    Attributes the spans opened in the block, and in the workers it starts
+    through workers.py or in_context, to a trace.
+    """
+    token = _trace_id.set(trace_id)
+    try:
+        yield
+    finally:
+        _trace_id.reset(token)
+
+def current_trace_id() -> Optional[str]:
+    return _trace_id.get()
+
+@contextlib.contextmanager
+def span(name: str, **counts) -> Iterator[Span]:
+    """
+    Times the block as a span of the current trace, nested under the span
+    that is open around it. An exception marks the span failed and is
+    re-raised. Spans opened outside a trace still count in the metrics.
+
+    Args:
+        name (str): The span name, "<stage>" or "<stage>.<sub-step>", e.g. "embed.batch".
+        **counts: The initial items and bytes of the span.
+
+    Yields:
+        Span: The span, to set its items and bytes or mark it failed.
+    """
+    current = Span(name, _trace_id.get(), _parent.get())
+    current.set(**counts)
+    token = _parent.set(name)
+    start = time.perf_counter()
+    try:
+        yield current
+    except BaseException as e:
+        current.fail(f"{type(e).__name__}: {e}")
+        raise
+    finally:
+        current.seconds = time.perf_counter() - start
+        _parent.reset(token)
+        _telemetry.record(current)
+
+def record_span(name: str, seconds: float, items: int = 0, bytes: int = 0, error: Optional[str] = None) -> None:
+    """
+    Records a span that was timed by the caller, for work that cannot be
+    wrapped in a block, such as the tokens yielded by a generator.
+    """
+    current = Span(name, _trace_id.get(), _parent.get())
+    current.started = time.time() - seconds
+    current.seconds = seconds
+    current.set(items=items, bytes=bytes)
+    if error:
+        current.fail(error)
+    _telemetry.record(current)
+
+def in_context(fn: Callable) -> Callable:
+    """
+    Wraps a function so it runs in a copy of the caller's trace and span
+    context, for functions handed to a thread pool, which does not carry
+    context variables over.
+    """
+    context = contextvars.copy_context()
+
+    def run(*args, **kwargs):
+        return context.copy().run(fn, *args, **kwargs)
+    return run
+
+def trace_breakdown(trace_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Returns the timing breakdown of a trace: each span with its start offset
+    from the first span, and the total time, items and bytes per span name.
+
+    Args:
+        trace_id (str): The trace id, the ctx.trace_id of the steps.
+
+    Returns:
+        Optional[Dict[str, Any]]: The breakdown, or None if the trace is unknown or was evicted.
+    """
+    spans = _telemetry.spans(trace_id)
+    if not spans:
+        return None
+    start = min(span["started"] for span in spans)
+    end = max(span["started"] + span["seconds"] for span in spans)
+    totals = {}
+    for span in sorted(spans, key=lambda span: span["started"]):
+        span["offset"] = span.pop("started") - start
+        total = totals.setdefault(span["name"], {"count": 0, "seconds": 0.0, "items": 0, "bytes": 0, "errors": 0})
+        total["count"] += 1
+        total["seconds"] += span["seconds"]
+        total["items"] += span["items"]
+        total["bytes"] += span["bytes"]
+        total["errors"] += int(not span["ok"])
+    spans.sort(key=lambda span: span["offset"])
+    return {
+        "trace_id": trace_id,
+        "ok": all(span["ok"] for span in spans),
+        "elapsed": end - start,
+        "totals": totals,
+        "spans": spans,
+    }
+
+def _labels(**labels) -> str:
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for value in labels.values())
+    return "{" + ",".join(f'{key}="{value}"' for key, value in zip(labels, escaped)) + "}"
+
+def prometheus_metrics() -> str:
+    """
+    Returns the span metrics and the provider call counters of providers.py
+    in the Prometheus text exposition format.
+    """
+    from providers import provider_stats
+
+    lines = [
+        "# HELP rag_span_duration_seconds Duration of the pipeline stages and sub-steps.",
+        "# TYPE rag_span_duration_seconds histogram",
+    ]
+    metrics = sorted(_telemetry.metrics().items())
+    for (name, status), values in metrics:
+        cumulative = 0
+        for bound, count in zip(DURATION_BUCKETS, values["buckets"]):
+            cumulative += count
+            lines.append(f"rag_span_duration_seconds_bucket{_labels(span=name, status=status, le=bound)} {cumulative}")
+        lines.append(f"rag_span_duration_seconds_bucket{_labels(span=name, status=status, le='+Inf')} {values['count']}")
+        lines.append(f"rag_span_duration_seconds_sum{_labels(span=name, status=status)} {values['seconds']}")
+        lines.append(f"rag_span_duration_seconds_count{_labels(span=name, status=status)} {values['count']}")
+    for metric, key, help_text in (("rag_span_items_total", "items", "Items (pages, chunks, vectors, queries) processed by the spans."),
+                                   ("rag_span_bytes_total", "bytes", "Bytes processed by the spans.")):
+        lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} counter"]
+        lines += [f"{metric}{_labels(span=name, status=status)} {values[key]}" for (name, status), values in metrics]
+
+    counters = (("calls", "rag_provider_calls_total", "Calls to the model providers."),
+                ("errors", "rag_provider_errors_total", "Failed calls to the model providers."),
+                ("retries", "rag_provider_retries_total", "Retried calls to the model providers."),
+                ("latency_total", "rag_provider_latency_seconds_total", "Time spent in calls to the model providers."),
+                ("input_tokens", "rag_provider_input_tokens_total", "Input tokens sent to the model providers."),
+                ("output_tokens", "rag_provider_output_tokens_total", "Output tokens received from the model providers."))
+    stats = provider_stats()
+    for key, metric, help_text in counters:
+        lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} counter"]
+        for provider, operations in sorted(stats.items()):
+            for operation, values in sorted(operations.items()):
+                lines.append(f"{metric}{_labels(provider=provider, operation=operation)} {values[key]}")
+    return "\n".join(lines) + "\n"
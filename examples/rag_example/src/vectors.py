@@ -0,0 +1,77 @@
+import pathlib
+from typing import Optional, Tuple
+
+import numpy as np
+
+from settings import get_config
+
+VECTOR_DTYPES = ("float32", "float16", "int8")
+
+config = get_config()
+vector_dtype = config.get("vector_dtype", "float32")
+
+def as_float32(vectors) -> np.ndarray:
+    """
+    Returns the vectors as a C-contiguous float32 matrix, the only layout
+    Faiss accepts. Vectors that already are one are returned as is, without
+    a copy; anything else (lists, float64, float16, views) is converted once.
+    """
+    return np.ascontiguousarray(vectors, dtype=np.float32)
+
+def quantize_int8(vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Quantizes vectors to int8 with a separate range per dimension.
+
+    Each dimension's [min, max] range is mapped onto the 256 int8 values,
+    so dimensions with a small spread keep their precision.
+
+    Args:
+        vectors (np.ndarray): The (n, dim) vectors.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: The int8 codes and a (2, dim) float32
+        array holding the scale and offset of each dimension.
+    """
+    vectors = as_float32(vectors)
+    if not len(vectors):
+        return np.empty(vectors.shape, dtype=np.int8), np.zeros((2, vectors.shape[1]), dtype=np.float32)
+    low = vectors.min(axis=0)
+    scale = (vectors.max(axis=0) - low) / 255
+    scale[scale == 0] = 1  # Constant dimensions decode to their value
+    codes = np.rint((vectors - low) / scale) - 128
+    return codes.astype(np.int8), np.stack([scale, low]).astype(np.float32)
+
+def dequantize_int8(codes: np.ndarray, scale: np.ndarray) -> np.ndarray:
+    """Decodes int8 codes made by quantize_int8 back to float32 vectors."""
+    return as_float32((codes.astype(np.float32) + 128) * scale[0] + scale[1])
+
+def scale_path(filepath: pathlib.Path) -> pathlib.Path:
+    """Returns the file that holds the per-dimension scale of an int8 embeddings file."""
+    filepath = pathlib.Path(filepath)
+    return filepath.with_name(filepath.stem + ".scale.npy")
+
+def encode_vectors(vectors, dtype: str = vector_dtype) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """
+    Converts vectors to the storage dtype.
+
+    Args:
+        vectors: The (n, dim) vectors.
+        dtype (str): "float32", "float16" or "int8".
+
+    Returns:
+        Tuple[np.ndarray, Optional[np.ndarray]]: The stored array, and the
+        per-dimension scale for int8 (None otherwise).
+    """
+    if dtype not in VECTOR_DTYPES:
+        raise ValueError(f"Unknown vector dtype: {dtype}")
+    if dtype == "int8":
+        return quantize_int8(vectors)
+    return np.ascontiguousarray(vectors, dtype=dtype), None
+
+def decode_vectors(stored: np.ndarray, scale: Optional[np.ndarray] = None) -> np.ndarray:
+    """Returns stored vectors of any storage dtype as float32."""
+    if stored.dtype == np.int8:
+        if scale is None:
+            raise ValueError("int8 vectors need their per-dimension scale")
+        return dequantize_int8(stored, scale)
+    return as_float32(stored)
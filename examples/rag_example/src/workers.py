@@ -0,0 +1,45 @@
+import asyncio
+import contextvars
+import functools
+import os
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+_executor = None
+
+def get_executor() -> ThreadPoolExecutor:
+    """
+    Returns the worker pool shared by the step handlers, created on first use.
+    The heavy stage work (HTML parsing, numpy, Faiss, HTTP calls) runs here
+    so the event loop keeps serving other handlers. Most of a RAG request is
+    spent waiting on the embedding and LLM APIs, so the pool is sized for
+    I/O-bound work like the standard library default, not by cores alone.
+    """
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=min(32, (os.cpu_count() or 1) + 4), thread_name_prefix="rag-worker")
+    return _executor
+
+async def run_in_worker(fn, *args, **kwargs):
+    """
+    Runs a blocking function in the worker pool and awaits its result. The
+    function sees the caller's context variables, so its spans belong to the
+    handler's trace (see telemetry.py).
+    """
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(get_executor(), functools.partial(context.run, fn, *args, **kwargs))
+
+_limits = weakref.WeakKeyDictionary()  # Event loop -> name -> semaphore
+
+async def run_limited(name: str, limit: int, fn, *args, **kwargs):
+    """
+    Like run_in_worker, but at most `limit` calls under the same name run at
+    once. The others wait on the event loop without holding a worker, so a
+    burst of ingestions cannot take the whole pool away from RAG queries.
+    """
+    limits = _limits.setdefault(asyncio.get_running_loop(), {})
+    if name not in limits:
+        limits[name] = asyncio.Semaphore(max(1, limit))
+    async with limits[name]:
+        return await run_in_worker(fn, *args, **kwargs)
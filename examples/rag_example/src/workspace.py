@@ -0,0 +1,166 @@
+import contextlib
+import os
+import pathlib
+import shutil
+import threading
+import time
+import uuid
+from typing import Iterator, Optional
+
+from settings import get_config
+
+try:
+    import fcntl
+except ImportError:  # Windows: commits are only serialized within the process
+    fcntl = None
+
+config = get_config()
+ingest_concurrency = config.get("ingest_concurrency", 4)
+keep_run_workspaces = config.get("keep_run_workspaces", False)
+run_workspace_max_age_seconds = config.get("run_workspace_max_age_seconds", 86400)
+
+def new_run_id() -> str:
+    """Returns a new ingestion run id, for runs that are not started by a traced event."""
+    return uuid.uuid4().hex
+
+class RunWorkspace:
+    """
+    The intermediate files of one ingestion run.
+
+    A run with an id keeps its parsed text, chunks and embeddings under
+    temp/runs/<run_id>, so concurrent runs never read or overwrite each
+    other's files. Each stage writes its files atomically and then marks
+    itself done; the next stage only starts from a stage marked done. A run
+    without an id uses the shared temp/text, temp/chunks and temp/embeddings
+    directories, as the stages did before runs existed, and has no markers.
+
+    Args:
+        run_id (Optional[str]): The run id, usually the trace id of the /api/parse call.
+        temp_dir (Optional[pathlib.Path]): The temp directory, temp/ in the working directory by default.
+    """
+
+    def __init__(self, run_id: Optional[str] = None, temp_dir: Optional[pathlib.Path] = None):
+        temp_dir = pathlib.Path(temp_dir) if temp_dir else pathlib.Path().parent.resolve() / "temp"
+        self.run_id = run_id
+        self.root = temp_dir / "runs" / run_id if run_id else temp_dir
+
+    @property
+    def text_dir(self) -> pathlib.Path:
+        return self.root / "text"
+
+    @property
+    def chunks_dir(self) -> pathlib.Path:
+        return self.root / "chunks"
+
+    @property
+    def embeddings_dir(self) -> pathlib.Path:
+        return self.root / "embeddings"
+
+    def mark_done(self, stage: str) -> None:
+        """Records that a stage has written all of its files."""
+        if self.run_id:
+            self.root.mkdir(parents=True, exist_ok=True)
+            (self.root / f"{stage}.done").touch()
+
+    def ready(self, *stages: str) -> bool:
+        """Returns whether every given stage of the run is done."""
+        return not self.run_id or all((self.root / f"{stage}.done").exists() for stage in stages)
+
+    def claim(self, stage: str) -> bool:
+        """
+        Claims a stage of the run for the caller. Only the first caller gets
+        True, so a stage triggered by several events runs once.
+        """
+        if not self.run_id:
+            return True
+        self.root.mkdir(parents=True, exist_ok=True)
+        try:
+            os.close(os.open(self.root / f"{stage}.claim", os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            return True
+        except FileExistsError:
+            return False
+
+    def release(self, stage: str) -> None:
+        """Gives up a claimed stage that failed, so a later event can run it again."""
+        if self.run_id:
+            (self.root / f"{stage}.claim").unlink(missing_ok=True)
+
+    def remove(self) -> None:
+        """Deletes the run's files once its document is committed to the index."""
+        if self.run_id and not keep_run_workspaces:
+            shutil.rmtree(self.root, ignore_errors=True)
+
+def purge_stale_runs(max_age_seconds: float = run_workspace_max_age_seconds,
+                     temp_dir: Optional[pathlib.Path] = None) -> int:
+    """
+    Deletes the workspaces of runs that have not written anything for
+    max_age_seconds. A run that fails in its chunk, embed or index stage is
+    never committed, so nothing else removes its files.
+
+    Args:
+        max_age_seconds (float): The age after which a run is abandoned. 0 keeps every run.
+        temp_dir (Optional[pathlib.Path]): The temp directory, temp/ in the working directory by default.
+
+    Returns:
+        int: The number of workspaces deleted.
+    """
+    temp_dir = pathlib.Path(temp_dir) if temp_dir else pathlib.Path().parent.resolve() / "temp"
+    runs_dir = temp_dir / "runs"
+    if not max_age_seconds or not runs_dir.is_dir():
+        return 0
+    cutoff = time.time() - max_age_seconds
+    purged = 0
+    for root in runs_dir.iterdir():
+        try:
+            # Stage markers are created in the root, and stage files in its directories
+            last_write = max(path.stat().st_mtime for path in [root, *root.iterdir()])
+        except (FileNotFoundError, NotADirectoryError):
+            continue
+        if last_write < cutoff:
+            shutil.rmtree(root, ignore_errors=True)
+            purged += 1
+    return purged
+
+@contextlib.contextmanager
+def atomic_write(filepath: pathlib.Path, mode: str = "w", **kwargs) -> Iterator:
+    """
+    Opens a temporary file next to filepath and renames it into place when the
+    block succeeds, so readers see either the previous file or the complete
+    new one. The temporary file is removed if the block fails.
+
+    Args:
+        filepath (pathlib.Path): The destination file.
+        mode (str): "w" or "wb".
+        **kwargs: Passed to open (encoding, ...).
+    """
+    filepath = pathlib.Path(filepath)
+    filepath.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = filepath.with_name(f".{filepath.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        with open(tmp_path, mode, **kwargs) as f:
+            yield f
+        os.replace(tmp_path, filepath)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+_commit_lock = threading.Lock()
+
+@contextlib.contextmanager
+def commit_lock(directory: pathlib.Path) -> Iterator[None]:
+    """
+    Serializes the commits to the shared index in a directory, across the
+    threads of this process and, through a lock file, across processes.
+    """
+    directory = pathlib.Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    with _commit_lock:
+        if fcntl is None:
+            yield
+            return
+        with open(directory / ".commit.lock", "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
@@ -1,12 +1,18 @@
-import json
+import sys
 import pathlib
-import subprocess
-import logging
+
+src_path = pathlib.Path().parent / "src"
+sys.path.insert(0, str(src_path))  # Ahead of the standard library, which also has a "chunk" module
+
+from chunk import save_chunks
+from telemetry import span, trace
+from workers import run_limited
+from workspace import ingest_concurrency
 
 config = {
     'type': 'event',
     'name': 'Chunk & Save',
-    'description': 'Reads raw text from temp/text, chunks and saves to temp/chunks',
+    'description': 'Reads the raw text of a run, chunks it and saves the chunks to the run workspace',
     'subscribes': ['parse.complete'],
     'emits': ['chunk.complete'],
     'flows': ['parse-embed-rag'],
@@ -14,25 +20,26 @@ config = {
 
 async def handler(req, ctx):
     """
-    Handler function to run the chunking script and emit the completion event.
+    Handler function to chunk the parsed text in the worker pool and emit the completion event.
 
     Args:
         req: The request object.
         ctx: The context object.
     """
-    script_path = pathlib.Path().parent.parent / "src" / "chunk.py"
-    
-    try:
-        result = subprocess.run(["python3", str(script_path)], capture_output=True, text=True)
-        if result.returncode == 0:
-            ctx.logger.info("Parsed website text was read, chunked, and saved")
-        else:
-            ctx.logger.error(f"Error chunking parsed website data: {result.stderr}")
-    except Exception as e:
-        ctx.logger.error(f"Error chunking parsed website data: {e}")
+    run_id = getattr(req, 'run_id', None)
+    with trace(getattr(ctx, 'trace_id', None) or run_id), span('chunk', items=1) as stage:
+        try:
+            if await run_limited('ingest', ingest_concurrency, save_chunks, run_id=run_id):
+                ctx.logger.info(f"Parsed website text was read, chunked, and saved for run {run_id}")
+            else:
+                stage.fail('no chunks saved')
+                ctx.logger.error(f"No chunks were saved for run {run_id}")
+        except Exception as e:
+            stage.fail(str(e))
+            ctx.logger.error(f"Error chunking parsed website data: {e}")
     
     await ctx.emit({
         'type': 'chunk.complete',
-        'data': {'message': 'chunking completed'}
+        'data': {'message': 'chunking completed', 'run_id': run_id}
     })
-    return
\ No newline at end of file
+    return
@@ -1,26 +1,38 @@
+import sys
 import pathlib
-import subprocess
-import os
+
+src_path = pathlib.Path().parent / "src"
+sys.path.insert(0, str(src_path))  # Ahead of the standard library, which also has a "chunk" module
+
+from embed import read_embed_chunks
+from telemetry import span, trace
+from workers import run_limited
+from workspace import ingest_concurrency
 
 config = {
     'type': 'event',
     'name': 'Embed & Save',
-    'description': 'Reads chunked data, embeds and saves it to temp/embeddings',
+    'description': 'Reads the chunks of a run, embeds them and saves the embeddings to the run workspace',
     'subscribes': ['chunk.complete'],
     'emits': ['embed.complete'],
     'flows': ['parse-embed-rag'],
 }
 
 async def handler(req, ctx):
-    script_path = pathlib.Path().parent / "src" / "embed.py"
-    try:
-        subprocess.run(["python", str(script_path)])
-        ctx.logger.info("Chunked Text was embedded successfully!")
-    except Exception as e:
-        ctx.logger.info(f"Error embedding chunked text: {e}")
+    run_id = getattr(req, 'run_id', None)
+    with trace(getattr(ctx, 'trace_id', None) or run_id), span('embed', items=1) as stage:
+        try:
+            if await run_limited('ingest', ingest_concurrency, read_embed_chunks, run_id=run_id):
+                ctx.logger.info(f"Chunked Text was embedded successfully for run {run_id}!")
+            else:
+                stage.fail('no embeddings saved')
+                ctx.logger.error(f"No embeddings were saved for run {run_id}")
+        except Exception as e:
+            stage.fail(str(e))
+            ctx.logger.error(f"Error embedding chunked text: {e}")
     
     await ctx.emit({
         'type': 'embed.complete',
-        'data': {'message': 'embedding completed'}
+        'data': {'message': 'embedding completed', 'run_id': run_id}
     })
-    return
\ No newline at end of file
+    return
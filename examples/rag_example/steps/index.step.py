@@ -1,27 +1,42 @@
-import os
+import sys
 import pathlib
-import subprocess
+
+src_path = pathlib.Path().parent / "src"
+sys.path.insert(0, str(src_path))  # Ahead of the standard library, which also has a "chunk" module
+
+from index import index_embeddings
+from telemetry import span, trace
+from workers import run_limited
+from workspace import ingest_concurrency
 
 config = {
     'type': 'event',
     'name': 'Index & Save',
-    'description': 'Reads Embedding files from temp/embeddings, indexes them in Faiss and saves the index to temp/faiss_files',
+    'description': 'Once both the chunks and the embeddings of a run are saved, indexes them in Faiss and commits the index to temp/faiss_files',
     'subscribes': ['chunk.complete', 'embed.complete'],
     'emits': ['index.complete'],
     'flows': ['parse-embed-rag'],
 }
 
 async def handler(req, ctx):
-    script_path = pathlib.Path().parent / "src" / "index.py"
-    
-    try:
-        subprocess.run(["python", str(script_path)])
-        ctx.logger.info("Embedded data was indexed successfully!")
-    except Exception as e:
-        ctx.logger.info(f"Error indexing embedded text: {e}")
-    
+    # Fan-in: both events trigger this step, but a run is only indexed once all of its
+    # prerequisites are done, and only by the first event that finds them done.
+    run_id = getattr(req, 'run_id', None)
+    with trace(getattr(ctx, 'trace_id', None) or run_id), span('index') as stage:
+        try:
+            indexed = await run_limited('ingest', ingest_concurrency, index_embeddings, run_id=run_id)
+        except Exception as e:
+            stage.fail(str(e))
+            ctx.logger.error(f"Error indexing embedded text: {e}")
+            indexed = False
+        stage.set(items=int(indexed))
+    if not indexed:
+        ctx.logger.info(f"Run {run_id} was not indexed on this event")
+        return
+
+    ctx.logger.info(f"Embedded data of run {run_id} was indexed successfully!")
     await ctx.emit({
         'type': 'index.complete',
-        'data': {'message': 'indexing completed'}
+        'data': {'message': 'indexing completed', 'run_id': run_id}
     })
-    return
\ No newline at end of file
+    return
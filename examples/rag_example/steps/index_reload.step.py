@@ -0,0 +1,25 @@
+import sys
+import pathlib
+
+src_path = pathlib.Path().parent / "src"
+sys.path.insert(0, str(src_path))  # Ahead of the standard library, which also has a "chunk" module
+
+from index_manager import get_index_manager
+from telemetry import span, trace
+from workers import run_in_worker
+
+config = {
+    'type': 'event',
+    'name': 'Reload Index',
+    'description': 'Hot-swaps the resident chunks and Faiss index used by the RAG API once indexing completes',
+    'subscribes': ['index.complete'],
+    'emits': [],
+    'flows': ['parse-embed-rag'],
+}
+
+async def handler(req, ctx):
+    manager = get_index_manager()
+    with trace(getattr(ctx, 'trace_id', None) or getattr(req, 'run_id', None)), span('index.reload'):
+        await run_in_worker(manager.reload)
+    ctx.logger.info(f"Resident index reloaded: {manager.stats()}")
+    return
@@ -0,0 +1,24 @@
+import sys
+import pathlib
+
+src_path = pathlib.Path().parent / "src"
+sys.path.insert(0, str(src_path))  # Ahead of the standard library, which also has a "chunk" module
+
+from telemetry import prometheus_metrics
+
+config = {
+    'type': 'api',
+    'name': 'Metrics API',
+    'description': 'exposes the stage and sub-step span metrics and the provider call counters in the Prometheus text format',
+    'path': '/metrics',
+    'method': 'GET',
+    'emits': [],
+    'flows': ['parse-embed-rag'],
+    }
+
+async def handler(req, ctx):
+    return {
+        'status': 200,
+        'headers': {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'},
+        'body': prometheus_metrics()
+        }
@@ -1,33 +1,99 @@
+import sys
 import pathlib
-import subprocess
+
+src_path = pathlib.Path().parent / "src"
+sys.path.insert(0, str(src_path))  # Ahead of the standard library, which also has a "chunk" module
+
+from parse import save_text_to_file
+from pipeline import ingest_url_streaming, ingest_urls, streaming_ingestion
+from telemetry import span, trace
+from workers import run_limited
+from workspace import ingest_concurrency, new_run_id
 
 config = {
     'type': 'api',
     'name': 'Parser API',
-    'description': 'Parses and chunks a given url and saves it to temp/chunks',
+    'description': 'Parses a given url into its own run workspace under temp/runs, or crawls and indexes a list of urls or a sitemap',
     'path': '/api/parse',
     'method': 'POST',
-    'emits': ['parse.complete'],
+    'emits': ['parse.complete', 'index.complete'],
     'flows': ['parse-embed-rag'],
 }
 
 async def handler(req, ctx):
-    input_url = req.body.url
-    script_path = pathlib.Path().parent / "src" / "parse.py"
+    input_url = getattr(req.body, 'url', None)
+    input_urls = getattr(req.body, 'urls', None) or []
+    sitemap = getattr(req.body, 'sitemap', None)
+
+    trace_id = getattr(ctx, 'trace_id', None)
+
+    if input_urls or sitemap:
+        urls = input_urls + ([input_url] if input_url else [])
+        with trace(trace_id), span('crawl', items=len(urls)) as stage:
+            try:
+                report = await run_limited('ingest', ingest_concurrency, ingest_urls, urls, sitemap)
+                ctx.logger.info(f"Websites were crawled and indexed: {report['crawl']}")
+            except Exception as e:
+                stage.fail(str(e))
+                ctx.logger.error(f"Error crawling websites: {e}")
+                return {
+                    'status': 500,
+                    'body': {'status': "motia crawl failed", 'error': str(e)}
+                }
+
+        await ctx.emit({
+            'type': 'index.complete',
+            'data': {'message': 'indexing completed'}
+        })
+
+        return {
+            'status': 200,
+            'body': {'status': "motia crawl completed", 'report': report}
+        }
+
+    if streaming_ingestion:
+        with trace(trace_id), span('ingest', items=1) as stage:
+            try:
+                result = await run_limited('ingest', ingest_concurrency, ingest_url_streaming, input_url)
+                ctx.logger.info(f"Website was streamed, chunked, embedded and indexed: {result}")
+            except Exception as e:
+                stage.fail(str(e))
+                ctx.logger.error(f"Error ingesting website: {e}")
+                return {
+                    'status': 500,
+                    'body': {'status': "motia streaming ingestion failed", 'error': str(e)}
+                }
+
+        await ctx.emit({
+            'type': 'index.complete',
+            'data': {'message': 'indexing completed'}
+        })
+
+        return {
+            'status': 200,
+            'body': {'status': "motia streaming ingestion completed"}
+        }
     
-    try:
-        subprocess.run(["python", str(script_path), input_url])
-        ctx.logger.info("Website was parsed, and text was saved")
-    except Exception as e:
-        ctx.logger.info(f"Error parsing website text: {e}")
+    # Each call gets its own workspace under temp/runs, so parses in flight never overwrite each other
+    run_id = trace_id or new_run_id()
+    with trace(run_id), span('parse', items=1) as stage:
+        try:
+            if await run_limited('ingest', ingest_concurrency, save_text_to_file, input_url, run_id=run_id):
+                ctx.logger.info(f"Website was parsed, and text was saved for run {run_id}")
+            else:
+                stage.fail('no text saved')
+                ctx.logger.error(f"No text was saved for run {run_id}")
+        except Exception as e:
+            stage.fail(str(e))
+            ctx.logger.error(f"Error parsing website text: {e}")
     
     await ctx.emit({
         'type': 'parse.complete',
-        'data': {'message': 'Parsing completed'}
+        'data': {'message': 'Parsing completed', 'run_id': run_id}
     })
     
     return {
         'status': 200,
-        'body': {'status': "motia parse-chunk-embed-index initiated"}
+        'body': {'status': "motia parse-chunk-embed-index initiated", 'run_id': run_id}
     }
 
@@ -1,11 +1,13 @@
 import sys
 import pathlib
-import os
 
-src_path = pathlib.Path().parent / "src" 
-sys.path.append(str(src_path))  
+src_path = pathlib.Path().parent / "src"
+sys.path.insert(0, str(src_path))  # Ahead of the standard library, which also has a "chunk" module
 
 from rag import rag_reponse
+from index_manager import get_index_manager
+from telemetry import span, trace
+from workers import run_in_worker
 
 config = {
     'type': 'api',
@@ -19,13 +21,27 @@ config = {
 
 async def handler(req, ctx):
     query = req.body.query
-    
-    try:
-        result = rag_reponse(query)
-        message = "RAG response was provided to the user query : {}".format(query)
-        ctx.logger.info(message)
-    except:
-        ctx.logger.info("Error responding to user query")
+    result = None
+    cache = None
+    context = None
+    status = 200
+
+    with trace(getattr(ctx, 'trace_id', None)), span('rag', items=1) as stage:
+        try:
+            result = await run_in_worker(rag_reponse, query)
+            cache = result.pop('cache', None)
+            context = result.pop('context', None)
+            if 'error' in result:
+                stage.fail(result['error'])
+                ctx.logger.error("Error responding to user query : {} ({})".format(query, result['error']))
+            else:
+                message = "RAG response was provided to the user query : {}".format(query)
+                ctx.logger.info(message)
+        except Exception as e:
+            stage.fail(str(e))
+            ctx.logger.error("Error responding to user query : {} ({})".format(query, e))
+            result = {'error': str(e)}
+            status = 500
     
     await ctx.emit({
         'type':'rag.completed',
@@ -33,6 +49,6 @@ async def handler(req, ctx):
         })
     
     return{
-        'status':200,
-        'body': {'answer':result}
+        'status':status,
+        'body': {'answer':result, 'cache':cache, 'context':context, 'index':get_index_manager().stats()}
         }
\ No newline at end of file
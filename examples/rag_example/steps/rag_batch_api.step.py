@@ -0,0 +1,56 @@
+import sys
+import pathlib
+
+src_path = pathlib.Path().parent / "src"
+sys.path.insert(0, str(src_path))  # Ahead of the standard library, which also has a "chunk" module
+
+from rag import rag_batch_max_queries, rag_batch_response
+from index_manager import get_index_manager
+from telemetry import span, trace
+from workers import run_in_worker
+
+config = {
+    'type': 'api',
+    'name': 'Rag Batch API',
+    'description': 'performs RAG for a list of queries with one batched embedding call and one index search',
+    'path': '/api/rag/batch',
+    'method': 'POST',
+    'emits': ['rag.completed'],
+    'flows': ['parse-embed-rag'],
+    }
+
+async def handler(req, ctx):
+    queries = getattr(req.body, 'queries', None)
+    if not isinstance(queries, list) or not all(isinstance(query, str) for query in queries):
+        return {
+            'status': 400,
+            'body': {'error': 'queries must be a list of strings'}
+            }
+    if len(queries) > rag_batch_max_queries:
+        return {
+            'status': 400,
+            'body': {'error': f'A batch can have at most {rag_batch_max_queries} queries.'}
+            }
+
+    with trace(getattr(ctx, 'trace_id', None)), span('rag.batch', items=len(queries)) as stage:
+        response = await run_in_worker(rag_batch_response, queries)
+        if 'error' in response:
+            stage.fail(response['error'])
+    if 'error' in response:
+        # The batch size was checked above, so the remaining error is an index that is not loaded
+        ctx.logger.error("Error responding to batch of {} queries: {}".format(len(queries), response['error']))
+        return {
+            'status': 503,
+            'body': {**response, 'index': get_index_manager().stats()}
+            }
+
+    ctx.logger.info("RAG responses were provided to a batch of {} queries".format(len(queries)))
+    await ctx.emit({
+        'type': 'rag.completed',
+        'data': {'message': 'batch rag response provided', 'queries': len(queries)}
+        })
+
+    return {
+        'status': 200,
+        'body': {**response, 'index': get_index_manager().stats()}
+        }
@@ -0,0 +1,59 @@
+import sys
+import pathlib
+
+src_path = pathlib.Path().parent / "src"
+sys.path.insert(0, str(src_path))  # Ahead of the standard library, which also has a "chunk" module
+
+from rag import format_sse, rag_stream
+from telemetry import span, trace
+from workers import run_in_worker
+
+config = {
+    'type': 'api',
+    'name': 'Rag Stream API',
+    'description': 'performs RAG for a given query, streaming the retrieved chunks and then the answer tokens',
+    'path': '/api/rag/stream',
+    'method': 'POST',
+    'emits': ['rag.token', 'rag.completed'],
+    'flows': ['parse-embed-rag'],
+    }
+
+async def handler(req, ctx):
+    query = req.body.query
+    events = rag_stream(query)
+    body = []
+
+    # Each event is produced in the worker pool, so the loop keeps serving other
+    # handlers while the model generates, and is emitted on the flow as soon as it exists.
+    with trace(getattr(ctx, 'trace_id', None)), span('rag.stream', items=1) as stage:
+        while True:
+            event = await run_in_worker(next, events, None)
+            if event is None:
+                break
+            name, data = event
+            body.append(format_sse(name, data))
+            await ctx.emit({
+                'type': 'rag.token',
+                'data': {'query': query, 'event': name, 'data': data}
+                })
+        if name != 'done':
+            stage.fail(data.get('error'))
+
+    if name == 'done' and data['timings'].get('first_token') is None:
+        ctx.logger.info("RAG response for the user query : {} was empty".format(query))
+    elif name == 'done':
+        ctx.logger.info("RAG response was streamed for the user query : {} (first token after {:.3f}s)".format(
+            query, data['timings']['first_token']))
+    else:
+        ctx.logger.error("Error streaming the response to user query : {}".format(data.get('error')))
+
+    await ctx.emit({
+        'type': 'rag.completed',
+        'data': {'message': 'rag response streamed'}
+        })
+
+    return {
+        'status': 200,
+        'headers': {'Content-Type': 'text/event-stream', 'Cache-Control': 'no-cache'},
+        'body': ''.join(body)
+        }
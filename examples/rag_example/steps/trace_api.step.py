@@ -0,0 +1,40 @@
+import sys
+import pathlib
+
+src_path = pathlib.Path().parent / "src"
+sys.path.insert(0, str(src_path))  # Ahead of the standard library, which also has a "chunk" module
+
+from telemetry import get_telemetry, trace_breakdown
+
+config = {
+    'type': 'api',
+    'name': 'Trace API',
+    'description': 'returns the timing breakdown of the stages and sub-steps of a trace, or the ids of the recent traces',
+    'path': '/api/traces/:trace_id',
+    'method': 'GET',
+    'emits': [],
+    'flows': ['parse-embed-rag'],
+    }
+
+def path_param(req, name):
+    params = getattr(req, 'pathParams', None) or {}
+    return params.get(name) if isinstance(params, dict) else getattr(params, name, None)
+
+async def handler(req, ctx):
+    trace_id = path_param(req, 'trace_id')
+    if not trace_id or trace_id == 'recent':
+        return {
+            'status': 200,
+            'body': {'traces': get_telemetry().trace_ids()}
+            }
+
+    breakdown = trace_breakdown(trace_id)
+    if breakdown is None:
+        return {
+            'status': 404,
+            'body': {'error': 'unknown trace {}, or evicted from the last traces kept'.format(trace_id)}
+            }
+    return {
+        'status': 200,
+        'body': breakdown
+        }
@@ -0,0 +1,42 @@
+import importlib.util
+import pathlib
+import sys
+import types
+
+import pytest
+
+project_dir = pathlib.Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(project_dir / "src"))  # Ahead of the standard library, which also has a "chunk" module
+
+@pytest.fixture(autouse=True)
+def workspace(tmp_path, monkeypatch):
+    """Runs each test in an empty directory, where the src modules create their temp/ files."""
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+def load_step(name: str):
+    """Imports a step file, e.g. "rag_api.step", as a module."""
+    spec = importlib.util.spec_from_file_location(name.replace(".", "_"), project_dir / "steps" / f"{name}.py")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+class StepContext:
+    """Stand-in for the Motia handler context: records the emitted events and the log lines."""
+
+    def __init__(self, trace_id: str = "trace"):
+        self.trace_id = trace_id
+        self.emitted = []
+        self.logs = []
+        self.logger = types.SimpleNamespace(info=lambda *args: self.logs.append(("info",) + args),
+                                            error=lambda *args: self.logs.append(("error",) + args))
+
+    async def emit(self, event):
+        self.emitted.append(event)
+
+    def emitted_types(self):
+        return [event["type"] for event in self.emitted]
+
+def request(**body):
+    """Returns a request whose body has the given attributes, as the steps receive it."""
+    return types.SimpleNamespace(body=types.SimpleNamespace(**body))
@@ -0,0 +1,112 @@
+import numpy as np
+import pytest
+
+from bm25 import BM25Index, empty_index, load_bm25, reciprocal_rank_fusion, tokenize
+from documents import chunk_id, document_id_range
+
+WORDS = ["confluence", "server", "restart", "index", "plugin", "cache", "backup", "license", "upgrade", "proxy",
+         "database", "memory", "thread", "space", "page"]
+
+def document(doc_id, chunks, seed):
+    """Returns the chunk ids and random texts of a document."""
+    rng = np.random.default_rng(seed)
+    texts = [" ".join(rng.choice(WORDS, int(rng.integers(3, 12)))) for _ in range(chunks)]
+    return [chunk_id(doc_id, i) for i in range(chunks)], texts
+
+def scores(index, query, k=1000):
+    ids, values = index.search(query, k, max_postings=0)
+    return dict(zip(ids.tolist(), values.tolist()))
+
+def assert_same_scores(index, reference):
+    for query in ["server restart", "plugin cache upgrade", "memory", "page space proxy database"]:
+        found, expected = scores(index, query), scores(reference, query)
+        assert found.keys() == expected.keys()
+        assert np.allclose([found[i] for i in expected], list(expected.values()), rtol=1e-5)
+
+def test_rrf_ranks_ids_found_by_both_lists_first():
+    assert reciprocal_rank_fusion([1, 2, 3], [3, 4, 1], k=4) == [1, 3, 2, 4]
+
+def test_rrf_weights_and_k():
+    assert reciprocal_rank_fusion([1, 2], [3, 4], k=4, lexical_weight=0)[:2] == [1, 2]
+    assert reciprocal_rank_fusion([1, 2], [3, 4], k=4, lexical_weight=1)[:2] == [3, 4]
+    assert reciprocal_rank_fusion([1, 2], [3, 4], k=4, lexical_weight=0.7) == [3, 4, 1, 2]
+    assert reciprocal_rank_fusion(np.array([5, 6, 7]), np.array([], dtype=np.int64), k=2) == [5, 6]
+    assert reciprocal_rank_fusion([], [], k=3) == []
+
+def test_tokenize_keeps_identifiers():
+    assert tokenize("See CONF-1234 in setenv.sh, v6.13!") == ["see", "conf-1234", "in", "setenv.sh", "v6.13"]
+
+def test_search_ranks_matching_chunks():
+    index = BM25Index.build([1, 2, 3], ["restart the server", "clear the plugin cache", "server memory and server threads"])
+    ids, values = index.search("server", 5)
+    assert ids.tolist() == [3, 1]
+    assert values[0] > values[1] > 0
+    assert index.search("unknown words", 5)[0].size == 0
+    assert index.search("server", 0)[0].size == 0
+
+def test_updates_score_like_a_single_build():
+    documents = {doc_id: document(doc_id, 20 + doc_id * 7, doc_id) for doc_id in range(6)}
+    index = empty_index()
+    for doc_id, (ids, texts) in documents.items():
+        index = index.update(ids, texts)
+    # Re-index two documents with new versions, as index.py does
+    for doc_id, seed in ((1, 101), (4, 104)):
+        documents[doc_id] = document(doc_id, 15, seed)
+        index = index.update(*documents[doc_id], remove=document_id_range(doc_id))
+
+    ids = [i for doc_ids, _ in documents.values() for i in doc_ids]
+    texts = [t for _, doc_texts in documents.values() for t in doc_texts]
+    reference = BM25Index.build(ids, texts)
+    assert len(index) == len(reference) == len(ids)
+    assert index.stats()["segments"] < len(documents) + 2  # Small segments are merged
+    assert_same_scores(index, reference)
+    for term in ["server", "cache", "page"]:
+        assert index.document_frequency(term) == reference.document_frequency(term)
+
+def test_remove_drops_only_the_document():
+    first, second = document(0, 10, 1), document(1, 30, 2)
+    index = BM25Index.build(*first).update(*second)
+    removed = index.update([], [], remove=document_id_range(0))
+    assert len(index) == 40 and len(removed) == 30
+    assert all(i >= chunk_id(1, 0) for i in scores(removed, " ".join(WORDS)))
+    assert_same_scores(removed, BM25Index.build(*second))
+    assert len(index) == 40  # Updates return a new index and leave this one as it was
+
+def test_mostly_deleted_segments_are_compacted():
+    ids, texts = document(0, 40, 3)
+    index = BM25Index.build(ids, texts)
+    index = index.update([], [], remove=(chunk_id(0, 0), chunk_id(0, 10)))
+    assert index.stats()["deleted_rows"] == 10
+    index = index.update([], [], remove=(chunk_id(0, 10), chunk_id(0, 30)))
+    stats = index.stats()
+    assert (stats["chunks"], stats["segments"], stats["deleted_rows"]) == (10, 1, 0)
+    assert_same_scores(index, BM25Index.build(ids[30:], texts[30:]))
+    assert len(index.update([], [], remove=document_id_range(0)).segments) == 0
+
+def test_save_and_load_round_trip(tmp_path):
+    index = empty_index()
+    for doc_id in range(4):
+        index = index.update(*document(doc_id, 12, doc_id))
+    index = index.update([], [], remove=document_id_range(2))
+    index.save(tmp_path / "bm25")
+    loaded = load_bm25(tmp_path / "bm25")
+    assert len(loaded) == len(index) == 36
+    assert loaded.stats() == index.stats()
+    assert_same_scores(loaded, index)
+
+    # Saving an update writes the new segments and retires the ones that are no longer listed
+    updated = loaded.update(*document(5, 50, 5))
+    updated.save(tmp_path / "bm25", retired_grace_seconds=0)
+    updated.save(tmp_path / "bm25", retired_grace_seconds=0)
+    files = {path.name for path in (tmp_path / "bm25").glob("segment-*.npz")}
+    assert files == {segment.name for segment in updated.segments}
+    assert_same_scores(load_bm25(tmp_path / "bm25"), updated)
+
+def test_load_without_an_index(tmp_path):
+    assert load_bm25(tmp_path / "bm25") is None
+
+@pytest.mark.parametrize("max_postings", [1, 3])
+def test_max_postings_reads_the_best_postings(max_postings):
+    index = BM25Index.build([1, 2, 3, 4], ["cache", "cache cache cache", "cache cache", "other words here"])
+    ids, _ = index.search("cache", 4, max_postings)
+    assert ids.tolist() == [2, 3, 1][:max_postings]
@@ -0,0 +1,31 @@
+import pytest
+
+import pipeline
+from chunk import chunk_text, chunk_with_metadata, iter_chunks, iter_chunks_with_metadata, iter_words
+
+TEXT = " ".join(f"word{i}" for i in range(47))
+
+@pytest.mark.parametrize("chunk_size, overlap", [(10, 0), (10, 3), (10, 9), (50, 5), (1, 0)])
+def test_streamed_chunks_match_the_buffered_ones(chunk_size, overlap):
+    pieces = [" ".join(TEXT.split()[i:i + 4]) for i in range(0, 47, 4)]
+    assert list(iter_chunks(iter_words(pieces), chunk_size, overlap)) == chunk_text(TEXT, chunk_size, overlap)
+
+    streamed = list(iter_chunks_with_metadata(iter_words(pieces), "https://wiki/page", chunk_size, overlap))
+    buffered = chunk_with_metadata(TEXT, "https://wiki/page", "word", chunk_size, overlap)
+    assert [chunk.metadata() for chunk in streamed] == [chunk.metadata() for chunk in buffered]
+    assert [chunk.text for chunk in streamed] == [chunk.text for chunk in buffered]
+
+@pytest.mark.parametrize("chunk_size, overlap", [(10, 10), (10, 12), (10, -1), (0, 0)])
+def test_overlap_must_be_smaller_than_the_chunk_size(chunk_size, overlap):
+    with pytest.raises(ValueError, match="chunk_overlap"):
+        list(iter_chunks(iter_words([TEXT]), chunk_size, overlap))
+
+def test_streaming_needs_the_bs4_extractor_and_word_chunks(monkeypatch):
+    monkeypatch.setattr(pipeline, "html_extractor", "bs4")
+    monkeypatch.setattr(pipeline, "chunk_mode", "word")
+    assert pipeline.streaming_unsupported() is None
+
+    monkeypatch.setattr(pipeline, "chunk_mode", "structure")
+    assert "chunk_mode" in pipeline.streaming_unsupported()
+    with pytest.raises(ValueError, match="streaming_ingestion: false"):
+        pipeline.ingest_url_streaming("https://wiki/page")
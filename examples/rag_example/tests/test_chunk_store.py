@@ -0,0 +1,47 @@
+import json
+
+import pytest
+
+from chunk_store import ChunkStore, export_json, import_json, load_chunks, write_chunk_store
+
+CHUNKS = ["first chunk", "", "ünïcödé — 日本語 🚀", "x" * 5000] + [f"chunk {i}" for i in range(150)]
+
+@pytest.mark.parametrize("compression, block_size", [("none", 64), ("zstd", 1), ("zstd", 64), ("zstd", 1000)])
+def test_round_trip(tmp_path, compression, block_size):
+    filepath = tmp_path / "output.bin"
+    assert write_chunk_store(iter(CHUNKS), filepath, compression, block_size) == len(CHUNKS)
+    store = ChunkStore(filepath)
+    try:
+        assert len(store) == len(CHUNKS)
+        assert list(store) == CHUNKS
+        for chunk_id in (153, 0, 2, 70, 3, 1):  # Random access across blocks
+            assert store[chunk_id] == CHUNKS[chunk_id]
+        with pytest.raises(IndexError):
+            store[len(CHUNKS)]
+    finally:
+        store.close()
+    assert load_chunks(filepath) == CHUNKS
+
+def test_empty_store(tmp_path):
+    write_chunk_store([], tmp_path / "empty.bin")
+    store = ChunkStore(tmp_path / "empty.bin")
+    assert len(store) == 0 and not store and list(store) == []
+    store.close()
+
+def test_rewrite_replaces_the_file(tmp_path):
+    filepath = tmp_path / "output.bin"
+    write_chunk_store(["old"], filepath)
+    write_chunk_store(["new", "chunks"], filepath)
+    assert load_chunks(filepath) == ["new", "chunks"]
+    assert [path.name for path in tmp_path.iterdir()] == ["output.bin"]
+
+def test_json_import_and_export(tmp_path):
+    (tmp_path / "output.json").write_text(json.dumps(CHUNKS), encoding="utf-8")
+    assert import_json(tmp_path / "output.json", tmp_path / "output.bin", "zstd", 16) == len(CHUNKS)
+    assert export_json(tmp_path / "output.bin", tmp_path / "exported.json") == len(CHUNKS)
+    assert json.loads((tmp_path / "exported.json").read_text(encoding="utf-8")) == CHUNKS
+    assert load_chunks(tmp_path / "exported.json") == CHUNKS
+
+def test_unknown_compression(tmp_path):
+    with pytest.raises(ValueError):
+        write_chunk_store(CHUNKS, tmp_path / "output.bin", "lz4")
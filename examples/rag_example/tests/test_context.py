@@ -0,0 +1,64 @@
+import pytest
+
+from chunk import chunk_text
+from chunker import chunk_document
+from context import SEPARATOR, assemble_context, count_tokens, merge_passages
+from documents import chunk_id
+
+TEXT = " ".join(f"word{i}" for i in range(100))
+
+def retrieved_chunks(doc_id, text, positions, chunk_size=10, overlap=3):
+    """Chunks text like chunk.py and returns the (chunk id, text) pairs and metadata of the given positions."""
+    chunks = chunk_document(text, "word", chunk_size, overlap)
+    return ([(chunk_id(doc_id, p), chunks[p].text) for p in positions],
+            [chunks[p].metadata() for p in positions])
+
+def test_overlapping_chunks_merge_into_the_text_between_their_offsets():
+    retrieved, metadata = retrieved_chunks(0, TEXT, [2, 0, 1])
+    [passage] = merge_passages(retrieved, metadata)
+    assert (passage.start, passage.end) == (metadata[1]["start"], metadata[0]["end"])
+    assert passage.text == TEXT[passage.start:passage.end]
+    assert passage.positions == [0, 1, 2]
+    assert passage.rank == 0
+
+def test_distant_chunks_and_documents_stay_apart_in_rank_order():
+    first, first_metadata = retrieved_chunks(0, TEXT, [5, 0])
+    second, second_metadata = retrieved_chunks(1, TEXT, [1])
+    retrieved, metadata = [first[0], second[0], first[1]], [first_metadata[0], second_metadata[0], first_metadata[1]]
+    passages = merge_passages(retrieved, metadata)
+    assert [(p.doc_id, p.positions, p.rank) for p in passages] == [(0, [5], 0), (1, [1], 1), (0, [0], 2)]
+    for passage in passages:
+        assert passage.text == TEXT[passage.start:passage.end]
+
+def test_adjacent_and_contained_chunks():
+    text = "alpha beta gamma\n\ndelta epsilon"
+    retrieved = [(chunk_id(0, 0), "alpha beta"), (chunk_id(0, 1), "gamma"), (chunk_id(0, 2), "beta"),
+                 (chunk_id(0, 3), "delta epsilon")]
+    metadata = [{"start": 0, "end": 10}, {"start": 11, "end": 16}, {"start": 6, "end": 10}, {"start": 18, "end": 31}]
+    [passage] = merge_passages(retrieved, metadata)
+    assert passage.text == text
+    assert (passage.start, passage.end) == (0, 31)
+
+def test_chunks_without_metadata_merge_on_shared_words():
+    chunks = chunk_text(TEXT, 10, 3)
+    retrieved = [(chunk_id(0, 1), chunks[1]), (chunk_id(0, 0), chunks[0]), (chunk_id(0, 3), chunks[3])]
+    passages = merge_passages(retrieved, [None] * 3)
+    assert [p.text for p in passages] == [" ".join(TEXT.split()[:17]), chunks[3]]
+    assert passages[0].start is None and passages[0].positions == [0, 1]
+
+@pytest.mark.parametrize("merge", [True, False])
+def test_assemble_context_counts_the_saved_tokens(merge):
+    retrieved, _ = retrieved_chunks(0, TEXT, [0, 1])
+    context, stats = assemble_context(retrieved, merge=merge)
+    assert stats["chunks"] == 2
+    assert stats["passages"] == (1 if merge else 2)
+    assert stats["tokens_saved"] == stats["tokens_before"] - stats["tokens_after"]
+    assert (stats["tokens_saved"] > 0) == merge
+
+def test_assemble_context_truncates_to_the_budget():
+    retrieved, _ = retrieved_chunks(0, TEXT, [0, 5])
+    context, stats = assemble_context(retrieved, token_budget=15)
+    passages = context.split(SEPARATOR)
+    assert sum(count_tokens(passage) for passage in passages) == 15  # The budget is spent on the passages
+    assert stats["truncated"] == 1
+    assert passages[0] == retrieved[0][1] and retrieved[1][1].startswith(passages[1])
@@ -0,0 +1,32 @@
+import pytest
+
+import extract
+from parse import extract_text
+
+EMPTY_DOCUMENTS = ["", "   \n", "<!-- x -->", '<?xml version="1.0"?>', "<html></html>"]
+
+def installed_extractors():
+    return [pytest.param(fn, id=name) for name, fn in extract.EXTRACTORS.items() if extract._available(name)]
+
+@pytest.mark.parametrize("html", EMPTY_DOCUMENTS)
+@pytest.mark.parametrize("extractor", installed_extractors())
+def test_empty_documents_have_no_text(extractor, html):
+    assert extractor(html) == ""
+
+@pytest.mark.parametrize("html", EMPTY_DOCUMENTS)
+def test_empty_documents_have_no_structured_text(html):
+    assert extract.extract_structured_text(html) == ""
+    assert extract_text(html) == ""
+
+@pytest.mark.parametrize("extractor", installed_extractors())
+def test_main_content_without_chrome(extractor):
+    html = ("<html><body><nav>Home | Spaces</nav><div id='main-content'><h1>Setup</h1>"
+            "<p>Run  <b>setenv.sh</b>\n first.</p></div><footer>Powered by Confluence</footer></body></html>")
+    text = extractor(html)
+    assert "Run setenv.sh first." in text
+    if extractor is not extract.extract_text_bs4:  # The original extractor keeps the whole body
+        assert "Spaces" not in text and "Powered" not in text
+
+def test_structured_text_keeps_headings():
+    html = "<html><body><main><h2>Install</h2><p>Unpack the archive.</p><ul><li>Start it</li></ul></main></body></html>"
+    assert extract.extract_structured_text(html) == "## Install\n\nUnpack the archive.\n\nStart it"
@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+
+import index
+from index import index_spec, load_index, update_document
+
+def add_document(workspace, url, chunks, seed=0):
+    embeddings = np.random.default_rng(seed).random((chunks, 8), dtype=np.float32)
+    update_document(url, [f"{url} chunk {i}" for i in range(chunks)], embeddings,
+                    workspace / "temp" / "faiss_files", workspace / "temp" / "chunks" / "documents")
+    return index_spec(load_index(workspace / "temp" / "faiss_files" / "vector_index.bin"))
+
+def test_ivf_index_is_trained_once_it_has_enough_vectors(workspace, monkeypatch):
+    monkeypatch.setattr(index, "index_type", "ivf_flat")
+    monkeypatch.setitem(index.config, "index_nlist", 4)  # Trained from 4 * 39 vectors
+    assert add_document(workspace, "https://wiki.example/a", 20)[0] == "flat"
+    assert add_document(workspace, "https://wiki.example/b", 100, 1)[0] == "flat"
+    index_type, params, _ = add_document(workspace, "https://wiki.example/c", 40, 2)
+    assert (index_type, params["index_nlist"]) == ("ivf_flat", 4)
+    monkeypatch.setattr(index, "index_type", "flat")  # The manifest keeps the type the index was created with
+    assert add_document(workspace, "https://wiki.example/a", 30, 3)[0] == "ivf_flat"
+
+@pytest.mark.parametrize("vector_dtype", ["float32", "int8"])
+def test_hnsw_rebuild_keeps_the_index_type_and_parameters(workspace, monkeypatch, vector_dtype):
+    monkeypatch.setattr(index, "index_type", "hnsw")
+    monkeypatch.setattr(index, "vector_dtype", vector_dtype)
+    monkeypatch.setitem(index.config, "index_hnsw_m", 8)
+    add_document(workspace, "https://wiki.example/a", 50)
+    add_document(workspace, "https://wiki.example/b", 50, 1)
+    monkeypatch.setattr(index, "index_type", "flat")
+    monkeypatch.setattr(index, "vector_dtype", "float32")
+    monkeypatch.setitem(index.config, "index_hnsw_m", 32)
+    index_type, params, dtype = add_document(workspace, "https://wiki.example/a", 40, 2)  # Removes a's vectors
+    assert (index_type, params["index_hnsw_m"], dtype) == ("hnsw", 8, vector_dtype)
+    assert load_index(workspace / "temp" / "faiss_files" / "vector_index.bin").ntotal == 90
@@ -0,0 +1,23 @@
+import numpy as np
+
+from index import update_document
+from index_manager import IndexManager
+
+def add_document(workspace, url, chunks):
+    embeddings = np.random.default_rng(chunks).random((chunks, 8), dtype=np.float32)
+    update_document(url, [f"{url} chunk {i}" for i in range(chunks)], embeddings,
+                    workspace / "temp" / "faiss_files", workspace / "temp" / "chunks" / "documents")
+
+def test_reloads_when_a_document_is_indexed(workspace):
+    manager = IndexManager()
+    assert manager.get() == ([], None)
+
+    add_document(workspace, "https://wiki.example/a", 5)
+    chunks, index = manager.get()
+    assert (len(chunks), index.ntotal, manager.load_count) == (5, 5, 1)
+    manager.get()
+    assert manager.load_count == 1  # Unchanged files are not read again
+
+    add_document(workspace, "https://wiki.example/b", 3)
+    chunks, index = manager.get()
+    assert (len(chunks), index.ntotal, manager.load_count) == (8, 8, 2)
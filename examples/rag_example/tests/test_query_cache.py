@@ -0,0 +1,67 @@
+import query_cache
+from query_cache import QueryCache, TTLCache, normalize_query
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+def test_entries_expire_after_the_ttl(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(query_cache, "time", clock)
+    cache = TTLCache(max_entries=10, ttl=30)
+    cache.set("query", [1, 2])
+    clock.now += 29
+    assert cache.get("query") == [1, 2]
+    clock.now += 2
+    assert cache.get("query") is None
+    assert cache.stats() == {"hits": 1, "misses": 1, "entries": 0}
+
+def test_setting_an_entry_again_restarts_its_ttl(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(query_cache, "time", clock)
+    cache = TTLCache(ttl=10)
+    cache.set("query", 1)
+    clock.now += 8
+    cache.set("query", 2)
+    clock.now += 8
+    assert cache.get("query") == 2
+
+def test_no_ttl_never_expires(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(query_cache, "time", clock)
+    cache = TTLCache(ttl=0)
+    cache.set("query", "answer")
+    clock.now += 10 ** 9
+    assert cache.get("query") == "answer"
+
+def test_least_recently_used_entry_is_evicted():
+    cache = TTLCache(max_entries=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1  # "b" is now the least recently used
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+
+def test_falsy_values_are_cached():
+    cache = TTLCache()
+    cache.set("empty", [])
+    assert cache.get("empty") == []
+    assert cache.stats()["hits"] == 1
+
+def test_answers_are_dropped_when_the_index_changes():
+    cache = QueryCache()
+    cache.check_generation(1)
+    cache.embeddings.set("query", "vector")
+    cache.answers.set(("query", (1, 2)), "answer")
+    cache.check_generation(1)
+    assert cache.answers.get(("query", (1, 2))) == "answer"
+    cache.check_generation(2)
+    assert cache.answers.get(("query", (1, 2))) is None
+    assert cache.embeddings.get("query") == "vector"  # Embeddings do not depend on the index
+
+def test_normalize_query():
+    assert normalize_query("  How do I   RESTART\tConfluence? ") == "how do i restart confluence?"
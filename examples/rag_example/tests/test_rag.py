@@ -0,0 +1,33 @@
+import numpy as np
+import pytest
+
+import index_manager
+import rag
+from index import update_document
+
+@pytest.fixture
+def indexed(workspace, monkeypatch):
+    """Indexes one document in the workspace and serves it with fixed query embeddings."""
+    embeddings = np.random.default_rng(0).random((5, 8), dtype=np.float32)
+    update_document("https://wiki.example/page", [f"restart the server, step {i}" for i in range(5)], embeddings,
+                    workspace / "temp" / "faiss_files", workspace / "temp" / "chunks" / "documents")
+    monkeypatch.setattr(index_manager, "_index_manager", None)
+    monkeypatch.setattr(rag, "query_cache", rag.QueryCache())
+    monkeypatch.setattr(rag, "embed_query", lambda query, normalized, model_name=None: (embeddings[0], False))
+
+def test_stream_sends_retrieval_tokens_and_timings(indexed, monkeypatch):
+    monkeypatch.setattr(rag, "generate_response_stream", lambda chunks, query: iter(["Restart ", "it."]))
+    events = list(rag.rag_stream("how do I restart the server?"))
+    assert [name for name, _ in events] == ["retrieval", "token", "token", "done"]
+    timings = events[-1][1]["timings"]
+    assert 0 <= timings["embed"] <= timings["search"] <= timings["first_token"] <= timings["last_token"]
+
+def test_stream_of_an_empty_answer_has_no_first_token(indexed, monkeypatch):
+    monkeypatch.setattr(rag, "generate_response_stream", lambda chunks, query: iter([]))
+    events = list(rag.rag_stream("how do I restart the server?"))
+    assert [name for name, _ in events] == ["retrieval", "done"]
+    assert events[-1][1]["timings"]["first_token"] is None
+
+def test_stream_without_an_index_sends_an_error(monkeypatch):
+    monkeypatch.setattr(index_manager, "_index_manager", None)
+    assert list(rag.rag_stream("query")) == [("error", {"error": "Data not loaded. Check server logs."})]
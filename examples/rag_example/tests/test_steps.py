@@ -0,0 +1,59 @@
+import asyncio
+
+from conftest import StepContext, load_step, request
+
+def test_rag_stream_api_with_an_empty_answer(monkeypatch):
+    step = load_step("rag_stream_api.step")
+    events = [("retrieval", {"chunks": [], "context": {}}), ("done", {"cache": {}, "timings": {"first_token": None}})]
+    monkeypatch.setattr(step, "rag_stream", lambda query: iter(events))
+    ctx = StepContext()
+    response = asyncio.run(step.handler(request(query="restart"), ctx))
+    assert response["status"] == 200
+    assert response["body"].count("event: ") == 2
+    assert ctx.emitted_types() == ["rag.token", "rag.token", "rag.completed"]
+
+def test_parse_api_crawl_failure_is_not_reported_as_indexed(monkeypatch):
+    step = load_step("parse.step")
+    def ingest_urls(urls, sitemap):
+        raise RuntimeError("sitemap not found")
+    monkeypatch.setattr(step, "ingest_urls", ingest_urls)
+    ctx = StepContext()
+    response = asyncio.run(step.handler(request(sitemap="https://wiki/sitemap.xml"), ctx))
+    assert response["status"] == 500
+    assert response["body"]["error"] == "sitemap not found"
+    assert ctx.emitted == []
+
+def test_parse_api_streaming_failure_is_not_reported_as_indexed(monkeypatch):
+    step = load_step("parse.step")
+    monkeypatch.setattr(step, "streaming_ingestion", True)
+    monkeypatch.setattr(step, "ingest_url_streaming", lambda url: {"chunks": 3, "timings": {}})
+    ctx = StepContext()
+    response = asyncio.run(step.handler(request(url="https://wiki/page"), ctx))
+    assert response["status"] == 200
+    assert ctx.emitted_types() == ["index.complete"]
+
+    def ingest_url_streaming(url):
+        raise ValueError("streaming_ingestion needs html_extractor: bs4")
+    monkeypatch.setattr(step, "ingest_url_streaming", ingest_url_streaming)
+    ctx = StepContext()
+    response = asyncio.run(step.handler(request(url="https://wiki/page"), ctx))
+    assert response["status"] == 500
+    assert "html_extractor" in response["body"]["error"]
+    assert ctx.emitted == []
+
+def test_rag_batch_api_errors(monkeypatch):
+    step = load_step("rag_batch_api.step")
+    ctx = StepContext()
+    assert asyncio.run(step.handler(request(), ctx))["status"] == 400
+    too_many = ["restart"] * (step.rag_batch_max_queries + 1)
+    assert asyncio.run(step.handler(request(queries=too_many), ctx))["status"] == 400
+
+    monkeypatch.setattr(step, "rag_batch_response", lambda queries: {"error": "Data not loaded. Check server logs."})
+    response = asyncio.run(step.handler(request(queries=["restart"]), ctx))
+    assert response["status"] == 503
+    assert response["body"]["error"] == "Data not loaded. Check server logs."
+    assert ctx.emitted == []
+
+    monkeypatch.setattr(step, "rag_batch_response", lambda queries: {"results": [], "timings": {}})
+    assert asyncio.run(step.handler(request(queries=["restart"]), ctx))["status"] == 200
+    assert ctx.emitted_types() == ["rag.completed"]
@@ -0,0 +1,96 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import workspace
+from chunk_store import write_chunk_store
+from documents import load_manifest
+from index import index_embeddings
+from workspace import RunWorkspace, purge_stale_runs
+
+def prepare_run(run_id, url, chunks=3, mark_done=True):
+    """Writes the files the parse, chunk and embed stages leave in a run's workspace."""
+    run = RunWorkspace(run_id)
+    run.text_dir.mkdir(parents=True)
+    (run.text_dir / "source_url.txt").write_text(url, encoding="utf-8")
+    write_chunk_store([f"{url} chunk {i}" for i in range(chunks)], run.chunks_dir / "output.bin")
+    run.embeddings_dir.mkdir(parents=True)
+    np.save(run.embeddings_dir / "embeddings_file.npy", np.random.default_rng(0).random((chunks, 8), dtype=np.float32))
+    if mark_done:
+        run.mark_done("chunk")
+        run.mark_done("embed")
+    return run
+
+def test_only_the_first_claim_wins():
+    run = RunWorkspace("run")
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        claims = list(pool.map(lambda _: run.claim("index"), range(64)))
+    assert claims.count(True) == 1
+    run.release("index")
+    assert run.claim("index") and not run.claim("index")
+
+def test_ready_waits_for_every_stage():
+    run = RunWorkspace("run")
+    assert not run.ready("chunk", "embed")
+    run.mark_done("chunk")
+    assert run.ready("chunk") and not run.ready("chunk", "embed")
+    run.mark_done("embed")
+    assert run.ready("chunk", "embed")
+
+def test_a_run_without_id_uses_the_shared_directories(workspace):
+    run = RunWorkspace()
+    assert run.root == workspace / "temp"
+    assert run.ready("chunk", "embed") and run.claim("index") and run.claim("index")
+
+def test_remove_keeps_the_files_for_debugging(monkeypatch):
+    run = RunWorkspace("run")
+    run.mark_done("chunk")
+    monkeypatch.setattr(workspace, "keep_run_workspaces", True)
+    run.remove()
+    assert run.root.exists()
+    monkeypatch.setattr(workspace, "keep_run_workspaces", False)
+    run.remove()
+    assert not run.root.exists()
+
+def test_fan_in_indexes_a_run_once(workspace):
+    run = prepare_run("run", "https://wiki.example/page")
+    # index.step.py is triggered by both chunk.complete and embed.complete, possibly more than once
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(lambda _: index_embeddings("run"), range(8)))
+    assert results.count(True) == 1
+    manifest = load_manifest(workspace / "temp" / "faiss_files" / "documents.json")
+    assert manifest["documents"]["https://wiki.example/page"]["chunks"] == 3
+    assert not run.root.exists()
+
+def test_a_run_is_not_indexed_before_both_stages_are_done():
+    run = prepare_run("run", "https://wiki.example/page", mark_done=False)
+    run.mark_done("chunk")
+    assert not index_embeddings("run")
+    assert not (run.root / "index.claim").exists()
+    run.mark_done("embed")
+    assert index_embeddings("run")
+
+def test_a_failed_run_gives_up_its_claim():
+    run = prepare_run("run", "https://wiki.example/page")
+    embeddings = run.embeddings_dir / "embeddings_file.npy"
+    os.replace(embeddings, run.root / "saved.npy")
+    assert not index_embeddings("run")  # No embeddings yet
+    assert not (run.root / "index.claim").exists()
+    np.save(embeddings, np.ones((2, 8), dtype=np.float32))
+    assert not index_embeddings("run")  # 3 chunks but 2 embeddings
+    os.replace(run.root / "saved.npy", embeddings)
+    assert index_embeddings("run")
+
+def test_stale_runs_are_purged():
+    stale, recent = RunWorkspace("stale"), RunWorkspace("recent")
+    for run in (stale, recent):
+        run.mark_done("chunk")
+        run.text_dir.mkdir()
+    long_ago = time.time() - 7200
+    for path in (stale.root, stale.text_dir, stale.root / "chunk.done"):
+        os.utime(path, (long_ago, long_ago))
+    assert purge_stale_runs(0) == 0
+    assert purge_stale_runs(3600) == 1
+    assert not stale.root.exists() and recent.root.exists()
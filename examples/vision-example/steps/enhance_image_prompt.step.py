@@ -1,7 +1,6 @@
-from anthropic import Anthropic
-import os
+import ultraimport
 
-client = Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
+get_provider = ultraimport('__dir__/providers.py', 'get_provider')
 
 config = {
   "type": "event",
@@ -26,17 +25,12 @@ async def handler(args, ctx):
   Make sure the prompt is not too long. Only return the enhanced prompt, no other text.
   """
 
-  response = client.messages.create(
+  enhanced_prompt = await get_provider().complete(
+    prompt_enhancement_prompt,
     model="claude-3-sonnet-20240229",
-    messages=[{
-      "role": "user",
-      "content": prompt_enhancement_prompt
-    }],
     max_tokens=1000
   )
 
-  enhanced_prompt = response.content[0].text
-
   ctx.logger.info('enhanced prompt', enhanced_prompt)
 
   await ctx.emit({
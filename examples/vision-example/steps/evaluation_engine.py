@@ -0,0 +1,315 @@
+import asyncio
+import contextlib
+import fcntl
+import hashlib
+import json
+import os
+import pathlib
+import sys
+import time
+
+import ultraimport
+
+get_provider = ultraimport('__dir__/providers.py', 'get_provider')
+
+REPORTS_DIR = pathlib.Path(__file__).resolve().parent.parent / "tmp"
+MODEL = os.getenv("VISION_EVAL_MODEL", "claude-3-5-sonnet-20240620")
+QPS = float(os.getenv("VISION_EVAL_QPS", "2"))
+BATCH_WINDOW = float(os.getenv("VISION_EVAL_BATCH_WINDOW", "0"))
+MAX_BATCH = int(os.getenv("VISION_EVAL_MAX_BATCH", "16"))
+
+EVALUATION_PROMPT = """Evaluate if the image is a good representation of the following prompt:
+
+{original_prompt}
+
+Take into account the following considerations for your evaluation:
+
+- Verify that the EXACT number of subjects/objects mentioned in the prompt appear in the image:
+  * If the prompt mentions "a couple", there must be exactly 2 people
+  * If the prompt mentions "three cats", there must be exactly 3 cats
+  * Count and verify every specified quantity in the prompt
+- All specific items, objects, or elements mentioned in the prompt must be present
+- The scene, setting, and actions must precisely match the prompt description
+- The relationships and positioning between elements should be exactly as described
+
+Return ONLY a numeric score between 0 and 100, where 100 means the image perfectly matches the prompt.
+Do not include any other text or explanation in your response - just the number."""
+
+
+class RateLimiter:
+    """Async token bucket: at most `rate` acquisitions per second, 0 for no limit."""
+
+    def __init__(self, rate):
+        self.rate = rate
+        self._tokens = max(1.0, rate)
+        self._updated = time.monotonic()
+        self._lock = None
+
+    async def acquire(self):
+        if self.rate <= 0:
+            return
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(max(1.0, self.rate), self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+def image_hash(image_path):
+    """Returns the SHA-256 of the image file content."""
+    digest = hashlib.sha256()
+    with open(image_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def parse_score(raw_response):
+    """Returns the numeric score of a vision agent answer, clamped to [0, 100]."""
+    try:
+        score = float(raw_response.strip())
+    except ValueError:
+        raise ValueError(f"Invalid response from vision agent: {raw_response!r}")
+    return max(0, min(100, score))
+
+
+def write_json(path, data):
+    """Writes a JSON file atomically, so readers never see a partial file."""
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def read_json(path):
+    """Reads a JSON file, or returns an empty dict if it does not exist."""
+    if not path.exists():
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+@contextlib.contextmanager
+def reports_lock(reports_dir):
+    """
+    Holds an exclusive lock on the reports directory, across processes, so
+    that each writer merges its results into the latest shared files.
+    """
+    with open(reports_dir / ".reports.lock", "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def evaluation_stats(reports_dir=REPORTS_DIR):
+    """Returns the counters of every evaluation batch written to a reports directory."""
+    return read_json(pathlib.Path(reports_dir) / "eval_stats.json")
+
+
+class EvaluationEngine:
+    """
+    Scores generated images against their original prompts.
+
+    Evaluations submitted within `batch_window` seconds of each other (or
+    `max_batch` of them) form a batch. The window defaults to 0, which still
+    batches the evaluations submitted together in one process, such as
+    evaluate_dataset, without delaying a lone evaluation: the event handlers
+    may each run in their own short-lived process. The images of a batch that are not in
+    the score cache are scored concurrently, under the provider's concurrency
+    limit and `qps` requests per second. Scores are cached by (image content
+    hash, original prompt, model) in `eval_cache.json`, so re-evaluating the
+    same dataset makes no model calls.
+
+    Each batch is written in one pass: the `{trace_id}_report.txt` report of
+    every evaluation, the aggregated `evaluations.json` of all reports, the
+    cache and the cumulative counters in `eval_stats.json`. The shared files
+    are re-read and merged under a lock file, so batches written by other
+    processes are kept; `stats` only counts the batches of this engine.
+
+    Args:
+        provider: The model provider (see providers.py).
+        reports_dir (pathlib.Path): The directory of the reports and the cache.
+        model (str): The vision model that scores the images.
+        qps (float): Maximum scoring requests per second, 0 for no limit.
+        batch_window (float): Seconds an evaluation waits for others to join its batch.
+        max_batch (int): Evaluations that trigger a batch without waiting.
+    """
+
+    def __init__(self, provider, reports_dir=REPORTS_DIR, model=MODEL, qps=QPS, batch_window=BATCH_WINDOW,
+                 max_batch=MAX_BATCH):
+        self.provider = provider
+        self.reports_dir = pathlib.Path(reports_dir)
+        self.model = model
+        self.limiter = RateLimiter(qps)
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.stats = {"evaluations": 0, "cache_hits": 0, "scored": 0, "batches": 0}
+        self._cache = {}
+        self._pending = []
+        self._timer = None
+
+    def _load(self):
+        # Picks up the scores cached by other processes since the last batch
+        self._cache.update(read_json(self.reports_dir / "eval_cache.json"))
+
+    def cache_key(self, image_path, original_prompt):
+        return json.dumps([image_hash(image_path), original_prompt, self.model])
+
+    async def evaluate(self, trace_id, original_prompt, prompt, image_path):
+        """
+        Adds an image to the next batch and returns its score once the batch is done.
+
+        Raises:
+            ValueError: If the vision agent did not answer with a number.
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append(({
+            "trace_id": trace_id,
+            "original_prompt": original_prompt,
+            "prompt": prompt,
+            "image_path": image_path,
+        }, future))
+        if len(self._pending) >= self.max_batch:
+            self._start_batch()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.batch_window, self._start_batch)
+        return await future
+
+    def _start_batch(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            asyncio.ensure_future(self._run_batch(batch))
+
+    async def _score(self, job):
+        await self.limiter.acquire()
+        prompt = EVALUATION_PROMPT.format(original_prompt=job["original_prompt"])
+        return parse_score(await self.provider.score_image(prompt, job["image_path"], self.model))
+
+    def _keys(self, jobs):
+        """Returns the cache key of each job, or the error raised reading its image."""
+        keys = []
+        for job in jobs:
+            try:
+                keys.append(self.cache_key(job["image_path"], job["original_prompt"]))
+            except OSError as e:
+                keys.append(e)
+        return keys
+
+    async def _run_batch(self, batch):
+        try:
+            results = await self._score_batch([job for job, _ in batch])
+        except Exception as e:  # Reading the cache or writing the reports failed
+            results = [e] * len(batch)
+        for result, (_, future) in zip(results, batch):
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    async def _score_batch(self, jobs):
+        """Returns the score of each job, or the exception that prevented it."""
+        await asyncio.to_thread(self._load)
+        keys = await asyncio.to_thread(self._keys, jobs)
+        missing = {}  # Cache key -> first job with it, so the same image and prompt are scored once
+        for key, job in zip(keys, jobs):
+            if not isinstance(key, Exception) and key not in self._cache:
+                missing.setdefault(key, job)
+        scores = dict(zip(missing, await asyncio.gather(*(self._score(job) for job in missing.values()),
+                                                        return_exceptions=True)))
+        for key, score in scores.items():
+            if not isinstance(score, Exception):
+                self._cache[key] = score
+
+        results = [key if isinstance(key, Exception) else scores[key] if key in scores else self._cache[key]
+                   for key in keys]
+        counts = {
+            "evaluations": len(jobs),
+            "cache_hits": sum(1 for key in keys if not isinstance(key, Exception) and key not in missing),
+            "scored": sum(1 for score in scores.values() if not isinstance(score, Exception)),
+            "batches": 1,
+        }
+        new_scores = {key: score for key, score in scores.items() if not isinstance(score, Exception)}
+        await asyncio.to_thread(self._write, [(job, score) for job, score in zip(jobs, results)
+                                              if not isinstance(score, Exception)], new_scores, counts)
+        for name, count in counts.items():
+            self.stats[name] += count
+        return results
+
+    def _write(self, scored, new_scores, counts):
+        self.reports_dir.mkdir(parents=True, exist_ok=True)
+        reports = {}
+        for job, score in scored:
+            report = {
+                "original_prompt": job["original_prompt"],
+                "prompt": job["prompt"],
+                "score": score,
+                "image_path": job["image_path"],
+            }
+            write_json(self.reports_dir / f"{job['trace_id']}_report.txt", report)
+            reports[job["trace_id"]] = report
+
+        with reports_lock(self.reports_dir):
+            evaluations = read_json(self.reports_dir / "evaluations.json")
+            evaluations.update(reports)
+            write_json(self.reports_dir / "evaluations.json", evaluations)
+
+            cache = read_json(self.reports_dir / "eval_cache.json")
+            cache.update(new_scores)
+            write_json(self.reports_dir / "eval_cache.json", cache)
+
+            stats = read_json(self.reports_dir / "eval_stats.json")
+            for name, count in counts.items():
+                stats[name] = stats.get(name, 0) + count
+            write_json(self.reports_dir / "eval_stats.json", stats)
+
+
+_engine = None
+
+def get_engine():
+    """Returns the evaluation engine shared by the events of this process, created on first use."""
+    global _engine
+    if _engine is None:
+        _engine = EvaluationEngine(get_provider())
+    return _engine
+
+
+async def evaluate_dataset(reports_dir=REPORTS_DIR):
+    """
+    Re-scores every `{trace_id}_report.txt` of a directory as one batch.
+    Images are looked up next to the reports when their recorded path does
+    not exist. Returns the engine's counters.
+    """
+    reports_dir = pathlib.Path(reports_dir)
+    engine = EvaluationEngine(get_provider(), reports_dir, batch_window=0, max_batch=sys.maxsize)
+    jobs = []
+    for report_file in sorted(reports_dir.glob("*_report.txt")):
+        trace_id = report_file.name[:-len("_report.txt")]
+        with open(report_file) as f:
+            report = json.load(f)
+        image_path = report["image_path"]
+        if not os.path.exists(image_path):
+            image_path = str(reports_dir / f"{trace_id}.png")
+        jobs.append(engine.evaluate(trace_id, report["original_prompt"], report["prompt"], image_path))
+    results = await asyncio.gather(*jobs, return_exceptions=True)
+    for result in results:
+        if isinstance(result, Exception):
+            print(result)
+    return engine.stats
+
+
+if __name__ == "__main__":
+    reports_dir = sys.argv[1] if len(sys.argv) > 1 else REPORTS_DIR
+    start = time.perf_counter()
+    stats = asyncio.run(evaluate_dataset(reports_dir))
+    print(f"{stats} in {time.perf_counter() - start:.2f}s")
@@ -0,0 +1,191 @@
+import asyncio
+import hashlib
+import os
+import random
+import threading
+import time
+
+PROVIDER = os.getenv("VISION_PROVIDER", "anthropic")
+TIMEOUT = float(os.getenv("VISION_PROVIDER_TIMEOUT", "60"))
+MAX_RETRIES = int(os.getenv("VISION_PROVIDER_MAX_RETRIES", "2"))
+CONCURRENCY = int(os.getenv("VISION_PROVIDER_CONCURRENCY", "4"))
+
+
+class ProviderStats:
+    """Counters of the calls made through a provider, per operation: calls, errors, retries, latency and tokens."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._operations = {}
+
+    def record(self, operation, seconds, error=False, retries=0, input_tokens=0, output_tokens=0):
+        with self._lock:
+            counters = self._operations.setdefault(operation, {
+                "calls": 0, "errors": 0, "retries": 0, "latency_total": 0.0, "latency_max": 0.0,
+                "input_tokens": 0, "output_tokens": 0,
+            })
+            counters["calls"] += 1
+            counters["errors"] += int(error)
+            counters["retries"] += retries
+            counters["latency_total"] += seconds
+            counters["latency_max"] = max(counters["latency_max"], seconds)
+            counters["input_tokens"] += input_tokens
+            counters["output_tokens"] += output_tokens
+
+    def snapshot(self):
+        with self._lock:
+            return {operation: dict(counters) for operation, counters in self._operations.items()}
+
+
+class Provider:
+    """
+    Base class of the model providers shared by the Python steps.
+
+    Every call holds a slot of the concurrency limit, is abandoned after
+    `timeout` seconds, is retried with exponential backoff and is counted
+    in `stats`.
+    """
+
+    name = "provider"
+
+    def __init__(self, timeout=TIMEOUT, max_retries=MAX_RETRIES, concurrency=CONCURRENCY, backoff=1.0):
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.concurrency = concurrency
+        self.backoff = backoff
+        self.stats = ProviderStats()
+        self._semaphore = None
+
+    def _slots(self):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        return self._semaphore
+
+    async def call(self, operation, make_call, retries=None, usage=lambda result: (0, 0)):
+        """
+        Awaits make_call() under the provider's limits and returns its result.
+
+        Args:
+            operation (str): The name the call is counted under.
+            make_call (Callable[[], Awaitable]): Starts one attempt of the call.
+            retries (int): Overrides the provider's max_retries for this call.
+            usage (Callable): Returns the (input, output) token counts of a result.
+        """
+        retries = self.max_retries if retries is None else retries
+        attempt = 0
+        start = time.perf_counter()
+        while True:
+            try:
+                async with self._slots():
+                    result = await asyncio.wait_for(make_call(), self.timeout)
+            except Exception:
+                if attempt >= retries:
+                    self.stats.record(operation, time.perf_counter() - start, error=True, retries=attempt)
+                    raise
+                await asyncio.sleep(self.backoff * (2 ** attempt) * (1 + random.random() * 0.1))
+                attempt += 1
+                continue
+            input_tokens, output_tokens = usage(result)
+            self.stats.record(operation, time.perf_counter() - start, retries=attempt,
+                              input_tokens=input_tokens, output_tokens=output_tokens)
+            return result
+
+
+class AnthropicProvider(Provider):
+    """
+    Claude text completions and vision-agent image scoring. The async client
+    (with its HTTP connection pool) and the vision-agent model are created
+    once and reused by every event.
+    """
+
+    name = "anthropic"
+
+    def __init__(self, **limits):
+        super().__init__(**limits)
+        from anthropic import AsyncAnthropic
+
+        # The SDK retries are disabled: call() retries every provider call the same way
+        self.client = AsyncAnthropic(api_key=os.getenv("ANTHROPIC_API_KEY"), timeout=self.timeout, max_retries=0)
+        self._lmms = {}
+        self._lmm_lock = threading.Lock()
+
+    def lmm(self, model=None):
+        """Returns the vision-agent model of the given name (its default when None), created once."""
+        with self._lmm_lock:
+            if model not in self._lmms:
+                from vision_agent.lmm import AnthropicLMM
+
+                self._lmms[model] = AnthropicLMM(model_name=model) if model else AnthropicLMM()
+            return self._lmms[model]
+
+    async def complete(self, prompt, model, max_tokens=1000):
+        """Returns the model's text answer to a single user message."""
+        response = await self.call(
+            "complete",
+            lambda: self.client.messages.create(model=model, messages=[{"role": "user", "content": prompt}],
+                                                max_tokens=max_tokens),
+            usage=lambda response: (response.usage.input_tokens, response.usage.output_tokens),
+        )
+        return response.content[0].text
+
+    async def score_image(self, prompt, image_path, model=None):
+        """
+        Returns the vision agent's raw answer to a prompt about an image. The
+        vision-agent client is synchronous, so it runs in a worker thread.
+        """
+        return await self.call("score_image", lambda: asyncio.to_thread(self.lmm(model), prompt, media=[image_path]))
+
+
+class MockProvider(Provider):
+    """
+    Deterministic local provider for tests and offline runs: completions echo
+    the prompt and image scores are derived from the hash of the prompt and
+    the image content. Token counts are word counts.
+
+    Args:
+        latency (float): Simulated seconds per call.
+    """
+
+    name = "mock"
+
+    def __init__(self, latency=0.0, **limits):
+        super().__init__(**limits)
+        self.latency = latency
+
+    async def _answer(self, text):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return text
+
+    async def complete(self, prompt, model, max_tokens=1000):
+        text = " ".join(prompt.split()[-max_tokens:])
+        return await self.call("complete", lambda: self._answer(text),
+                               usage=lambda result: (len(prompt.split()), len(result.split())))
+
+    async def score_image(self, prompt, image_path, model=None):
+        digest = hashlib.blake2b(prompt.encode("utf-8"), digest_size=8)
+        with open(image_path, "rb") as f:
+            digest.update(f.read())
+        score = int.from_bytes(digest.digest(), "little") % 101
+        return await self.call("score_image", lambda: self._answer(str(score)))
+
+
+PROVIDERS = {"anthropic": AnthropicProvider, "mock": MockProvider}
+_providers = {}
+
+def get_provider(name=None):
+    """
+    Returns the shared provider registered under the given name, by default
+    the one selected by the VISION_PROVIDER environment variable ("anthropic"
+    or "mock"), created on first use.
+    """
+    name = name or PROVIDER
+    if name not in _providers:
+        if name not in PROVIDERS:
+            raise ValueError(f"Unknown provider: {name}")
+        _providers[name] = PROVIDERS[name]()
+    return _providers[name]
+
+def provider_stats():
+    """Returns the call counters of every provider created in this process."""
+    return {name: provider.stats.snapshot() for name, provider in _providers.items()}